@@ -36,10 +36,39 @@ GTP_COL_MAP = {
     'Q': 15, 'R': 16, 'S': 17, 'T': 18
 }
 
+# 每個交叉點的機械臂 (X, Y) 座標表，以 [行索引, 列索引] 存取；
+# 有 src/robot_controller.py 產生的機械臂校準檔 (實測點擬合、可修正棋盤歪斜) 時使用其座標表，否則使用均勻格點
+ROBOT_CALIBRATION_FILE_NAME = "robot_calibration.npz"
+ROBOT_CALIBRATION_FORMAT_VERSION = 1 # 必須與 src/robot_controller.py 的 ROBOT_CALIBRATION_FORMAT_VERSION 相同
+
+
+def _load_board_table():
+    rows, cols = np.mgrid[0:19, 0:19]
+    table = np.stack([ROBOT_BOARD_ORIGIN_X_MM + cols * CELL_SIZE_MM, ROBOT_BOARD_ORIGIN_Y_MM + rows * CELL_SIZE_MM], axis=-1)
+    if os.path.exists(ROBOT_CALIBRATION_FILE_NAME):
+        try:
+            with np.load(ROBOT_CALIBRATION_FILE_NAME) as bundle:
+                version = int(bundle['version'])
+                if version != ROBOT_CALIBRATION_FORMAT_VERSION:
+                    write_log(f"機械臂校準檔 '{ROBOT_CALIBRATION_FILE_NAME}' 的版本 {version} 不相容 "
+                              f"(目前為 {ROBOT_CALIBRATION_FORMAT_VERSION})，改用均勻格點。")
+                elif bundle['table'].shape != table.shape:
+                    write_log(f"機械臂校準檔 '{ROBOT_CALIBRATION_FILE_NAME}' 的座標表大小 {bundle['table'].shape} 不正確，改用均勻格點。")
+                else:
+                    table = bundle['table']
+        except Exception as e:
+            write_log(f"讀取機械臂校準檔 '{ROBOT_CALIBRATION_FILE_NAME}' 時發生錯誤: {e}，改用均勻格點。")
+    return {f"{col_char}{row + 1}": (float(table[row, col, 0]), float(table[row, col, 1]))
+            for col_char, col in GTP_COL_MAP.items() for row in range(19)}
+
+
+GTP_VERTEX_COORDS = _load_board_table()
+
+
 def gtp_to_robot_coords(gtp_move):
     """
     將 GTP 座標 (例如 "D4", "Q16") 轉換為機械臂的物理 (X, Y) 座標。
-    假設棋盤 A1 點是機械臂的參考原點，X軸向右，Y軸向上。
+    直接查詢啟動時建立的座標表 (GTP_VERTEX_COORDS)，不在每次呼叫時解析字串或寫日誌。
 
     Args:
         gtp_move (str): GTP 格式的落子座標，例如 "D4" 或 "Q16"。
@@ -48,44 +77,10 @@ def gtp_to_robot_coords(gtp_move):
         tuple: (robot_x_mm, robot_y_mm) 該位置在機械臂工作空間中的物理座標。
                如果輸入無效，返回 None。
     """
-    gtp_move = gtp_move.strip().upper()
-
-    if len(gtp_move) < 2 or len(gtp_move) > 3:
-        write_log(f"錯誤: 無效的 GTP 座標格式: {gtp_move} (長度不符)")
-        return None
-
-    col_char = gtp_move[0]
-    row_num_str = gtp_move[1:]
-
-    if col_char not in GTP_COL_MAP:
-        write_log(f"錯誤: 無效的 GTP 列字母: {col_char} (不在 A-T 範圍或為 I)")
-        return None
-
-    try:
-        row_num = int(row_num_str)
-        if not (1 <= row_num <= 19):
-            write_log(f"錯誤: 無效的 GTP 行號: {row_num_str} (必須在 1-19 之間)")
-            return None
-    except ValueError:
-        write_log(f"錯誤: GTP 行號格式錯誤: {row_num_str} (非數字)")
-        return None
-
-    # 將 GTP 字母轉換為 0-18 的列索引
-    col_index = GTP_COL_MAP[col_char]
-    
-    # 將 GTP 行號轉換為 0-18 的行索引 (GTP 1 對應索引 0，GTP 19 對應索引 18)
-    row_index = row_num - 1 
-
-    # 計算機械臂的 X 座標
-    # 從 A1 原點開始，向右移動 col_index * CELL_SIZE_MM
-    robot_x_mm = ROBOT_BOARD_ORIGIN_X_MM + (col_index * CELL_SIZE_MM)
-
-    # 計算機械臂的 Y 座標
-    # 從 A1 原點開始，向上移動 row_index * CELL_SIZE_MM
-    robot_y_mm = ROBOT_BOARD_ORIGIN_Y_MM + (row_index * CELL_SIZE_MM)
-
-    write_log(f"GTP 座標 {gtp_move} (列索引: {col_index}, 行索引: {row_index}) 轉換為機械臂座標: (X={robot_x_mm:.2f}mm, Y={robot_y_mm:.2f}mm)")
-    return (robot_x_mm, robot_y_mm)
+    coords = GTP_VERTEX_COORDS.get(gtp_move.strip().upper())
+    if coords is None:
+        write_log(f"錯誤: 無效的 GTP 座標: {gtp_move} (列字母須為 A-T 且不含 I，行號須為 1-19)")
+    return coords
 
 
 class KataGoGTP:
@@ -1,28 +1,215 @@
 # _shared_utils.py
+import atexit
 import datetime
 import os
+import queue
+import sys
+import threading
+import time
 
 LOG_FILE_PATH = "katago_debug_log.txt" # 日誌檔路徑，可以根據需要調整
 
-def write_log(message):
-    """將偵錯訊息寫入日誌檔並列印到控制台"""
-    timestamp = datetime.datetime.now().strftime("[%Y-%m-%d %H:%M:%S.%f]")[:-3] # 精確到毫秒
-    log_message = f"{timestamp} {message}"
-    
-    # 初始化時清空日誌檔，但只在首次寫入時執行
-    if not hasattr(write_log, 'file_initialized'):
-        if os.path.exists(LOG_FILE_PATH):
-            os.remove(LOG_FILE_PATH)
-            print(f"舊的日誌檔 '{LOG_FILE_PATH}' 已清除。")
-        write_log.file_initialized = True # 設定標誌，避免重複清除
-
-    with open(LOG_FILE_PATH, "a", encoding="utf-8") as f:
-        f.write(f"{log_message}\n")
-    print(log_message) # 同時列印到控制台，方便實時觀察
+# --- 日誌等級 ---
+DEBUG = 10 # 每行 GTP 輸出、每幀影像等高頻訊息
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+# 寫入日誌檔與列印到控制台的最低等級，可用環境變數調整；每幀影像和每行 GTP 輸出等 DEBUG 訊息
+# 預設不寫入日誌檔，需要時以 KATAGO_LOG_LEVEL=10 開啟
+LOG_LEVEL = int(os.getenv("KATAGO_LOG_LEVEL", str(INFO)))
+CONSOLE_LOG_LEVEL = int(os.getenv("KATAGO_CONSOLE_LOG_LEVEL", str(INFO)))
+
+LOG_FLUSH_INTERVAL = 0.2 # 背景線程批次寫入的最長間隔 (秒)
+LOG_BATCH_SIZE = 500 # 單次批次最多寫入的訊息數
+LOG_REPEAT_INTERVAL = 1.0 # 相同訊息在此間隔內只記錄一次，其餘計數後彙總 (秒)
+LOG_MAX_BYTES = 5 * 1024 * 1024 # 日誌檔超過此大小時輪替
+LOG_BACKUP_COUNT = 3 # 保留的舊日誌檔數量 (katago_debug_log.txt.1 ~ .3)
+
+
+class _AsyncLogWriter:
+    """
+    以佇列和背景線程處理日誌：呼叫端只負責加上時間戳並放入佇列，
+    檔案寫入、flush、控制台列印和輪替都在背景線程中批次完成，不會阻塞影像或 GTP 路徑。
+    """
+    def __init__(self, path):
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._file_initialized = False
+        self._start_lock = threading.Lock()
+        self._repeat_lock = threading.Lock()
+        self._repeat_state = {} # message -> [上次記錄時間, 被抑制的次數, 等級]
+
+    def submit(self, message, level):
+        if level < LOG_LEVEL and level < CONSOLE_LOG_LEVEL:
+            return
+        now = time.time()
+        suppressed = self._check_repeat(message, level, now)
+        if suppressed is None:
+            return
+        self._ensure_started()
+        timestamp = self._timestamp(now)
+        if suppressed:
+            message = f"{message} (前 {LOG_REPEAT_INTERVAL:.0f} 秒內重複 {suppressed} 次已省略)"
+        self._queue.put((timestamp, level, message))
+
+    @staticmethod
+    def _timestamp(now):
+        return datetime.datetime.fromtimestamp(now).strftime("[%Y-%m-%d %H:%M:%S.%f")[:-3] + "]" # 精確到毫秒
+
+    def _check_repeat(self, message, level, now):
+        """限制重複訊息的頻率；返回 None 表示本次應省略，否則返回先前被省略的次數"""
+        with self._repeat_lock:
+            state = self._repeat_state.get(message)
+            if state is not None and now - state[0] < LOG_REPEAT_INTERVAL:
+                state[1] += 1
+                return None
+            suppressed = state[1] if state is not None else 0
+            if len(self._repeat_state) > 1000:
+                self._repeat_state = {key: value for key, value in self._repeat_state.items() if value[1]}
+            self._repeat_state[message] = [now, 0, level]
+            return suppressed
+
+    def _take_suppressed(self, now, force=False):
+        """
+        取出已超過重複間隔、之後沒有再出現的訊息的省略次數 (force=True 時取出全部)，
+        返回彙總用的 (時間戳, 等級, 訊息) 列表，避免省略次數因訊息不再出現而遺失。
+        """
+        summaries = []
+        with self._repeat_lock:
+            for message, state in self._repeat_state.items():
+                if state[1] and (force or now - state[0] >= LOG_REPEAT_INTERVAL):
+                    summaries.append((self._timestamp(now), state[2], f"{message} (之後重複 {state[1]} 次已省略)"))
+                    state[1] = 0
+        return summaries
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            # 首次寫入時清除舊的日誌檔；每個背景線程擁有自己的檔案把手，結束時自行關閉
+            if not self._file_initialized:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                    print(f"舊的日誌檔 '{self.path}' 已清除。")
+                self._file_initialized = True
+                atexit.register(self.close)
+            log_file = open(self.path, "a", encoding="utf-8")
+            self._thread = threading.Thread(target=self._run, args=(log_file,), name="AsyncLogWriter", daemon=True)
+            self._thread.start()
+
+    def _run(self, log_file):
+        try:
+            self._write_loop(log_file)
+        finally:
+            # 只有背景線程真正結束時才關閉檔案 (close() 等待超時時不會關閉仍在寫入的檔案)
+            self._close_file(log_file)
+
+    def _write_loop(self, log_file):
+        while True:
+            try:
+                item = self._queue.get(timeout=LOG_REPEAT_INTERVAL)
+            except queue.Empty:
+                # 閒置時定期寫出被省略訊息的次數
+                log_file = self._write_batch(self._take_suppressed(time.time()), log_file)
+                continue
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+            stop = False
+            while len(batch) < LOG_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            log_file = self._write_batch(batch + self._take_suppressed(time.time()), log_file)
+            if stop:
+                break
+
+    def _write_batch(self, batch, log_file):
+        """寫出一批訊息，返回之後使用的檔案 (輪替後為新的檔案)"""
+        file_lines = []
+        console_lines = []
+        for timestamp, level, message in batch:
+            tag = "" if level == INFO else f" [{LEVEL_NAMES.get(level, level)}]"
+            line = f"{timestamp}{tag} {message}"
+            if level >= LOG_LEVEL:
+                file_lines.append(line)
+            if level >= CONSOLE_LOG_LEVEL:
+                console_lines.append(line)
+        try:
+            if file_lines:
+                log_file.write("\n".join(file_lines) + "\n")
+                log_file.flush()
+                if log_file.tell() > LOG_MAX_BYTES:
+                    log_file = self._rotate(log_file)
+            if console_lines:
+                print("\n".join(console_lines)) # 同時列印到控制台，方便實時觀察
+        except Exception as e:
+            sys.stderr.write(f"日誌寫入失敗: {e}\n")
+        return log_file
+
+    def _rotate(self, log_file):
+        log_file.close()
+        for index in range(LOG_BACKUP_COUNT - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        return open(self.path, "a", encoding="utf-8")
+
+    @staticmethod
+    def _close_file(log_file):
+        try:
+            log_file.close()
+        except Exception as e:
+            sys.stderr.write(f"關閉日誌檔失敗: {e}\n")
+
+    def close(self):
+        """寫出佇列中剩餘的訊息，背景線程結束時關閉檔案 (程式結束時自動呼叫)"""
+        if self._thread is None:
+            return
+        for item in self._take_suppressed(time.time(), force=True):
+            self._queue.put(item)
+        self._queue.put(None)
+        thread, self._thread = self._thread, None
+        thread.join(timeout=5)
+        if thread.is_alive():
+            # 背景線程寫完剩餘的批次後會自行關閉檔案；之後的訊息由新的背景線程寫入
+            sys.stderr.write("日誌背景線程未在 5 秒內結束，剩餘的訊息將在背景寫出。\n")
+
+
+_log_writer = _AsyncLogWriter(LOG_FILE_PATH)
+
+
+def write_log(message, level=INFO):
+    """將偵錯訊息放入背景日誌佇列，由背景線程寫入日誌檔並列印到控制台"""
+    _log_writer.submit(message, level)
+
+
+def flush_log():
+    """等待目前佇列中的日誌全部寫出 (之後的 write_log 會重新啟動背景線程)"""
+    _log_writer.close()
+
 
 # 將日誌初始化邏輯移到這裡，確保只執行一次
 if __name__ == "__main__":
     # 這個區塊在直接運行 _shared_utils.py 時會執行
     # 測試日誌功能
     write_log("_shared_utils.py 已初始化。")
-    write_log("這是一條測試日誌訊息。")
\ No newline at end of file
+    write_log("這是一條測試日誌訊息。")
+    for _ in range(1000):
+        write_log("這是一條重複的測試日誌訊息。", DEBUG)
+    flush_log()
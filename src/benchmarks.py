@@ -0,0 +1,999 @@
+# benchmarks.py
+# 效能基準測試工具，使用假引擎 (fake_katago.py) 而不需要真正的 KataGo 模型。
+# 用法 (在 src 目錄下執行):
+#   python benchmarks.py gtp [--commands 500]
+#   python benchmarks.py gtp-replay [--moves 200]
+#   python benchmarks.py gtp-failover [--moves 200] [--load-time 3]
+#   python benchmarks.py gtp-server [--tables 4] [--turns 30] [--think-time 0.1]
+#   python benchmarks.py vision [--frames 200]
+#   python benchmarks.py vision-gating [--frames 300]
+#   python benchmarks.py vision-occlusion [--stability-frames 5]
+#   python benchmarks.py vision-rectify [--frames 200]
+#   python benchmarks.py vision-autocal [--runs 20]
+#   python benchmarks.py vision-calibration-load [--runs 20]
+#   python benchmarks.py vision-preview [--frames 300]
+#   python benchmarks.py vision-headless [--seconds 3]
+#   python benchmarks.py robot-async [--moves 5]
+#   python benchmarks.py robot-prefetch [--moves 5] [--think-time 0.4]
+#   python benchmarks.py robot-trajectory [--moves 200]
+#   python benchmarks.py robot-captures [--rounds 50] [--capacity 4]
+#   python benchmarks.py robot-coords [--lookups 100000]
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+from _shared_utils import write_log
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_KATAGO_PATH = os.path.join(SRC_DIR, "fake_katago.py")
+
+# play 指令往返延遲目標 (毫秒)：事件喚醒後應遠低於舊輪詢迴圈的 10 ms + 50 ms select 逾時
+GTP_PLAY_LATENCY_TARGET_MS = 2.0
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _create_fake_katago_client():
+    from katago_gtp import KataGoGTP
+    # 假引擎不讀取模型與配置，只需要路徑存在
+    client = KataGoGTP(katago_path=FAKE_KATAGO_PATH, model_path=FAKE_KATAGO_PATH, config_path=FAKE_KATAGO_PATH)
+    client.start_katago()
+    return client
+
+
+def benchmark_gtp(num_commands):
+    """量測 play 指令在假引擎上的往返延遲"""
+    client = _create_fake_katago_client()
+    try:
+        client.send_command("boardsize 19")
+        client.send_command("clear_board")
+
+        latencies_ms = []
+        columns = "ABCDEFGHJKLMNOPQRST"
+        for i in range(num_commands):
+            if i % 361 == 0:
+                client.send_command("clear_board")
+            vertex = f"{columns[i % 19]}{(i // 19) % 19 + 1}"
+            start = time.perf_counter()
+            response = client.send_command(f"play B {vertex}")
+            latencies_ms.append((time.perf_counter() - start) * 1000)
+            if response is None:
+                write_log(f"基準測試錯誤: 'play B {vertex}' 沒有回應。")
+                return False
+    finally:
+        client.stop_katago()
+
+    p50 = _percentile(latencies_ms, 50)
+    p95 = _percentile(latencies_ms, 95)
+    write_log(f"[Benchmark] GTP play 往返延遲 ({num_commands} 次): "
+              f"平均 {statistics.mean(latencies_ms):.3f} ms, p50 {p50:.3f} ms, "
+              f"p95 {p95:.3f} ms, 最大 {max(latencies_ms):.3f} ms")
+    passed = p50 <= GTP_PLAY_LATENCY_TARGET_MS
+    write_log(f"[Benchmark] 目標 p50 <= {GTP_PLAY_LATENCY_TARGET_MS} ms: {'通過' if passed else '未達成'}")
+    return passed
+
+
+def _sample_game_moves(num_moves):
+    """產生不重複的 (color, vertex) 序列，模擬恢復中的棋局"""
+    columns = "ABCDEFGHJKLMNOPQRST"
+    moves = []
+    for i in range(min(num_moves, 361)):
+        color = "B" if i % 2 == 0 else "W"
+        moves.append((color, f"{columns[i % 19]}{i // 19 + 1}"))
+    return moves
+
+
+def benchmark_gtp_replay(num_moves):
+    """比較逐一送出 play 與管線化重播整盤棋的耗時"""
+    moves = _sample_game_moves(num_moves)
+    client = _create_fake_katago_client()
+    try:
+        client.send_command("boardsize 19")
+        client.send_command("clear_board")
+        start = time.perf_counter()
+        for color, vertex in moves:
+            if client.send_command(f"play {color} {vertex}") is None:
+                write_log(f"基準測試錯誤: 'play {color} {vertex}' 沒有回應。")
+                return False
+        sequential_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        ok = client.replay_moves(moves)
+        pipelined_ms = (time.perf_counter() - start) * 1000
+    finally:
+        client.stop_katago()
+
+    write_log(f"[Benchmark] 重播 {len(moves)} 手棋: 逐一送出 {sequential_ms:.1f} ms, "
+              f"管線化 {pipelined_ms:.1f} ms (加速 {sequential_ms / pipelined_ms:.1f} 倍)")
+    return ok
+
+
+def benchmark_gtp_failover(num_moves, load_time):
+    """模擬 KataGo 崩潰，量測熱備援切換 (含重播棋局) 與冷啟動的恢復時間"""
+    from katago_pool import KataGoPool
+    os.environ["FAKE_KATAGO_STARTUP_DELAY"] = str(load_time) # 假引擎模擬模型載入時間
+    pool = KataGoPool(katago_path=FAKE_KATAGO_PATH, model_path=FAKE_KATAGO_PATH, config_path=FAKE_KATAGO_PATH)
+    try:
+        if not pool.start_katago():
+            return False
+        cold_start_ms = pool.active.startup_timing_ms["total"]
+        pool.send_commands(f"play {color} {vertex}" for color, vertex in _sample_game_moves(num_moves))
+        pool._standby_thread.join() # 確保備用進程已預熱
+
+        pool.active.process.kill()
+        pool.active.process.wait()
+        start = time.perf_counter()
+        response = pool.send_command("genmove W")
+        recovery_ms = (time.perf_counter() - start) * 1000
+    finally:
+        pool.stop_katago()
+
+    write_log(f"[Benchmark] KataGo 崩潰恢復 ({len(pool.game.moves)} 手棋): 熱備援 {recovery_ms:.1f} ms "
+              f"(重播切換 {pool.last_failover_ms:.1f} ms)，冷啟動 {cold_start_ms:.1f} ms")
+    return response is not None and recovery_ms < 1000
+
+
+def benchmark_gtp_server(num_tables, num_turns, think_time):
+    """
+    多台棋桌共用一個 (假) KataGo 分析引擎：量測每手的往返時間與各棋桌之間的公平性。
+    每個 genmove 查詢搜尋 think_time 秒；各棋桌的查詢應同時進行，總耗時接近單一棋桌而不是棋桌數的倍數。
+    """
+    from katago_server import KataGoEngineServer, KataGoRemoteGTP
+    os.environ["FAKE_KATAGO_GENMOVE_DELAY"] = str(think_time) # 假引擎模擬每個查詢的搜尋時間
+    server = KataGoEngineServer("127.0.0.1", 0, FAKE_KATAGO_PATH, FAKE_KATAGO_PATH, FAKE_KATAGO_PATH)
+    if not server.start():
+        return False
+    address = f"{server.address[0]}:{server.address[1]}"
+    table_latencies = [[] for _ in range(num_tables)]
+    failures = []
+
+    def play_table(index):
+        client = KataGoRemoteGTP(address)
+        if not client.start_katago():
+            failures.append(index)
+            return
+        client.send_commands(["boardsize 19", "clear_board"])
+        columns = "ABCDEFGHJKLMNOPQRST"
+        for turn in range(num_turns):
+            # 每台棋桌下不同的位置，確保各盤棋的記錄互不影響
+            vertex = f"{columns[(index * 3 + turn) % 19]}{turn % 17 + 1}"
+            start = time.perf_counter()
+            responses = client.send_commands([f"play B {vertex}", "genmove W"])
+            table_latencies[index].append((time.perf_counter() - start) * 1000)
+            if any(client.parse_response(r)['status'] != 'success' for r in responses):
+                failures.append(index)
+                break
+        client.stop_katago()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=play_table, args=(i,)) for i in range(num_tables)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total_s = time.perf_counter() - start
+    server.stop()
+
+    averages = [statistics.mean(latencies) for latencies in table_latencies if latencies]
+    serialized_s = num_tables * num_turns * think_time
+    write_log(f"[Benchmark] {num_tables} 台棋桌共用一個引擎，各 {num_turns} 回合: 總耗時 {total_s:.2f} 秒 "
+              f"(依序執行至少 {serialized_s:.2f} 秒)，最多同時 {server.peak_genmoves_in_flight} 個 genmove，"
+              f"各棋桌平均每回合 {', '.join(f'{avg:.1f}' for avg in averages)} ms")
+    return not failures and (num_tables == 1 or total_s < serialized_s)
+
+
+def _synthetic_board_frames(num_stones):
+    """產生 1280x720 的合成空棋盤模板、網格地圖，以及擺了黑白子的畫面與其正確答案"""
+    import cv2
+    import numpy as np
+    from vision_system import GTP_COLUMNS
+
+    rng = np.random.default_rng(0)
+    template = np.full((720, 1280, 3), 170, dtype=np.uint8)
+    template += rng.integers(0, 10, template.shape, dtype=np.uint8)
+    xs = np.linspace(300, 980, 19).astype(np.int32)
+    ys = np.linspace(680, 40, 19).astype(np.int32) # row 0 (第 1 線) 在畫面下方
+    grid_map = np.zeros((19, 19, 2), dtype=np.int32)
+    grid_map[..., 0] = xs[np.newaxis, :]
+    grid_map[..., 1] = ys[:, np.newaxis]
+    for x in xs:
+        cv2.line(template, (int(x), int(ys[0])), (int(x), int(ys[-1])), (60, 60, 60), 1)
+    for y in ys:
+        cv2.line(template, (int(xs[0]), int(y)), (int(xs[-1]), int(y)), (60, 60, 60), 1)
+
+    frame = template.copy()
+    expected = {}
+    for index in rng.choice(361, size=num_stones, replace=False):
+        row, col = divmod(int(index), 19)
+        color = "B" if len(expected) % 2 == 0 else "W"
+        cv2.circle(frame, tuple(int(v) for v in grid_map[row, col]), 15,
+                   (20, 20, 20) if color == "B" else (245, 245, 245), -1)
+        expected[f"{GTP_COLUMNS[col]}{row + 1}"] = color
+    return template, grid_map, frame, expected
+
+
+def _legacy_detect_stones(vision, frame):
+    """舊版 _detect_stones：逐點切 ROI 並呼叫 np.mean，且每幀重新轉換模板的灰度"""
+    import cv2
+    import numpy as np
+    board_state = {}
+    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    gray_template = cv2.cvtColor(vision.empty_board_template, cv2.COLOR_BGR2GRAY)
+    radius = vision.stone_detection_roi_radius
+    for row in range(19):
+        for col in range(19):
+            x, y = tuple(vision.grid_map[row, col])
+            roi_frame = gray_frame[max(0, y - radius):min(gray_frame.shape[0], y + radius),
+                                   max(0, x - radius):min(gray_frame.shape[1], x + radius)]
+            roi_template = gray_template[max(0, y - radius):min(gray_frame.shape[0], y + radius),
+                                         max(0, x - radius):min(gray_frame.shape[1], x + radius)]
+            if roi_frame.size == 0 or roi_template.size == 0:
+                continue
+            difference = np.mean(roi_frame) - np.mean(roi_template)
+            if difference < vision.black_stone_diff:
+                board_state[f"{'ABCDEFGHJKLMNOPQRST'[col]}{row + 1}"] = "B"
+            elif difference > vision.white_stone_diff:
+                board_state[f"{'ABCDEFGHJKLMNOPQRST'[col]}{row + 1}"] = "W"
+    return board_state
+
+
+def _detect_board_state(vision, frame):
+    """以 VisionSystem 的向量化分類 (不經過變化閘門與穩定性過濾) 偵測一幀，返回 {'D4': 'B', ...}"""
+    from vision_system import board_array_to_state
+    board = vision._classify_stones(frame)
+    return board_array_to_state(board) if board is not None else {}
+
+
+def _legacy_draw_stone_detections(vision, frame, board_state):
+    """舊版預覽畫面：每幀逐一畫出所有棋子的標記"""
+    from vision_system import gtp_to_index
+    for vertex, stone_color in board_state.items():
+        row, col = gtp_to_index(vertex)
+        vision._draw_stone_marker(frame, tuple(vision.grid_map[row, col]), stone_color)
+
+
+def _create_offline_vision_system(template, grid_map):
+    """不開攝影機、不建立滑桿的 VisionSystem，使用合成的模板與網格地圖和預設閾值"""
+    from vision_system import VisionSystem
+    vision = VisionSystem(headless=True)
+    vision.grid_map = grid_map
+    vision.empty_board_template = template
+    vision.stone_detection_roi_radius = 10
+    vision.black_stone_diff = -30
+    vision.white_stone_diff = 30
+    return vision
+
+
+def benchmark_vision(num_frames):
+    """比較逐點迴圈與積分影像向量化的棋子偵測每幀耗時 (合成畫面，不需要攝影機)"""
+    template, grid_map, frame, expected = _synthetic_board_frames(num_stones=120)
+    vision = _create_offline_vision_system(template, grid_map)
+
+    results = {}
+    for name, detect in (("逐點迴圈", lambda f: _legacy_detect_stones(vision, f)),
+                         ("向量化", lambda f: _detect_board_state(vision, f))):
+        board_state = detect(frame) # 預熱 (向量化版本在此建立 ROI 快取)
+        if board_state != expected:
+            write_log(f"基準測試錯誤: {name} 偵測結果與預期不符。")
+            return False
+        timings_ms = []
+        for _ in range(num_frames):
+            start = time.perf_counter()
+            detect(frame)
+            timings_ms.append((time.perf_counter() - start) * 1000)
+        results[name] = timings_ms
+        write_log(f"[Benchmark] 棋子偵測 {name} ({num_frames} 幀): 平均 {statistics.mean(timings_ms):.3f} ms, "
+                  f"p50 {_percentile(timings_ms, 50):.3f} ms, p95 {_percentile(timings_ms, 95):.3f} ms")
+
+    legacy_p50, vectorized_p50 = (_percentile(results[name], 50) for name in ("逐點迴圈", "向量化"))
+    write_log(f"[Benchmark] 向量化偵測加速 {legacy_p50 / vectorized_p50:.1f} 倍，兩者結果一致 ({len(expected)} 顆棋子)。")
+    return vectorized_p50 < legacy_p50
+
+
+def benchmark_vision_gating(num_frames):
+    """靜止畫面 (含感光雜訊) 中途落下一子：比較每幀完整分類與畫面變化閘門的耗時和跳過比例"""
+    import cv2
+    import numpy as np
+    from vision_system import board_array_to_state
+    template, grid_map, frame, expected = _synthetic_board_frames(num_stones=60)
+    rng = np.random.default_rng(1)
+    noise = [rng.integers(-2, 3, frame.shape).astype(np.int16) for _ in range(8)]
+
+    # 第 num_frames // 2 幀時在 K10 (row 9, col 9) 附近落下一顆黑子
+    moved = frame.copy()
+    if "K10" not in expected:
+        cv2.circle(moved, tuple(int(v) for v in grid_map[9, 9]), 15, (20, 20, 20), -1)
+    frames = [np.clip((frame if i < num_frames // 2 else moved) + noise[i % len(noise)], 0, 255).astype(np.uint8)
+              for i in range(num_frames)]
+
+    results = {}
+    for gated in (False, True):
+        vision = _create_offline_vision_system(template, grid_map)
+        timings_ms = []
+        for current in frames:
+            start = time.perf_counter()
+            board = vision._classify_stones(current, gated=gated)
+            timings_ms.append((time.perf_counter() - start) * 1000)
+        results[gated] = (timings_ms, board_array_to_state(board), vision.detection_stats())
+
+    (full_ms, full_state, _), (gated_ms, gated_state, stats) = results[False], results[True]
+    write_log(f"[Benchmark] 每幀完整分類 ({num_frames} 幀): 平均 {statistics.mean(full_ms):.3f} ms")
+    write_log(f"[Benchmark] 畫面變化閘門 ({num_frames} 幀): 平均 {statistics.mean(gated_ms):.3f} ms，"
+              f"跳過分類 {stats['skip_ratio']:.1%}，平均每幀重新分類 {stats['points_per_frame']:.1f} 個交叉點")
+    consistent = full_state == gated_state and full_state.get("K10") == expected.get("K10", "B")
+    write_log(f"[Benchmark] 最後一幀兩者的偵測結果{'一致' if consistent else '不一致'} ({len(gated_state)} 顆棋子)。")
+    return consistent and stats["skip_ratio"] > 0.9
+
+
+def benchmark_vision_occlusion(stability_frames):
+    """
+    手伸到棋盤上方並在 K10 落子後離開：檢查遮擋期間沒有誤判，
+    並量測手離開後到 K10 穩定出現需要的幀數 (應固定為 stability_frames)。
+    """
+    import cv2
+    import numpy as np
+    from vision_system import BLACK
+    template, grid_map, frame, expected = _synthetic_board_frames(num_stones=60)
+    expected.pop("K10", None)
+    cv2.circle(frame, tuple(int(v) for v in grid_map[9, 9]), 16, (170, 170, 170), -1) # 確保 K10 是空點
+    placed = frame.copy()
+    cv2.circle(placed, tuple(int(v) for v in grid_map[9, 9]), 15, (20, 20, 20), -1)
+    occluded = placed.copy()
+    hand_center = tuple(int(v) for v in grid_map[8, 10])
+    cv2.ellipse(occluded, hand_center, (90, 140), 30, 0, 360, (110, 140, 190), -1) # 手掌
+    cv2.rectangle(occluded, (hand_center[0] - 60, hand_center[1]), (hand_center[0] + 60, 719), (110, 140, 190), -1) # 手臂
+
+    vision = _create_offline_vision_system(template, grid_map)
+    vision.stability_frames = stability_frames
+    rng = np.random.default_rng(2)
+    sequence = [frame] * 20 + [occluded] * 30 + [placed] * (stability_frames + 10)
+    hand_leaves = 50
+    false_changes = 0
+    latency_frames = None
+    occlusion_times_ms = []
+    for index, image in enumerate(sequence):
+        noisy = np.clip(image + rng.integers(-2, 3, image.shape), 0, 255).astype(np.uint8)
+        start = time.perf_counter()
+        vision._process_frame(noisy)
+        if vision.occluded:
+            occlusion_times_ms.append((time.perf_counter() - start) * 1000)
+        stable_k10 = vision.stable_board[9, 9]
+        if 20 <= index < hand_leaves and stable_k10 == BLACK:
+            false_changes += 1
+        if index >= hand_leaves and latency_frames is None and stable_k10 == BLACK:
+            latency_frames = index - hand_leaves + 1
+
+    stats = vision.detection_stats()
+    write_log(f"[Benchmark] 遮擋偵測：{stats['occluded']} / 30 幀被判定為遮擋並略過 "
+              f"(平均 {statistics.mean(occlusion_times_ms) if occlusion_times_ms else 0:.3f} ms/幀)，遮擋期間誤判 {false_changes} 幀")
+    write_log(f"[Benchmark] 手離開後 {latency_frames} 幀 K10 穩定出現 (stability_frames = {stability_frames})")
+    return stats["occluded"] == 30 and false_changes == 0 and latency_frames == stability_frames
+
+
+def _tilted_board_frames(num_stones):
+    """
+    以正視棋盤影像透視投影到 1280x720 畫面，模擬傾斜的攝影機。
+    返回 (模板, 有棋子的畫面, 正確答案, 四個角落交叉點, 所有交叉點的畫面座標)。
+    """
+    import cv2
+    import numpy as np
+    from vision_system import GTP_COLUMNS, rectified_grid
+
+    size = 600
+    grid = rectified_grid(19, size)
+    board = np.full((size, size, 3), (90, 170, 210), dtype=np.uint8) # 木紋色棋盤
+    for index in range(19):
+        cv2.line(board, tuple(int(v) for v in grid[0, index]), tuple(int(v) for v in grid[18, index]), (40, 40, 40), 2)
+        cv2.line(board, tuple(int(v) for v in grid[index, 0]), tuple(int(v) for v in grid[index, 18]), (40, 40, 40), 2)
+    stones = board.copy()
+    rng = np.random.default_rng(3)
+    expected = {}
+    for index in rng.choice(361, size=num_stones, replace=False):
+        row, col = divmod(int(index), 19)
+        color = "B" if len(expected) % 2 == 0 else "W"
+        cv2.circle(stones, tuple(int(v) for v in grid[row, col]), 14, (20, 20, 20) if color == "B" else (245, 245, 245), -1)
+        expected[f"{GTP_COLUMNS[col]}{row + 1}"] = color
+
+    # 棋盤影像四角 -> 畫面中傾斜的四邊形 (遠端較窄)
+    source = np.float32([[0, 0], [size, 0], [size, size], [0, size]])
+    target = np.float32([[470, 60], [860, 75], [1060, 690], [250, 660]])
+    to_frame = cv2.getPerspectiveTransform(source, target)
+    warp = lambda image: cv2.warpPerspective(image, to_frame, (1280, 720), borderValue=(70, 70, 70))
+    points = cv2.perspectiveTransform(grid.reshape(-1, 1, 2), to_frame).reshape(19, 19, 2)
+    corners = [points[0, 0], points[0, 18], points[18, 18], points[18, 0]]
+    return warp(board), warp(stones), expected, corners, points
+
+
+def benchmark_vision_rectify(num_frames):
+    """傾斜攝影機：比較軸對齊的 38 點網格與四角點透視校正的偵測正確率，以及校正後每幀的耗時"""
+    import numpy as np
+    template, frame, expected, corners, points = _tilted_board_frames(num_stones=100)
+
+    results = {}
+    for mode in ("manual_grid", "manual_corners"):
+        vision = _create_offline_vision_system(template, None)
+        if mode == "manual_grid":
+            # 與手動校準相同：先點最底層水平線的 19 點，再點最左側垂直線的 19 點
+            clicks = [tuple(int(v) for v in points[0, col]) for col in range(19)] + \
+                     [tuple(int(v) for v in points[row, 0]) for row in range(19)]
+            vision.grid_map = vision._create_grid_map(clicks)
+        else:
+            vision.set_board_corners(corners)
+        detected = _detect_board_state(vision, frame)
+        correct = sum(detected.get(vertex) == color for vertex, color in expected.items())
+        false_positive = sum(vertex not in expected for vertex in detected)
+        timings_ms = []
+        for _ in range(num_frames):
+            start = time.perf_counter()
+            vision._classify_stones(frame)
+            timings_ms.append((time.perf_counter() - start) * 1000)
+        results[mode] = (correct, false_positive)
+        write_log(f"[Benchmark] {'軸對齊網格' if mode == 'manual_grid' else '透視校正'}: 正確偵測 {correct}/{len(expected)} 顆，"
+                  f"誤判 {false_positive} 處，每幀 p50 {_percentile(timings_ms, 50):.3f} ms")
+    return results["manual_corners"] == (len(expected), 0)
+
+
+def benchmark_vision_autocal(runs):
+    """
+    自動網格校準：傾斜攝影機下由 Hough 直線找出角點的耗時、殘差與角點誤差，
+    以及攝影機漂移後背景重新校準，偵測正確率恢復且不清除穩定性歷史。
+    """
+    import cv2
+    import numpy as np
+    from grid_calibration import find_board_corners
+    template, frame, expected, corners, _ = _tilted_board_frames(num_stones=100)
+
+    for name, image in (("空棋盤", template), (f"{len(expected)} 顆棋子", frame)):
+        results = [find_board_corners(image, seed=run) for run in range(runs)]
+        if any(result is None for result in results):
+            write_log(f"基準測試錯誤: {name}自動校準失敗。")
+            return False
+        corner_error = max(np.max(np.hypot(*(np.float32(result['corners']) - np.float32(corners)).T)) for result in results)
+        write_log(f"[Benchmark] 自動校準 ({name}): {runs} 次，耗時 p50 {_percentile([r['elapsed_ms'] for r in results], 50):.1f} ms，"
+                  f"殘差最大 {max(r['residual_px'] for r in results):.2f} px，角點誤差最大 {corner_error:.2f} px")
+
+    def accuracy(vision, image):
+        detected = _detect_board_state(vision, image)
+        return sum(detected.get(vertex) == color for vertex, color in expected.items()), \
+            sum(vertex not in expected for vertex in detected)
+
+    vision = _create_offline_vision_system(template, None)
+    vision.auto_calibrate(template) # 開局前在空棋盤上校準
+    correct, false_positive = accuracy(vision, frame)
+    write_log(f"[Benchmark] 以自動校準偵測: 正確 {correct}/{len(expected)} 顆，誤判 {false_positive} 處")
+    calibrated_ok = (correct, false_positive) == (len(expected), 0)
+
+    # 攝影機在遊戲中漂移 (平移 8, -6 像素)；空棋盤模板仍是漂移前拍攝的
+    drifted = cv2.warpAffine(frame, np.float32([[1, 0, 8], [0, 1, -6]]), (frame.shape[1], frame.shape[0]),
+                             borderValue=(70, 70, 70))
+    vision._process_frame(drifted)
+    roi_key = vision._roi_cache_key
+    before = accuracy(vision, drifted)
+    with vision._frame_lock: # 模擬擷取線程送出漂移後的畫面
+        vision._latest_frame = drifted
+        vision.frame_seq += 1
+    start = time.perf_counter()
+    vision.start_background_calibration()
+    vision._calibration_thread.join()
+    vision._apply_pending_calibration()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    vision._process_frame(drifted)
+    after = accuracy(vision, drifted)
+    history_kept = vision._roi_cache_key is roi_key
+    write_log(f"[Benchmark] 攝影機漂移: 重新校準前正確 {before[0]}/{len(expected)} 顆、誤判 {before[1]} 處；"
+              f"背景重新校準 {elapsed_ms:.1f} ms 後正確 {after[0]}/{len(expected)} 顆、誤判 {after[1]} 處，"
+              f"穩定性歷史{'保留' if history_kept else '被清除'}")
+    return calibrated_ok and after == (len(expected), 0) and history_kept
+
+
+def benchmark_vision_calibration_load(runs):
+    """
+    啟動時載入校準：舊格式 (JSON 網格地圖 + 完整模板影像) 與 .npz 校準檔 (模板以 mmap 開啟) 的比較，
+    計時包含建立 VisionSystem 與第一幀偵測 (建立 ROI 快取)。在暫存目錄中執行，不影響 src 下的校準檔。
+    """
+    import json
+    import tempfile
+    import numpy as np
+    import vision_system
+    template, frame, expected, corners, _ = _tilted_board_frames(num_stones=100)
+    original_dir = os.getcwd()
+
+    def load_and_detect():
+        start = time.perf_counter()
+        vision = vision_system.VisionSystem(headless=True)
+        detected = _detect_board_state(vision, frame)
+        return (time.perf_counter() - start) * 1000, vision, detected
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            np.save(vision_system.EMPTY_BOARD_TEMPLATE_FILE, template)
+            setup = _create_offline_vision_system(template, None)
+            setup.set_board_corners(corners)
+            with open(vision_system.PARAM_FILE_NAME, "w") as f: # 舊格式：網格地圖以巢狀 JSON 串列保存
+                json.dump({'black_stone_diff': -30, 'white_stone_diff': 30, 'stability_frames': 5,
+                           '_saved_grid_map': setup.grid_map.tolist(), 'board_corners': setup.board_corners.tolist()},
+                          f, indent=4)
+            legacy_json_kb = os.path.getsize(vision_system.PARAM_FILE_NAME) / 1024
+            legacy_ms = [load_and_detect()[0] for _ in range(runs)]
+            _, vision, legacy_detected = load_and_detect()
+
+            vision._save_parameters()
+            bundle_kb = os.path.getsize(vision_system.CALIBRATION_FILE_NAME) / 1024
+            json_kb = os.path.getsize(vision_system.PARAM_FILE_NAME) / 1024
+            bundle_ms = [load_and_detect()[0] for _ in range(runs)]
+            _, vision, bundle_detected = load_and_detect()
+            template_read = vision._rectified_template is not None
+        finally:
+            os.chdir(original_dir)
+
+    template_kb = template.nbytes / 1024
+    write_log(f"[Benchmark] 舊格式: 參數檔 {legacy_json_kb:.1f} KB + 完整模板 {template_kb:.0f} KB，"
+              f"載入到第一幀偵測 p50 {_percentile(legacy_ms, 50):.1f} ms")
+    write_log(f"[Benchmark] 校準檔: {bundle_kb:.1f} KB + 參數檔 {json_kb:.1f} KB，載入到第一幀偵測 p50 {_percentile(bundle_ms, 50):.1f} ms，"
+              f"完整模板{'被讀取' if template_read else '未被讀取'}")
+    same = legacy_detected == bundle_detected == expected
+    write_log(f"[Benchmark] 兩種格式的偵測結果{'一致且正確' if same else '不一致'} ({len(expected)} 顆棋子)")
+    return same and not template_read
+
+
+def benchmark_vision_preview(num_frames):
+    """
+    預覽畫面每幀的繪製耗時：舊版每幀複製整幀並重畫 361 個網格點、所有網格線和棋子標記，
+    新版以快取圖層遮罩複製，只重繪有變化的棋子。每隔 10 幀多一顆棋子，並逐幀比對兩者畫面是否相同。
+    """
+    import numpy as np
+    from vision_system import EMPTY, BLACK, WHITE, board_array_to_state
+    template, grid_map, frame, expected = _synthetic_board_frames(num_stones=120)
+    vision = _create_offline_vision_system(template, grid_map)
+    vision.stone_detection_roi_radius = 15
+
+    rng = np.random.default_rng(2)
+    order = rng.permutation(361)
+    boards = []
+    board = np.full((19, 19), EMPTY, dtype=np.int8)
+    for i in range(num_frames):
+        if i % 10 == 0:
+            row, col = divmod(int(order[(i // 10) % 361]), 19)
+            board = board.copy()
+            board[row, col] = BLACK if (i // 10) % 2 == 0 else WHITE
+        boards.append(board)
+
+    legacy_ms, cached_ms = [], []
+    mismatched = 0
+    work = np.empty_like(frame)
+    for board in boards:
+        start = time.perf_counter()
+        legacy = frame.copy()
+        vision._draw_grid_map(legacy)
+        _legacy_draw_stone_detections(vision, legacy, board_array_to_state(board))
+        legacy_ms.append((time.perf_counter() - start) * 1000)
+
+        np.copyto(work, frame) # 相當於擷取線程寫入的工作緩衝，不計時
+        vision.stable_board = board
+        start = time.perf_counter()
+        rendered = vision._render_preview(work)
+        cached_ms.append((time.perf_counter() - start) * 1000)
+        mismatched += not np.array_equal(legacy, rendered)
+
+    for name, timings_ms in (("每幀重畫", legacy_ms), ("快取圖層", cached_ms)):
+        write_log(f"[Benchmark] 預覽繪製 {name} ({num_frames} 幀): 平均 {statistics.mean(timings_ms):.3f} ms, "
+                  f"p50 {_percentile(timings_ms, 50):.3f} ms, p95 {_percentile(timings_ms, 95):.3f} ms")
+    write_log(f"[Benchmark] 快取圖層加速 {_percentile(legacy_ms, 50) / _percentile(cached_ms, 50):.1f} 倍，"
+              f"與舊版畫面不同的幀數 {mismatched}/{num_frames}")
+    return mismatched == 0 and _percentile(cached_ms, 50) < _percentile(legacy_ms, 50)
+
+
+class _SyntheticCapture:
+    """模擬以固定幀率送出畫面的攝影機，介面與 cv2.VideoCapture 的 read / isOpened / release 相同"""
+    def __init__(self, frame, fps):
+        self.frame = frame
+        self.interval = 1.0 / fps
+        self._next = time.perf_counter()
+
+    def read(self, out=None):
+        self._next += self.interval
+        time.sleep(max(0.0, self._next - time.perf_counter()))
+        if out is None or out.shape != self.frame.shape:
+            return True, self.frame.copy()
+        out[...] = self.frame
+        return True, out
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+
+def benchmark_vision_headless(seconds):
+    """
+    無顯示器模式下從擷取到偵測完成的延遲：舊的遊戲迴圈每次偵測後固定睡 10 ms 再輪詢，
+    新的迴圈等待擷取線程通知新幀後立即偵測。整個過程不會呼叫任何 HighGUI 函式
+    (本環境的 OpenCV 沒有 GUI 支援，呼叫會拋出例外)。
+    """
+    template, grid_map, frame, expected = _synthetic_board_frames(num_stones=120)
+    results = {}
+    for mode in ("輪詢 10 ms", "新幀通知"):
+        vision = _create_offline_vision_system(template, grid_map)
+        vision.cap = _SyntheticCapture(frame, fps=30)
+        vision._start_capture_thread()
+        vision._first_frame.wait(1.0)
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            vision.get_board_state()
+            if mode == "輪詢 10 ms":
+                time.sleep(0.01)
+            else:
+                vision.wait_for_new_frame(0.1)
+        metrics = vision.metrics()
+        vision.stop_camera()
+        results[mode] = metrics
+        write_log(f"[Benchmark] {mode}: 偵測 {metrics['detection']['frames']} 幀 / 擷取 {metrics['capture']['frames']} 幀，"
+                  f"擷取到偵測延遲 p50 {metrics['latency_ms']['p50']:.2f} ms, p95 {metrics['latency_ms']['p95']:.2f} ms，"
+                  f"穩定棋子 {metrics['stones']}/{len(expected)} 顆")
+    polled, notified = results["輪詢 10 ms"], results["新幀通知"]
+    return notified["stones"] == len(expected) and notified["latency_ms"]["p50"] < polled["latency_ms"]["p50"]
+
+
+def benchmark_robot_async(num_moves):
+    """
+    機械臂吸取 + 放置期間主線程能做多少事：同步呼叫會阻塞整個動作，
+    非阻塞佇列只在提交時花費微秒級時間，主線程可以繼續處理畫面 (以每 30 ms 一幀模擬)。
+    另外檢查動作失敗時，佇列中後續的動作會被取消。
+    """
+    import robot_controller
+    from robot_controller import RobotArmController
+    # 縮短模擬的動作時間，讓基準測試在幾秒內完成
+    robot_controller.SIMULATION_TIME_SCALE = 0.1
+    robot = RobotArmController()
+
+    blocked_ms = {"同步": [], "非阻塞": []}
+    frames = {"同步": 0, "非阻塞": 0}
+    for _ in range(num_moves):
+        start = time.perf_counter()
+        robot.pick_stone("W")
+        robot.place_stone(200.0, 200.0)
+        blocked_ms["同步"].append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        robot.pick_stone_async("W")
+        placement = robot.place_stone_async(200.0, 200.0)
+        blocked_ms["非阻塞"].append((time.perf_counter() - start) * 1000)
+        while not placement.wait(0.03):
+            frames["非阻塞"] += 1 # 主線程在等待期間處理一幀畫面
+
+    for mode, timings_ms in blocked_ms.items():
+        write_log(f"[Benchmark] {mode}吸取 + 放置 ({num_moves} 手): 主線程每手阻塞 p50 {_percentile(timings_ms, 50):.2f} ms，"
+                  f"動作期間處理畫面 {frames[mode]} 幀")
+    stats = robot.motion_stats()
+    write_log(f"[Benchmark] 動作計時: " + "，".join(f"{kind} {s['count']} 次平均 {s['avg_ms']:.0f} ms" for kind, s in stats.items()))
+
+    def failing_move(*args):
+        raise RuntimeError("模擬的伺服錯誤")
+    gate = threading.Event() # 先佔住執行線程，確保失敗的吸取與後續的放置都已在佇列中
+    robot.submit_motion("hold", [(gate.wait, (5,))])
+    failed = robot.submit_motion("pick W", [(failing_move, ())])
+    cancelled = robot.place_stone_async(200.0, 200.0)
+    gate.set()
+    cancelled.wait(5)
+    write_log(f"[Benchmark] 吸取失敗後的放置動作{'已取消' if not cancelled.ok else '仍然執行 (錯誤)'}: {cancelled.error}")
+    robot.stop_motion_worker()
+
+    return (not failed.ok and not cancelled.ok and stats["pick"]["count"] == 2 * num_moves
+            and _percentile(blocked_ms["非阻塞"], 50) < 5 and frames["非阻塞"] > 0)
+
+
+def benchmark_robot_prefetch(num_moves, think_time):
+    """
+    機械臂回合的牆鐘時間 (從送出 genmove 到棋子放好)：依序 思考 -> 吸取 -> 放置，
+    與思考期間預先吸取白子並在棋盤中心上方等待的比較。思考以固定的 think_time 模擬。
+    """
+    import robot_controller
+    from robot_controller import RobotArmController
+    robot_controller.SIMULATION_TIME_SCALE = 0.2
+    robot = RobotArmController()
+
+    turn_s = {"依序": [], "預先取子": []}
+    prefetch_s = []
+    for _ in range(num_moves):
+        for mode in turn_s:
+            robot.position = (robot.X_WHITE_CONTAINER, robot.Y_WHITE_CONTAINER, robot.Z_SAFE_RETRACT)
+            start = time.perf_counter()
+            prefetch = robot.prefetch_stone_async("W") if mode == "預先取子" else None
+            time.sleep(think_time) # genmove
+            if prefetch is None:
+                placement = robot.pick_and_place_async("W", 330.0, 280.0)
+            else:
+                placement = robot.place_stone_async(330.0, 280.0)
+            placement.wait()
+            turn_s[mode].append(placement.finished_at - start)
+            if prefetch is not None:
+                prefetch_s.append(prefetch.run_ms / 1000)
+    robot.stop_motion_worker()
+
+    for mode, timings in turn_s.items():
+        write_log(f"[Benchmark] {mode} ({num_moves} 手，思考 {think_time:.2f} 秒): 每手平均 {statistics.mean(timings):.3f} 秒")
+    saving = statistics.mean(turn_s["依序"]) - statistics.mean(turn_s["預先取子"])
+    write_log(f"[Benchmark] 預先取子平均每手節省 {saving:.3f} 秒 (預先取子動作 {statistics.mean(prefetch_s):.2f} 秒，"
+              f"模擬時間倍數 {robot_controller.SIMULATION_TIME_SCALE})")
+    return saving > 0.5 * min(think_time, statistics.mean(prefetch_s))
+
+
+def benchmark_robot_trajectory(num_moves):
+    """
+    以運動學模型 (不需要機械臂) 比較每手的運動時間：舊版吸取與放置各自執行、每個路徑點都完全停止並回到安全高度，
+    新版把吸取 + 放置規劃成一條混合軌跡。另外比較連續夾取三顆相鄰棋子時，低空跨越取代回到安全高度的效果。
+    """
+    import numpy as np
+    from motion_planner import Task, DEFAULT_BLEND_RADIUS, DEFAULT_SKIP_RETRACT_DISTANCE
+    from robot_controller import RobotArmController, CELL_SIZE_MM, ROBOT_BOARD_ORIGIN_X_MM, ROBOT_BOARD_ORIGIN_Y_MM
+    robot = RobotArmController()
+    rng = np.random.default_rng(3)
+    home = (robot.X_WHITE_CONTAINER, robot.Y_WHITE_CONTAINER, robot.Z_SAFE_RETRACT)
+
+    def point(row, col):
+        return ROBOT_BOARD_ORIGIN_X_MM + col * CELL_SIZE_MM, ROBOT_BOARD_ORIGIN_Y_MM + row * CELL_SIZE_MM
+
+    def configure(blended):
+        robot.blend_radius = DEFAULT_BLEND_RADIUS if blended else 0.0
+        robot.skip_retract_distance = DEFAULT_SKIP_RETRACT_DISTANCE if blended else 0.0
+
+    per_move = {"逐點停止": [], "混合軌跡": []}
+    stops = {"逐點停止": 0, "混合軌跡": 0}
+    plan_ms = []
+    for _ in range(num_moves):
+        x, y = point(*rng.integers(0, 19, 2))
+        pick, place = robot._pick_task("W"), Task(x, y, robot.Z_PLACEMENT, "release")
+        configure(False)
+        pick_path, pick_s = robot.plan([pick], start=home)
+        place_path, place_s = robot.plan([place], start=(pick_path[-1].x, pick_path[-1].y, pick_path[-1].z))
+        per_move["逐點停止"].append(pick_s + place_s)
+        stops["逐點停止"] += sum(w.blend <= 0 for w in pick_path + place_path)
+        configure(True)
+        start = time.perf_counter()
+        path, total_s = robot.plan([pick, place], start=home)
+        plan_ms.append((time.perf_counter() - start) * 1000)
+        per_move["混合軌跡"].append(total_s)
+        stops["混合軌跡"] += sum(w.blend <= 0 for w in path)
+
+    for mode, timings in per_move.items():
+        write_log(f"[Benchmark] 吸取 + 放置 {mode} ({num_moves} 手): 每手平均 {statistics.mean(timings):.3f} 秒，"
+                  f"平均停止 {stops[mode] / num_moves:.1f} 次")
+    write_log(f"[Benchmark] 規劃一條軌跡 p50 {_percentile(plan_ms, 50):.3f} ms")
+
+    # 連續夾取 K10、L10、L11 三顆棋子後放回棋子盒
+    cluster = [Task(*point(9, 9), robot.Z_PLACEMENT, "grip"), Task(*point(9, 10), robot.Z_PLACEMENT, "grip"),
+               Task(*point(10, 10), robot.Z_PLACEMENT, "grip"), Task(home[0], home[1], robot.Z_SAFE_RETRACT, "release")]
+    cluster_s = {}
+    for mode, blended in (("逐點停止", False), ("混合軌跡", True)):
+        configure(blended)
+        cluster_s[mode] = robot.plan(cluster, start=home)[1]
+    write_log(f"[Benchmark] 連續夾取三顆相鄰棋子: 逐點停止 {cluster_s['逐點停止']:.3f} 秒，"
+              f"混合軌跡 + 低空跨越 {cluster_s['混合軌跡']:.3f} 秒")
+    return (statistics.mean(per_move["混合軌跡"]) < statistics.mean(per_move["逐點停止"])
+            and cluster_s["混合軌跡"] < cluster_s["逐點停止"])
+
+
+def benchmark_robot_captures(num_rounds, capacity):
+    """
+    以運動學模型比較移除棋子的運動時間：舊版依提子順序逐顆往返棋子盒，
+    新版以最近鄰法 + 2-opt 規劃繞行順序，並依夾具容量分批放回。包含隨機的提子群與整盤清空 (約 200 顆)。
+    """
+    import numpy as np
+    from motion_planner import Task
+    from robot_controller import RobotArmController, CELL_SIZE_MM, ROBOT_BOARD_ORIGIN_X_MM, ROBOT_BOARD_ORIGIN_Y_MM
+    robot = RobotArmController()
+    rng = np.random.default_rng(5)
+    home = (robot.X_BLACK_CONTAINER, robot.Y_BLACK_CONTAINER, robot.Z_SAFE_RETRACT)
+
+    def point(row, col):
+        return ROBOT_BOARD_ORIGIN_X_MM + col * CELL_SIZE_MM, ROBOT_BOARD_ORIGIN_Y_MM + row * CELL_SIZE_MM
+
+    def one_by_one(points):
+        tasks = []
+        for x, y in points:
+            tasks += [Task(x, y, robot.Z_PLACEMENT, "grip"), Task(home[0], home[1], robot.Z_SAFE_RETRACT, "release")]
+        return tasks
+
+    def random_group(size):
+        """從隨機一點向相鄰交叉點擴張的提子群，順序打亂 (模擬提子回報的順序)"""
+        group = {tuple(rng.integers(0, 19, 2))}
+        while len(group) < size:
+            row, col = list(group)[rng.integers(len(group))]
+            d_row, d_col = ((0, 1), (1, 0), (0, -1), (-1, 0))[rng.integers(4)]
+            if 0 <= row + d_row < 19 and 0 <= col + d_col < 19:
+                group.add((row + d_row, col + d_col))
+        group = list(group)
+        rng.shuffle(group)
+        return [point(row, col) for row, col in group]
+
+    cases = [("提子群", random_group(int(rng.integers(2, 12)))) for _ in range(num_rounds)]
+    full = [(row, col) for row in range(19) for col in range(19) if rng.random() < 0.55]
+    cases.append(("整盤清空", [point(row, col) for row, col in full]))
+
+    totals = {}
+    plan_ms = []
+    for kind, points in cases:
+        start = time.perf_counter()
+        tasks, batches, _ = robot.removal_tasks(points, "B", capacity)
+        plan_ms.append((time.perf_counter() - start) * 1000)
+        stats = totals.setdefault(kind, {"stones": 0, "逐顆往返": 0.0, "規劃路線": 0.0})
+        stats["stones"] += len(points)
+        stats["逐顆往返"] += robot.plan(one_by_one(points), start=home)[1]
+        stats["規劃路線"] += robot.plan(tasks, start=home)[1]
+    for kind, stats in totals.items():
+        write_log(f"[Benchmark] {kind} ({stats['stones']} 顆，夾具容量 {capacity}): 逐顆往返 {stats['逐顆往返']:.1f} 秒，"
+                  f"規劃路線 {stats['規劃路線']:.1f} 秒")
+    write_log(f"[Benchmark] 規劃移除路線 p50 {_percentile(plan_ms, 50):.2f} ms，整盤清空 ({len(full)} 顆) {plan_ms[-1]:.1f} ms")
+    # 夾具只能持有一顆時每顆都必須往返，路線規劃不會更慢但也沒有節省
+    if capacity <= 1:
+        return all(stats["規劃路線"] <= stats["逐顆往返"] + 1e-6 for stats in totals.values())
+    return all(stats["規劃路線"] < stats["逐顆往返"] for stats in totals.values())
+
+
+def _legacy_gtp_to_robot_coords(gtp_move):
+    """舊版 gtp_to_robot_coords：每次解析並驗證字串、以均勻格點計算座標並寫一行日誌"""
+    from robot_controller import GTP_COL_MAP, CELL_SIZE_MM, ROBOT_BOARD_ORIGIN_X_MM, ROBOT_BOARD_ORIGIN_Y_MM
+    from _shared_utils import DEBUG
+    gtp_move = gtp_move.strip().upper()
+    if len(gtp_move) < 2 or len(gtp_move) > 3 or gtp_move[0] not in GTP_COL_MAP:
+        return None
+    try:
+        row_num = int(gtp_move[1:])
+    except ValueError:
+        return None
+    if not (1 <= row_num <= 19):
+        return None
+    col_index, row_index = GTP_COL_MAP[gtp_move[0]], row_num - 1
+    robot_x_mm = ROBOT_BOARD_ORIGIN_X_MM + (col_index * CELL_SIZE_MM)
+    robot_y_mm = ROBOT_BOARD_ORIGIN_Y_MM + (row_index * CELL_SIZE_MM)
+    # 舊版以 INFO 等級記錄，這裡改用 DEBUG 避免基準測試在控制台輸出大量訊息
+    write_log(f"GTP 座標 {gtp_move} (列索引: {col_index}, 行索引: {row_index}) 轉換為機械臂座標: "
+              f"(X={robot_x_mm:.2f}mm, Y={robot_y_mm:.2f}mm)", DEBUG)
+    return (robot_x_mm, robot_y_mm)
+
+
+def benchmark_robot_coords(num_lookups):
+    """
+    GTP 座標轉機械臂座標：舊版逐次解析 + 寫日誌與查表的每次耗時；
+    以及在歪斜、非正方形的棋盤 (合成) 上，均勻格點與由四個角的實測點擬合的座標表的最大誤差。
+    """
+    import numpy as np
+    import robot_controller
+    from robot_controller import GTP_VERTEX_INDEX, BOARD_SIZE, fit_board_table, uniform_board_table, gtp_to_robot_coords
+    robot_controller.set_board_table(uniform_board_table())
+    rng = np.random.default_rng(9)
+    vertices = list(GTP_VERTEX_INDEX)
+    moves = [vertices[i] for i in rng.integers(0, len(vertices), num_lookups)]
+    per_call_us = {}
+    for name, convert in (("逐次解析 + 日誌", _legacy_gtp_to_robot_coords), ("查表", gtp_to_robot_coords)):
+        start = time.perf_counter()
+        for move in moves:
+            convert(move)
+        per_call_us[name] = (time.perf_counter() - start) / num_lookups * 1e6
+        write_log(f"[Benchmark] {name} ({num_lookups} 次): 每次 {per_call_us[name]:.2f} µs")
+    same = all(_legacy_gtp_to_robot_coords(v) == gtp_to_robot_coords(v) for v in vertices)
+
+    # 合成的實際棋盤：線距 22.0 x 23.7 mm (圍棋盤不是正方形)，相對機械臂旋轉 1.5 度，遠端一邊略微變窄
+    rows, cols = np.mgrid[0:BOARD_SIZE, 0:BOARD_SIZE].astype(np.float64)
+    angle = np.radians(1.5)
+    u = cols * 22.0 * (1 - 0.004 * rows)
+    v = rows * 23.7
+    actual = np.stack([150.0 + u * np.cos(angle) - v * np.sin(angle), 100.0 + u * np.sin(angle) + v * np.cos(angle)], axis=-1)
+    corners = {vertex: tuple(actual[row, col] + rng.normal(0, 0.2, 2))
+               for vertex, (row, col) in GTP_VERTEX_INDEX.items() if vertex in ("A1", "T1", "A19", "T19")}
+    errors = {"均勻格點": uniform_board_table()}
+    for model in ("affine", "bilinear"):
+        errors[model] = fit_board_table(corners, model)[0]
+    for name, table in errors.items():
+        errors[name] = float(np.max(np.linalg.norm(table - actual, axis=2)))
+        write_log(f"[Benchmark] {name}: 最大落點誤差 {errors[name]:.2f} mm")
+    write_log(f"[Benchmark] 查表加速 {per_call_us['逐次解析 + 日誌'] / per_call_us['查表']:.1f} 倍，"
+              f"與舊版均勻格點結果{'一致' if same else '不一致'}。")
+    return same and per_call_us["查表"] < per_call_us["逐次解析 + 日誌"] and errors["bilinear"] < 1.0 < errors["均勻格點"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="KataGo 機械人系統效能基準測試")
+    subparsers = parser.add_subparsers(dest="target", required=True)
+
+    gtp_parser = subparsers.add_parser("gtp", help="GTP 指令往返延遲 (假引擎)")
+    gtp_parser.add_argument("--commands", type=int, default=500)
+
+    replay_parser = subparsers.add_parser("gtp-replay", help="逐一送出與管線化重播整盤棋的比較 (假引擎)")
+    replay_parser.add_argument("--moves", type=int, default=200)
+
+    failover_parser = subparsers.add_parser("gtp-failover", help="崩潰後熱備援切換與冷啟動的恢復時間 (假引擎)")
+    failover_parser.add_argument("--moves", type=int, default=200)
+    failover_parser.add_argument("--load-time", type=float, default=3.0, help="模擬模型載入時間 (秒)")
+
+    server_parser = subparsers.add_parser("gtp-server", help="多棋桌共用引擎服務的吞吐量與公平性 (假引擎)")
+    server_parser.add_argument("--tables", type=int, default=4)
+    server_parser.add_argument("--turns", type=int, default=30)
+    server_parser.add_argument("--think-time", type=float, default=0.1, help="模擬每個 genmove 查詢的搜尋時間 (秒)")
+
+    vision_parser = subparsers.add_parser("vision", help="棋子偵測每幀耗時：逐點迴圈與向量化的比較 (合成畫面)")
+    vision_parser.add_argument("--frames", type=int, default=200)
+
+    gating_parser = subparsers.add_parser("vision-gating", help="靜止畫面跳過分類的比例與每幀耗時 (合成畫面)")
+    gating_parser.add_argument("--frames", type=int, default=300)
+
+    occlusion_parser = subparsers.add_parser("vision-occlusion", help="手遮擋棋盤時略過分類，以及手離開後的偵測延遲 (合成畫面)")
+    occlusion_parser.add_argument("--stability-frames", type=int, default=5)
+
+    rectify_parser = subparsers.add_parser("vision-rectify", help="傾斜攝影機下軸對齊網格與透視校正的正確率和耗時 (合成畫面)")
+    rectify_parser.add_argument("--frames", type=int, default=200)
+
+    autocal_parser = subparsers.add_parser("vision-autocal", help="自動網格校準的耗時、殘差，以及攝影機漂移後的背景重新校準 (合成畫面)")
+    autocal_parser.add_argument("--runs", type=int, default=20)
+
+    load_parser = subparsers.add_parser("vision-calibration-load", help="舊格式 JSON 網格地圖與 .npz 校準檔的啟動載入時間 (合成畫面)")
+    load_parser.add_argument("--runs", type=int, default=20)
+
+    preview_parser = subparsers.add_parser("vision-preview", help="預覽畫面每幀重畫與快取圖層的繪製耗時 (合成畫面)")
+    preview_parser.add_argument("--frames", type=int, default=300)
+
+    headless_parser = subparsers.add_parser("vision-headless", help="無顯示器模式下輪詢與新幀通知的擷取到偵測延遲 (合成畫面)")
+    headless_parser.add_argument("--seconds", type=float, default=3.0)
+
+    robot_async_parser = subparsers.add_parser("robot-async", help="機械臂同步動作與非阻塞動作佇列的主線程阻塞時間 (模擬)")
+    robot_async_parser.add_argument("--moves", type=int, default=5)
+
+    prefetch_parser = subparsers.add_parser("robot-prefetch", help="KataGo 思考期間預先取子節省的機械臂回合時間 (模擬)")
+    prefetch_parser.add_argument("--moves", type=int, default=5)
+    prefetch_parser.add_argument("--think-time", type=float, default=0.4, help="模擬的 genmove 思考時間 (秒)")
+
+    trajectory_parser = subparsers.add_parser("robot-trajectory", help="逐點停止與混合軌跡的每手運動時間 (運動學模型)")
+    trajectory_parser.add_argument("--moves", type=int, default=200)
+
+    captures_parser = subparsers.add_parser("robot-captures", help="逐顆往返與規劃路線 + 分批移除棋子的運動時間 (運動學模型)")
+    captures_parser.add_argument("--rounds", type=int, default=50)
+    captures_parser.add_argument("--capacity", type=int, default=4, help="夾具一次可持有的棋子數")
+
+    coords_parser = subparsers.add_parser("robot-coords", help="GTP 座標轉換的查表耗時，以及歪斜棋盤上擬合座標表的落點誤差 (合成)")
+    coords_parser.add_argument("--lookups", type=int, default=100000)
+
+    args = parser.parse_args()
+    if args.target == "gtp":
+        ok = benchmark_gtp(args.commands)
+    elif args.target == "gtp-replay":
+        ok = benchmark_gtp_replay(args.moves)
+    elif args.target == "gtp-failover":
+        ok = benchmark_gtp_failover(args.moves, args.load_time)
+    elif args.target == "gtp-server":
+        ok = benchmark_gtp_server(args.tables, args.turns, args.think_time)
+    elif args.target == "vision":
+        ok = benchmark_vision(args.frames)
+    elif args.target == "vision-gating":
+        ok = benchmark_vision_gating(args.frames)
+    elif args.target == "vision-occlusion":
+        ok = benchmark_vision_occlusion(args.stability_frames)
+    elif args.target == "vision-rectify":
+        ok = benchmark_vision_rectify(args.frames)
+    elif args.target == "vision-autocal":
+        ok = benchmark_vision_autocal(args.runs)
+    elif args.target == "vision-calibration-load":
+        ok = benchmark_vision_calibration_load(args.runs)
+    elif args.target == "vision-preview":
+        ok = benchmark_vision_preview(args.frames)
+    elif args.target == "vision-headless":
+        ok = benchmark_vision_headless(args.seconds)
+    elif args.target == "robot-async":
+        ok = benchmark_robot_async(args.moves)
+    elif args.target == "robot-prefetch":
+        ok = benchmark_robot_prefetch(args.moves, args.think_time)
+    elif args.target == "robot-trajectory":
+        ok = benchmark_robot_trajectory(args.moves)
+    elif args.target == "robot-captures":
+        ok = benchmark_robot_captures(args.rounds, args.capacity)
+    elif args.target == "robot-coords":
+        ok = benchmark_robot_coords(args.lookups)
+    sys.exit(0 if ok else 1)
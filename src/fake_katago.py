@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# fake_katago.py
+# 模擬 KataGo GTP 行為的假引擎，不需要模型或 GPU。
+# 用於 KataGoGTP 的基準測試和故障模擬：
+#   python benchmarks.py gtp
+# 啟動方式與真正的 KataGo 相同: fake_katago.py gtp -model <任意檔案> -config <任意檔案>
+# 也支援 JSON 分析引擎模式:        fake_katago.py analysis -model <任意檔案> -config <任意檔案>
+#
+# 可用環境變數調整行為:
+#   FAKE_KATAGO_STARTUP_DELAY  模擬模型載入時間 (秒)，預設 0
+#   FAKE_KATAGO_GENMOVE_DELAY  模擬 genmove 思考時間 (秒)，預設 0；分析引擎模式下為每個查詢的搜尋時間，
+#                              多個查詢同時進行 (模擬 KataGo 把並行查詢合併成同一批次評估)
+import json
+import os
+import sys
+import threading
+import time
+
+COLUMNS = "ABCDEFGHJKLMNOPQRST"
+_stdout_lock = threading.Lock()
+
+
+def _write_stdout(text):
+    with _stdout_lock:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+
+def _respond(cmd_id, content="", success=True):
+    prefix = "=" if success else "?"
+    _write_stdout(f"{prefix}{cmd_id} {content}".rstrip() + "\n\n")
+
+
+def _empty_points(board_size, occupied, limit):
+    points = []
+    for row in range(board_size, 0, -1):
+        for col in COLUMNS[:board_size]:
+            if f"{col}{row}" not in occupied:
+                points.append(f"{col}{row}")
+                if len(points) == limit:
+                    return points
+    return points
+
+
+def _analysis_loop(stop_event, interval, candidates, lz_format):
+    """模擬 kata-analyze / lz-analyze：每個 interval 輸出一行 info，直到收到下一個指令"""
+    visits_per_tick = 50
+    tick = 0
+    while not stop_event.wait(interval):
+        tick += 1
+        infos = []
+        for order, move in enumerate(candidates):
+            visits = visits_per_tick * tick // (order + 1)
+            winrate = 0.55 - 0.05 * order
+            if lz_format:
+                infos.append(f"info move {move} visits {visits} winrate {int(winrate * 10000)} "
+                             f"prior {1000 - 100 * order} lcb {int((winrate - 0.01) * 10000)} order {order} pv {move} {candidates[0]}")
+            else:
+                infos.append(f"info move {move} visits {visits} utility {winrate - 0.5:.4f} winrate {winrate:.4f} "
+                             f"scoreMean {1.5 - order:.2f} scoreLead {1.5 - order:.2f} prior {0.1 - 0.01 * order:.4f} "
+                             f"lcb {winrate - 0.01:.4f} order {order} pv {move} {candidates[0]}")
+        _write_stdout(" ".join(infos) + "\n")
+
+
+def _analysis_main(search_delay):
+    """模擬 'katago analysis'：每行一個 JSON 查詢，每個查詢在 search_delay 秒後回覆一行 JSON"""
+    for raw_line in sys.stdin:
+        line = raw_line.strip()
+        if not line:
+            continue
+        try:
+            query = json.loads(line)
+        except json.JSONDecodeError as e:
+            _write_stdout(json.dumps({"error": f"Could not parse json: {e}"}) + "\n")
+            continue
+
+        query_id = query.get("id")
+        action = query.get("action")
+        if action == "query_version":
+            _write_stdout(json.dumps({"id": query_id, "action": action, "version": "1.16.3", "git_hash": "fake"}) + "\n")
+            continue
+        if action == "terminate":
+            _write_stdout(json.dumps({"id": query_id, "action": action, "terminateId": query.get("terminateId")}) + "\n")
+            continue
+
+        board_size = query.get("boardXSize", 19)
+        occupied = {vertex.upper() for _, vertex in query.get("moves", []) if vertex.lower() != "pass"}
+        if len(occupied) != len([m for m in query.get("moves", []) if m[1].lower() != "pass"]):
+            _write_stdout(json.dumps({"id": query_id, "error": "Illegal move"}) + "\n")
+            continue
+        max_visits = query.get("maxVisits", 100)
+        move_infos = []
+        for order, move in enumerate(_empty_points(board_size, occupied, 3) or ["pass"]):
+            move_infos.append({"move": move, "order": order, "visits": max_visits // (order + 1),
+                               "winrate": 0.55 - 0.05 * order, "scoreLead": 1.5 - order,
+                               "prior": 0.1 - 0.01 * order, "pv": [move]})
+        lines = []
+        for turn in query.get("analyzeTurns", [len(query.get("moves", []))]):
+            response = {"id": query_id, "turnNumber": turn, "isDuringSearch": False, "moveInfos": move_infos,
+                        "rootInfo": {"visits": max_visits, "winrate": 0.55, "scoreLead": 1.5}}
+            if query.get("includeOwnership"):
+                response["ownership"] = [0.0] * (board_size * board_size)
+            lines.append(json.dumps(response) + "\n")
+        if search_delay > 0:
+            # 不阻塞讀取下一個查詢，讓多個查詢的搜尋時間互相重疊
+            threading.Timer(search_delay, _write_stdout, args=("".join(lines),)).start()
+        else:
+            _write_stdout("".join(lines))
+
+
+def main():
+    startup_delay = float(os.getenv("FAKE_KATAGO_STARTUP_DELAY", "0"))
+    genmove_delay = float(os.getenv("FAKE_KATAGO_GENMOVE_DELAY", "0"))
+
+    # KataGo 的啟動訊息全部輸出到 stderr (見 docs/debug_summary.md)
+    sys.stderr.write("KataGo v1.16.3 (fake)\n")
+    sys.stderr.write("Loading model and initializing benchmark...\n")
+    sys.stderr.flush()
+    time.sleep(startup_delay)
+    if len(sys.argv) > 1 and sys.argv[1] == "analysis":
+        sys.stderr.write("Started, ready to begin handling requests\n")
+        sys.stderr.flush()
+        _analysis_main(genmove_delay)
+        return
+    sys.stderr.write("GTP ready, beginning main protocol loop\n")
+    sys.stderr.flush()
+
+    board_size = 19
+    occupied = set()
+    analysis_stop = None
+    analysis_thread = None
+
+    for raw_line in sys.stdin:
+        line = raw_line.strip()
+        if not line:
+            continue
+
+        # 任何新指令都會結束進行中的分析，並以空行結束分析輸出
+        if analysis_thread is not None:
+            analysis_stop.set()
+            analysis_thread.join()
+            analysis_thread = None
+            _write_stdout("\n")
+
+        parts = line.split()
+        cmd_id = ""
+        if parts[0].isdigit():
+            cmd_id = parts.pop(0)
+        if not parts:
+            continue
+        name, args = parts[0].lower(), parts[1:]
+
+        if name == "quit":
+            _respond(cmd_id)
+            break
+        elif name == "protocol_version":
+            _respond(cmd_id, "2")
+        elif name == "name":
+            _respond(cmd_id, "KataGo")
+        elif name == "version":
+            _respond(cmd_id, "1.16.3")
+        elif name == "boardsize":
+            board_size = int(args[0]) if args else 19
+            occupied.clear()
+            _respond(cmd_id)
+        elif name == "clear_board":
+            occupied.clear()
+            _respond(cmd_id)
+        elif name == "komi":
+            _respond(cmd_id)
+        elif name == "play":
+            if len(args) < 2:
+                _respond(cmd_id, "syntax error", success=False)
+                continue
+            vertex = args[1].upper()
+            if vertex != "PASS":
+                if vertex in occupied:
+                    _respond(cmd_id, "illegal move", success=False)
+                    continue
+                occupied.add(vertex)
+            _respond(cmd_id)
+        elif name == "stop":
+            _respond(cmd_id)
+        elif name in ("kata-analyze", "lz-analyze"):
+            interval = 1.0
+            if "interval" in args:
+                interval = int(args[args.index("interval") + 1]) / 100
+            elif args and args[-1].isdigit():
+                interval = int(args[-1]) / 100
+            candidates = _empty_points(board_size, occupied, 3)
+            _write_stdout(f"={cmd_id}\n")
+            analysis_stop = threading.Event()
+            analysis_thread = threading.Thread(
+                target=_analysis_loop, args=(analysis_stop, interval, candidates, name == "lz-analyze"), daemon=True)
+            analysis_thread.start()
+        elif name == "genmove":
+            time.sleep(genmove_delay)
+            empty = _empty_points(board_size, occupied, 1)
+            move = empty[0] if empty else "pass"
+            if move != "pass":
+                occupied.add(move)
+            # 與真正的 KataGo 相同，落子結果也會記錄在 stderr 的日誌中
+            sys.stderr.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')}+0800: = {move}\n")
+            sys.stderr.flush()
+            _respond(cmd_id, move)
+        else:
+            _respond(cmd_id, "unknown command", success=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# src/go_rules.py
+# 棋盤表示與圍棋規則的共用工具 (GTP 座標轉換、提子、氣)，只依賴 numpy。
+# vision_system (視覺偵測確認落子) 和 katago_analysis (分析引擎的本地棋局) 都使用這裡的規則，
+# 讓不需要攝影機的模組不必導入 cv2 與 HighGUI。
+import numpy as np
+
+GTP_COLUMNS = "ABCDEFGHJKLMNOPQRST"
+# 棋盤陣列中每個交叉點的狀態 (np.int8)
+EMPTY, BLACK, WHITE = 0, 1, 2
+STONE_NAMES = {BLACK: "B", WHITE: "W"}
+STONE_VALUES = {"B": BLACK, "W": WHITE}
+
+
+def gtp_to_index(vertex):
+    """'D4' -> (row, col)，row 0 為第 1 線"""
+    return int(vertex[1:]) - 1, GTP_COLUMNS.index(vertex[0].upper())
+
+
+def board_state_to_array(board_state, board_dim=19):
+    """把 {'D4': 'B', ...} 字典轉回 (19, 19) 棋盤陣列"""
+    board = np.zeros((board_dim, board_dim), dtype=np.int8)
+    for vertex, color in board_state.items():
+        row, col = gtp_to_index(vertex)
+        board[row, col] = STONE_VALUES[color]
+    return board
+
+
+def board_array_to_state(board):
+    """把 (19, 19) 棋盤陣列轉成 {'D4': 'B', ...} 字典 (row 0 為第 1 線)"""
+    rows, cols = np.nonzero(board)
+    return {f"{GTP_COLUMNS[col]}{row + 1}": STONE_NAMES[board[row, col]] for row, col in zip(rows, cols)}
+
+
+def group_has_liberty(board, row, col, exclude=None, visited=None):
+    """
+    找出 (row, col) 所在的棋串，返回 (group, has_liberty)。
+    exclude 為視為已被佔據的點 (尚未放到 board 上的落子)；visited 會加入棋串中的點，
+    讓呼叫端檢查多個相鄰棋串時不重複走訪同一串。
+    """
+    board_dim = board.shape[0]
+    color = board[row, col]
+    visited = set() if visited is None else visited
+    visited.add((row, col))
+    group, stack, has_liberty = [], [(row, col)], False
+    while stack:
+        r, c = stack.pop()
+        group.append((r, c))
+        for nr, nc in ((r + 1, c), (r - 1, c), (r, c + 1), (r, c - 1)):
+            if not (0 <= nr < board_dim and 0 <= nc < board_dim) or (nr, nc) == exclude:
+                continue
+            if board[nr, nc] == EMPTY:
+                has_liberty = True
+            elif board[nr, nc] == color and (nr, nc) not in visited:
+                visited.add((nr, nc))
+                stack.append((nr, nc))
+    return group, has_liberty
+
+
+def find_captures(board, row, col, color):
+    """
+    在 board 的 (row, col) 放下 color 後會被提掉的對方棋子 (返回 (row, col) 列表)。
+    只檢查與落子相鄰的對方棋串是否失去所有氣，不修改 board。
+    """
+    board_dim = board.shape[0]
+    opponent = WHITE if color == BLACK else BLACK
+    captured = []
+    visited = set()
+    for dr, dc in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+        start = (row + dr, col + dc)
+        if not (0 <= start[0] < board_dim and 0 <= start[1] < board_dim):
+            continue
+        if board[start] != opponent or start in visited:
+            continue
+        group, has_liberty = group_has_liberty(board, start[0], start[1], exclude=(row, col), visited=visited)
+        if not has_liberty:
+            captured.extend(group)
+    return captured
+
+
+def is_suicide(board, row, col, color):
+    """在空點 (row, col) 放下 color 後是否為自殺 (沒有提子且所在棋串沒有氣)，不修改 board"""
+    if find_captures(board, row, col, color):
+        return False
+    board[row, col] = color
+    try:
+        return not group_has_liberty(board, row, col)[1]
+    finally:
+        board[row, col] = EMPTY
@@ -0,0 +1,329 @@
+# src/grid_calibration.py
+# 自動網格校準：Canny + HoughLinesP 找出棋盤線 (與 open_cv.py 的原型相同)，
+# 把線段分成兩個方向，以 RANSAC 找出符合透視下等距模型的 19 + 19 條棋盤線，
+# 再以所有交叉點擬合 homography 算出四個角落交叉點與殘差。
+# 結果交給 VisionSystem.set_board_corners() 建立透視校正與 grid_map，取代 38 次手動點選。
+import time
+import cv2
+import numpy as np
+from _shared_utils import write_log, DEBUG
+
+BOARD_DIM = 19
+
+# 預設參數與 vision_work 的原型相同
+DEFAULT_CANNY_THRESHOLD1 = 100
+DEFAULT_CANNY_THRESHOLD2 = 200
+DEFAULT_HOUGH_THRESHOLD = 15
+DEFAULT_HOUGH_MIN_LINE_LENGTH = 50
+DEFAULT_HOUGH_MAX_LINE_GAP = 20
+DEFAULT_RANSAC_ITERATIONS = 500
+DEFAULT_RANSAC_LINE_TOLERANCE = 5 # 線的位置與等距模型的最大誤差 (像素)
+DEFAULT_RANSAC_MIN_INLIERS_RATIO = 0.7 # 19 條線中至少要找到的比例
+
+LINE_KERNEL_SIZE = 9 # 棋盤線寬度的上限 (像素)，須小於棋子直徑
+FAMILY_ANGLE_TOLERANCE = np.deg2rad(35) # 透視下同一方向的棋盤線會收斂，允許的角度偏差
+VANISHING_ITERATIONS = 5
+VANISHING_ANGLE_SCALE = 0.02 # 線段方向與消失點方向的夾角 (弧度) 超過此值時權重迅速下降
+MIN_LINE_SPACING = 8 # 相鄰棋盤線的最小間距 (像素)
+RELATIVE_LINE_TOLERANCE = 0.15 # 容許誤差相對於線間距的比例 (棋盤外框在半格處，不會被當成棋盤線)
+GROWTH_LINE_TOLERANCE = 0.3 # RANSAC 延伸模型時使用的較寬比例
+MERGE_SPACING_RATIO = 0.35 # 合併同一條線的線段時，最大距離相對於估計線間距的比例
+MIN_PROJECTIVE_LINES = 6 # 至少幾條線才擬合射影模型的透視項
+REFINE_ITERATIONS = 5
+GROWTH_REACH = (2, 4, 8, 18) # RANSAC 每個假設從樣本向兩側延伸的線數
+MAX_RESIDUAL_PX = 3.0 # 交叉點殘差超過此值視為校準失敗
+
+
+def _cross2(a, b):
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def _detect_segments(gray, canny_threshold1, canny_threshold2, hough_threshold, min_line_length, max_line_gap):
+    # 黑帽運算只保留比核心細的暗線，棋子 (大面積的黑白圓) 和棋盤外的背景被抑制，不會產生干擾線段
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (LINE_KERNEL_SIZE, LINE_KERNEL_SIZE))
+    lines_only = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, kernel)
+    blurred = cv2.GaussianBlur(lines_only, (5, 5), 0)
+    edges = cv2.Canny(blurred, canny_threshold1, canny_threshold2)
+    segments = cv2.HoughLinesP(edges, 1, np.pi / 180, hough_threshold,
+                               minLineLength=min_line_length, maxLineGap=max_line_gap)
+    if segments is None:
+        return np.empty((0, 4))
+    return segments.reshape(-1, 4).astype(np.float64)
+
+
+def _split_families(segments):
+    """以 k-means 把線段依方向分成兩組 (角度加倍後在單位圓上分群，0° 與 180° 視為相同)"""
+    direction = segments[:, 2:] - segments[:, :2]
+    angle = np.arctan2(direction[:, 1], direction[:, 0]) % np.pi
+    doubled = np.stack([np.cos(2 * angle), np.sin(2 * angle)], axis=1).astype(np.float32)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 50, 1e-4)
+    _, labels, centers = cv2.kmeans(doubled, 2, None, criteria, 5, cv2.KMEANS_PP_CENTERS)
+    families = []
+    for index in range(2):
+        center_angle = (np.arctan2(centers[index, 1], centers[index, 0]) / 2) % np.pi
+        delta = np.abs((angle - center_angle + np.pi / 2) % np.pi - np.pi / 2)
+        members = (labels.ravel() == index) & (delta < FAMILY_ANGLE_TOLERANCE)
+        families.append((center_angle, segments[members]))
+    return families
+
+
+def _vanishing_point(segments, center, scale):
+    """
+    以加權最小平方法 (IRLS，Cauchy 權重) 求出一組線段的消失點，座標以 center / scale 正規化。
+    返回齊次座標 (x, y, w)，幾乎平行時 w 接近 0 (消失點在無窮遠)。
+    """
+    start = np.column_stack([(segments[:, :2] - center) / scale, np.ones(len(segments))])
+    end = np.column_stack([(segments[:, 2:] - center) / scale, np.ones(len(segments))])
+    lines = np.cross(start, end)
+    lines /= np.linalg.norm(lines[:, :2], axis=1, keepdims=True)
+    direction = (end - start)[:, :2]
+    direction /= np.linalg.norm(direction, axis=1, keepdims=True)
+    midpoints = (start[:, :2] + end[:, :2]) / 2
+    weights = np.hypot(*(segments[:, 2:] - segments[:, :2]).T)
+    vanishing = None
+    for _ in range(VANISHING_ITERATIONS):
+        _, _, vt = np.linalg.svd(lines * weights[:, np.newaxis])
+        vanishing = vt[-1]
+        # 殘差：線段方向與「中點指向消失點」方向夾角的正弦
+        toward = vanishing[:2] - vanishing[2] * midpoints
+        sine = np.abs(_cross2(direction, toward)) / np.maximum(np.linalg.norm(toward, axis=1), 1e-9)
+        weights = np.hypot(*(segments[:, 2:] - segments[:, :2]).T) / (1 + (sine / VANISHING_ANGLE_SCALE) ** 2)
+    return vanishing
+
+
+def _family_offsets(segments, family_angle, center, vertical):
+    """
+    每條線段與「通過棋盤中心、垂直於這組線」的橫截線的交點位置。
+    短線段自身的方向誤差在遠處會被放大，因此改用中點與這組線的消失點決定的直線：
+    透視下同一組線收斂於消失點，橫截線上的交點仍然依序排列。
+    """
+    u_family = np.array([np.cos(family_angle), np.sin(family_angle)])
+    normal = np.array([-u_family[1], u_family[0]])
+    # 直線組由左到右、橫線組由上到下排序
+    if (vertical and normal[0] < 0) or (not vertical and normal[1] < 0):
+        normal = -normal
+    scale = float(np.max(np.abs(segments - np.tile(center, 2)))) or 1.0
+    vanishing = _vanishing_point(segments, center, scale)
+    midpoints = ((segments[:, :2] + segments[:, 2:]) / 2 - center) / scale
+    direction = vanishing[:2] - vanishing[2] * midpoints
+    offsets = _cross2(midpoints, direction) / _cross2(np.broadcast_to(normal, direction.shape), direction)
+    return offsets * scale
+
+
+def _merge_candidates(offsets, segments, tolerance):
+    """
+    位置相近的線段 (例如一條粗線兩側的邊緣) 合併成一條候選線，以長度加權。
+    透視下近端的線較粗，兩側邊緣的距離可能超過 tolerance，合併距離按估計的線間距放寬。
+    """
+    order = np.argsort(offsets)
+    gaps = np.diff(offsets[order])
+    gaps = gaps[gaps > tolerance]
+    if gaps.size:
+        tolerance = max(tolerance, MERGE_SPACING_RATIO * float(np.median(gaps)))
+    lengths = np.hypot(*(segments[:, 2:] - segments[:, :2]).T)
+    groups = []
+    for index in order:
+        if groups and offsets[index] - offsets[groups[-1][0]] <= tolerance:
+            groups[-1].append(index)
+        else:
+            groups.append([index])
+    positions = np.array([np.average(offsets[members], weights=lengths[members]) for members in groups])
+    return positions, groups
+
+
+def _projective(model, k):
+    """一維射影模型 p(k) = (a + b k) / (1 + c k)；等距的棋盤線經過透視投影後正好符合此模型"""
+    a, b, c = model
+    denominator = 1 + c * k
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 1e-3, (a + b * k) / denominator, np.nan)
+
+
+def _fit_projective(ks, positions):
+    # p (1 + c k) = a + b k  =>  a + b k - c k p = p
+    # 線數太少時透視項 c 對雜訊非常敏感，先以等距模型 (c = 0) 擬合
+    if len(ks) < MIN_PROJECTIVE_LINES:
+        (a, b), *_ = np.linalg.lstsq(np.stack([np.ones_like(positions), ks], axis=1), positions, rcond=None)
+        return np.array([a, b, 0.0])
+    design = np.stack([np.ones_like(positions), ks, -ks * positions], axis=1)
+    model, *_ = np.linalg.lstsq(design, positions, rcond=None)
+    return model
+
+
+def _line_tolerance(predicted, tolerance, relative=RELATIVE_LINE_TOLERANCE):
+    """每條線的容許誤差：至少 tolerance 像素，透視下間距較大的近端按間距放寬"""
+    spacing = np.abs(np.gradient(predicted)) if len(predicted) > 1 else np.zeros(1)
+    return np.maximum(tolerance, relative * np.nan_to_num(spacing))
+
+
+def _match_lines(model, ks, positions, tolerance, relative=RELATIVE_LINE_TOLERANCE):
+    """以模型預測索引 ks 的線位置，返回每個索引是否有候選線落在容許誤差內，以及最近的候選線"""
+    predicted = _projective(model, ks)
+    valid = np.isfinite(predicted)
+    spacing = np.abs(np.diff(predicted, append=np.nan))
+    valid &= ~(spacing < MIN_LINE_SPACING) # nan 的比較為 False，最後一個索引不受影響
+    distance = np.abs(positions[np.newaxis, :] - np.where(valid, predicted, np.inf)[:, np.newaxis])
+    nearest = np.argmin(distance, axis=1)
+    hit = distance[np.arange(len(ks)), nearest] <= _line_tolerance(predicted, tolerance, relative)
+    return hit, nearest
+
+
+def _best_window(model, positions, tolerance):
+    """
+    以模型預測索引 -18 ~ 36 的線位置，找出包含最多候選線的連續 19 個索引。
+    返回 (命中數, 起始索引, 命中的 (索引, 位置))。
+    """
+    ks = np.arange(-(BOARD_DIM - 1), 2 * BOARD_DIM - 1)
+    hit, nearest = _match_lines(model, ks, positions, tolerance)
+    counts = np.convolve(hit.astype(int), np.ones(BOARD_DIM, dtype=int), mode="valid")
+    start = int(np.argmax(counts))
+    window = np.zeros_like(hit)
+    window[start:start + BOARD_DIM] = True
+    selected = hit & window
+    return int(counts[start]), int(ks[start]), ks[selected].astype(np.float64), positions[nearest[selected]]
+
+
+def _ransac_lines(positions, iterations, tolerance, min_inliers, rng):
+    """
+    RANSAC：隨機取三條相鄰的候選線，假設它們的格數間隔為 (1, 1)、(1, 2) 或 (2, 1)，
+    從樣本向兩側逐步延伸並重新擬合模型，再計算 19 條連續位置中落在預測位置上的候選線。
+    返回命中最多的 (模型, 第 0 條棋盤線的索引)，找不到足夠的線時返回 None。
+    """
+    count = len(positions)
+    if count < 3:
+        return None
+    gap_patterns = ((1, 1), (1, 2), (2, 1))
+    best = None
+    for _ in range(iterations):
+        first = rng.integers(0, count - 2)
+        gap1, gap2 = gap_patterns[rng.integers(len(gap_patterns))]
+        ks = np.array([0.0, gap1, gap1 + gap2])
+        model = _fit_projective(ks, positions[first:first + 3])
+        # 三點只能估計等距模型，預測只在樣本附近可靠：每次向兩側多延伸幾條線，
+        # 以較寬的容許誤差找出命中的線重新擬合 (線數足夠後加入透視項)，逐步涵蓋透視下間距不同的遠端和近端
+        for reach in GROWTH_REACH:
+            grown = np.arange(-reach, gap1 + gap2 + reach + 1, dtype=np.float64)
+            hit, nearest = _match_lines(model, grown, positions, tolerance, GROWTH_LINE_TOLERANCE)
+            if np.count_nonzero(hit) < 3:
+                break
+            model = _fit_projective(grown[hit], positions[nearest[hit]])
+        score, start, ks, hits = _best_window(model, positions, tolerance)
+        if score < min_inliers:
+            continue
+        error = np.mean(np.abs(_projective(model, ks) - hits))
+        if best is None or (score, -error) > (best[0], -best[1]):
+            best = (score, error, model, start)
+            if score == BOARD_DIM and error < tolerance / 4:
+                break
+    if best is None:
+        return None
+    return best[2], best[3]
+
+
+def _refine_projective(positions, model, start, tolerance):
+    """
+    以最小平方法反覆擬合 19 條線的射影模型。
+    返回每條棋盤線對應的候選線索引 (沒有則為 -1)。
+    """
+    k = np.arange(BOARD_DIM, dtype=np.float64)
+    assigned = np.full(BOARD_DIM, -1)
+    model = _fit_projective(k, _projective(model, start + k)) # 平移索引，讓第 0 條棋盤線的索引為 0
+    for _ in range(REFINE_ITERATIONS):
+        predicted = _projective(model, k)
+        distance = np.abs(positions[np.newaxis, :] - predicted[:, np.newaxis])
+        nearest = np.argmin(distance, axis=1)
+        ok = distance[np.arange(BOARD_DIM), nearest] <= _line_tolerance(predicted, tolerance)
+        assigned = np.where(ok, nearest, -1)
+        if np.count_nonzero(ok) < 3:
+            break
+        model = _fit_projective(k[ok], positions[nearest[ok]])
+    return assigned
+
+
+def _fit_family_lines(segments, members_by_candidate, assigned):
+    """以每條棋盤線的線段端點擬合直線 (齊次座標)，沒有對應候選線的為 None"""
+    fitted = []
+    for candidate in assigned:
+        if candidate < 0:
+            fitted.append(None)
+            continue
+        members = members_by_candidate[candidate]
+        points = np.concatenate([segments[members, :2], segments[members, 2:]]).astype(np.float32)
+        vx, vy, x0, y0 = cv2.fitLine(points, cv2.DIST_HUBER, 0, 0.01, 0.01).ravel()
+        fitted.append(np.cross([x0, y0, 1.0], [x0 + vx, y0 + vy, 1.0]))
+    return fitted
+
+
+def find_board_corners(frame, canny_threshold1=DEFAULT_CANNY_THRESHOLD1, canny_threshold2=DEFAULT_CANNY_THRESHOLD2,
+                       hough_threshold=DEFAULT_HOUGH_THRESHOLD, hough_min_line_length=DEFAULT_HOUGH_MIN_LINE_LENGTH,
+                       hough_max_line_gap=DEFAULT_HOUGH_MAX_LINE_GAP, ransac_iterations=DEFAULT_RANSAC_ITERATIONS,
+                       ransac_line_tolerance=DEFAULT_RANSAC_LINE_TOLERANCE,
+                       ransac_min_inliers_ratio=DEFAULT_RANSAC_MIN_INLIERS_RATIO, seed=0):
+    """
+    從一幀影像自動找出棋盤四個角落交叉點。
+    返回 {'corners': [A1, T1, T19, A19] 畫面座標, 'residual_px': 交叉點 RMS 殘差, 'elapsed_ms': 耗時,
+          'lines_found': (橫線數, 直線數)}；失敗時返回 None。
+    """
+    start = time.perf_counter()
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    segments = _detect_segments(gray, canny_threshold1, canny_threshold2, hough_threshold,
+                                hough_min_line_length, hough_max_line_gap)
+    if len(segments) < 2 * BOARD_DIM * ransac_min_inliers_ratio:
+        write_log(f"自動校準失敗：只找到 {len(segments)} 條線段。")
+        return None
+
+    rng = np.random.default_rng(seed)
+    min_inliers = int(np.ceil(BOARD_DIM * ransac_min_inliers_ratio))
+    center = np.median((segments[:, :2] + segments[:, 2:]) / 2, axis=0)
+    lines = {}
+    for family_angle, family_segments in _split_families(segments):
+        vertical = abs(np.sin(family_angle)) > abs(np.cos(family_angle))
+        name = "直" if vertical else "橫"
+        if len(family_segments) < min_inliers:
+            write_log(f"自動校準失敗：{name}線方向只有 {len(family_segments)} 條線段。")
+            return None
+        offsets = _family_offsets(family_segments, family_angle, center, vertical)
+        positions, members = _merge_candidates(offsets, family_segments, ransac_line_tolerance)
+        hypothesis = _ransac_lines(positions, ransac_iterations, ransac_line_tolerance, min_inliers, rng)
+        if hypothesis is None:
+            write_log(f"自動校準失敗：{name}線方向找不到 {min_inliers} 條以上等距的棋盤線。")
+            return None
+        assigned = _refine_projective(positions, *hypothesis, ransac_line_tolerance)
+        if np.count_nonzero(assigned >= 0) < min_inliers:
+            write_log(f"自動校準失敗：{name}線方向的射影擬合只對應到 {np.count_nonzero(assigned >= 0)} 條線。")
+            return None
+        lines["columns" if vertical else "rows"] = _fit_family_lines(family_segments, members, assigned)
+    if set(lines) != {"rows", "columns"}:
+        write_log("自動校準失敗：無法分出橫線和直線兩個方向。")
+        return None
+
+    # 所有找到的橫線與直線的交點，對 (col, row) 索引空間擬合 homography；被棋子完全遮住的線直接略過
+    last = BOARD_DIM - 1
+    indices, intersections = [], []
+    for top_index, row_line in enumerate(lines["rows"]): # 由上到下：索引 0 為第 19 線
+        for col, col_line in enumerate(lines["columns"]): # 由左到右：索引 0 為 A
+            if row_line is None or col_line is None:
+                continue
+            point = np.cross(col_line, row_line)
+            indices.append((col, last - top_index))
+            intersections.append(point[:2] / point[2])
+    indices = np.float32(indices)
+    intersections = np.float32(intersections)
+    to_frame, _ = cv2.findHomography(indices, intersections, cv2.RANSAC, ransac_line_tolerance)
+    if to_frame is None:
+        write_log("自動校準失敗：無法由交叉點求出 homography。")
+        return None
+    projected = cv2.perspectiveTransform(indices.reshape(-1, 1, 2), to_frame).reshape(-1, 2)
+    residual = float(np.sqrt(np.mean(np.sum(np.square(projected - intersections), axis=1))))
+    corners = cv2.perspectiveTransform(np.float32([[[0, 0]], [[last, 0]], [[last, last]], [[0, last]]]),
+                                       to_frame).reshape(-1, 2) # A1, T1, T19, A19
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    lines_found = tuple(sum(line is not None for line in lines[key]) for key in ("rows", "columns"))
+    write_log(f"自動校準：{len(segments)} 條線段，找到橫線 {lines_found[0]} / 直線 {lines_found[1]} 條，"
+              f"交叉點殘差 {residual:.2f} px，耗時 {elapsed_ms:.1f} ms。", DEBUG)
+    if residual > MAX_RESIDUAL_PX:
+        write_log(f"自動校準失敗：交叉點殘差 {residual:.2f} px 超過 {MAX_RESIDUAL_PX} px。")
+        return None
+    return {"corners": [tuple(map(float, corner)) for corner in corners], "residual_px": residual,
+            "elapsed_ms": elapsed_ms, "lines_found": lines_found}
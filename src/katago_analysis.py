@@ -0,0 +1,357 @@
+# katago_analysis.py
+import json
+import os
+import subprocess
+import threading
+import time
+import numpy as np
+from _shared_utils import write_log, DEBUG # 從共用工具導入日誌功能
+from katago_gtp import KataGoGTP, GameRecord, STARTUP_TIMEOUT, build_replay_commands, parse_gtp_response
+from go_rules import find_captures, is_suicide, gtp_to_index, GTP_COLUMNS, EMPTY, STONE_VALUES # 與視覺系統相同的提子規則
+
+DEFAULT_ANALYSIS_CONFIG_PATH = "/opt/homebrew/Cellar/katago/1.16.3/share/katago/configs/analysis_example.cfg"
+DEFAULT_GENMOVE_MAX_VISITS = 500 # genmove 時每個查詢的訪問數上限
+DEFAULT_RULES = "chinese"
+DEFAULT_KOMI = 7.5
+ANALYSIS_READY_BANNER = "ready to begin handling requests" # 分析引擎載入完成時輸出到 stderr 的訊息
+
+
+class _PendingQuery:
+    """單一 JSON 查詢的等待者，由 stdout 讀取線程依 id 填入結果"""
+    def __init__(self, query_id, payload):
+        self.query_id = query_id
+        self.payload = payload
+        self.result = None
+        self.done = threading.Event()
+        self.sent_time = time.perf_counter()
+        self.done_time = None
+
+    def set_result(self, result):
+        self.result = result
+        self.done_time = time.perf_counter()
+        self.done.set()
+
+    def wait(self, timeout):
+        if not self.done.wait(timeout):
+            write_log(f"錯誤：分析查詢 {self.query_id} 超時 ({timeout}秒)。")
+            return None
+        return self.result
+
+
+def parse_analysis_result(data, board_size):
+    """
+    將分析引擎的 JSON 回應轉換為結構化結果：
+      {"id", "turn", "moves": [moveInfos，依 order 排序], "root": rootInfo,
+       "ownership": (board_size, board_size) 的 NumPy 陣列或 None, "error": 錯誤訊息或 None}
+    ownership 的第 0 列是棋盤最上方 (第 19 行)，與 KataGo 的輸出順序相同。
+    """
+    if "error" in data:
+        return {"id": data.get("id"), "turn": None, "moves": [], "root": {}, "ownership": None, "error": data["error"]}
+    ownership = data.get("ownership")
+    if ownership is not None:
+        ownership = np.asarray(ownership, dtype=np.float32).reshape(board_size, board_size)
+    moves = sorted(data.get("moveInfos", []), key=lambda info: info.get("order", 0))
+    return {"id": data.get("id"), "turn": data.get("turnNumber"), "moves": moves,
+            "root": data.get("rootInfo", {}), "ownership": ownership, "error": None}
+
+
+class AnalysisSession:
+    """
+    一盤棋的 GTP 介面：play / boardsize / komi 等指令只更新本地棋局記錄，genmove 轉換為一次分析查詢。
+    查詢透過 engine (KataGoAnalysis) 送出，多個 AnalysisSession 可以共用同一個分析引擎進程
+    (katago_server.py 的每台棋桌一個)，各盤棋的查詢同時進行，由 KataGo 合併成同一批次評估。
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.game = GameRecord()
+        self.komi = DEFAULT_KOMI
+        self.rules = DEFAULT_RULES
+        self.genmove_max_visits = DEFAULT_GENMOVE_MAX_VISITS
+        self.last_latency_ms = None
+        self.last_result = None # 最近一次 genmove 的完整分析結果
+        self._ponder_query = None
+        self._ponder_start = None
+
+    def _send_query(self, payload):
+        return self.engine._send_query(payload)
+
+    def query_async(self, moves=None, max_visits=None, include_ownership=False, board_size=None, komi=None, max_time=None):
+        """
+        送出一個分析查詢但不等待，可同時送出多個。moves 預設為目前棋局，max_time 為搜尋時間上限 (秒)。
+        返回等待物件，呼叫其 wait(timeout) 取得原始 JSON 結果。
+        """
+        moves = self.game.moves if moves is None else moves
+        board_size = board_size or self.game.board_size
+        payload = {
+            "moves": [[color.upper()[0], vertex] for color, vertex in moves],
+            "rules": self.rules,
+            "komi": float(self.komi if komi is None else komi),
+            "boardXSize": board_size,
+            "boardYSize": board_size,
+            "analyzeTurns": [len(moves)],
+            "includeOwnership": include_ownership,
+        }
+        if max_visits is not None:
+            payload["maxVisits"] = max_visits
+        if max_time is not None:
+            payload["overrideSettings"] = {"maxTime": float(max_time)}
+        return self._send_query(payload)
+
+    def query(self, moves=None, max_visits=None, include_ownership=False, board_size=None, komi=None, timeout=120):
+        """送出分析查詢並等待，返回 parse_analysis_result 的結構化結果；失敗時返回 None"""
+        pending = self.query_async(moves, max_visits, include_ownership, board_size, komi)
+        data = pending.wait(timeout) if pending else None
+        if data is None:
+            return None
+        self.last_latency_ms = (pending.done_time - pending.sent_time) * 1000
+        return parse_analysis_result(data, board_size or self.game.board_size)
+
+    def _genmove(self, color):
+        moves = list(self.game.moves)
+        # 分析引擎依照 moves 交替決定下一手的顏色，連續同色時插入對方的 pass
+        if moves and moves[-1][0].upper()[0] == color.upper()[0]:
+            moves.append(("W" if color.upper()[0] == "B" else "B", "pass"))
+        elif not moves and color.upper()[0] == "W":
+            moves.append(("B", "pass"))
+        result = self.query(moves, max_visits=self.genmove_max_visits)
+        if result is None:
+            return None
+        if result["error"]:
+            return f"? {result['error']}"
+        self.last_result = result
+        best = result["moves"][0]["move"] if result["moves"] else "pass"
+        write_log(f"分析引擎建議落子：{best} (查詢耗時 {self.last_latency_ms:.1f} ms)")
+        return f"= {best}"
+
+    def board_position(self):
+        """以目前棋局記錄重建棋盤 ((board_size, board_size) 陣列，row 0 為第 1 線)，包含提子"""
+        size = self.game.board_size
+        board = np.zeros((size, size), dtype=np.int8)
+        for color, vertex in self.game.moves:
+            if vertex.lower() == "pass" or color.upper()[0] not in STONE_VALUES:
+                continue
+            row, col = gtp_to_index(vertex)
+            color_value = STONE_VALUES[color.upper()[0]]
+            for r, c in find_captures(board, row, col, color_value):
+                board[r, c] = EMPTY
+            board[row, col] = color_value
+        return board
+
+    def _is_legal_play(self, color, vertex):
+        """
+        color 在 vertex 落子是否合法：pass，或是棋盤上的空點 (已被提掉的點可以再下)，
+        且落子後不是自殺 (有提子或所在棋串仍有氣)。不檢查劫，交給分析引擎的查詢驗證。
+        """
+        if vertex.lower() == "pass":
+            return True
+        size = self.game.board_size
+        if color.upper()[0] not in STONE_VALUES or vertex[0].upper() not in GTP_COLUMNS[:size] or not vertex[1:].isdigit():
+            return False
+        row, col = gtp_to_index(vertex)
+        board = self.board_position()
+        if not (0 <= row < size) or board[row, col] != EMPTY:
+            return False
+        return not is_suicide(board, row, col, STONE_VALUES[color.upper()[0]])
+
+    def send_command(self, command):
+        """以 GTP 指令操作本地棋局記錄；genmove 會送出分析查詢"""
+        command = command.strip()
+        parts = command.split()
+        if not parts:
+            return "? empty command"
+        name, args = parts[0].lower(), parts[1:]
+        write_log(f"-> [分析引擎後端] 指令: '{command}'", DEBUG)
+
+        if name == "protocol_version":
+            response = "= 2"
+        elif name == "name":
+            response = "= KataGo (analysis engine)"
+        elif name in ("boardsize", "clear_board", "undo"):
+            response = "="
+        elif name == "komi" and args:
+            self.komi = float(args[0])
+            response = "="
+        elif name == "play" and len(args) >= 2:
+            response = "=" if self._is_legal_play(args[0], args[1]) else "? illegal move"
+        elif name == "genmove" and args:
+            response = self._genmove(args[0])
+        else:
+            response = "? unknown command"
+
+        if response is not None:
+            self.game.record(command, parse_gtp_response(response))
+        return response
+
+    def send_commands(self, commands):
+        return [self.send_command(command) for command in commands]
+
+    def replay_moves(self, moves, board_size=19, komi=None):
+        responses = self.send_commands(build_replay_commands(moves, board_size, komi))
+        return all(self.parse_response(response)['status'] == 'success' for response in responses)
+
+    def parse_response(self, response):
+        return parse_gtp_response(response)
+
+    def start_ponder(self, color=None, max_visits=None, max_time=None, interval_centiseconds=None):
+        """
+        在背景分析目前局面，預算為 max_visits 次訪問或 max_time 秒 (由分析引擎的 maxTime 設定限制)。
+        分析引擎沒有跨查詢的搜尋樹，但會預熱神經網路快取。
+        """
+        if self._ponder_query is not None:
+            return
+        self._ponder_query = self.query_async(max_visits=max_visits or 100000, max_time=max_time)
+        self._ponder_start = time.perf_counter()
+        write_log(f"開始背景分析 (預算: max_visits={max_visits}, max_time={max_time})。")
+
+    def stop_ponder(self):
+        pending, self._ponder_query = self._ponder_query, None
+        if pending is None:
+            return None
+        self._send_query({"action": "terminate", "terminateId": pending.query_id})
+        data = pending.wait(2.0)
+        stats = {"visits": 0, "elapsed": time.perf_counter() - self._ponder_start, "best_move": None, "winrate": None}
+        if data and "moveInfos" in data:
+            result = parse_analysis_result(data, self.game.board_size)
+            stats["visits"] = result["root"].get("visits", 0)
+            if result["moves"]:
+                stats["best_move"] = result["moves"][0].get("move")
+                stats["winrate"] = result["moves"][0].get("winrate")
+        write_log(f"背景分析結束：{stats['visits']} 次訪問，{stats['elapsed']:.2f} 秒。")
+        return stats
+
+
+class KataGoAnalysis(AnalysisSession):
+    """
+    以 'katago analysis' 的 JSON 協定驅動 KataGo，可同時進行多個以 id 區分的查詢。
+    對外介面與 KataGoGTP 相同 (start_katago、send_command、parse_response、stop_katago 等)：
+    本身就是一個 AnalysisSession，因此 main_game_loop.py 可以透過設定 (KATAGO_BACKEND=analysis) 切換後端；
+    其他 AnalysisSession(engine) 可以共用同一個進程下不同的棋局。
+    """
+    def __init__(self, katago_path=None, model_path=None, config_path=None):
+        super().__init__(self) # 自己也是一盤棋 (單一棋桌直接使用時)
+        # 可執行檔和模型的預設值與 KataGoGTP 相同，配置文件改用分析引擎的配置
+        self.katago_path = katago_path or os.getenv("KATAGO_PATH") or KataGoGTP._find_katago_path()
+        self.model_path = model_path or os.getenv("KATAGO_MODEL_PATH", "/opt/homebrew/Cellar/katago/1.16.3/share/katago/kata1-b28c512nbt-s9584861952-d4960414494.bin.gz")
+        self.config_path = config_path or os.getenv("KATAGO_ANALYSIS_CONFIG_PATH", DEFAULT_ANALYSIS_CONFIG_PATH)
+        self.process = None
+        self.io_threads = []
+        self._pending_queries = {}
+        self._pending_lock = threading.Lock()
+        self._stdin_lock = threading.Lock()
+        self._next_query_id = 1
+        self._ready_banner_time = None
+
+        write_log("KataGoAnalysis 實例化。")
+        for path, name in [(self.katago_path, "KataGo 可執行檔"), (self.model_path, "模型檔案"), (self.config_path, "配置文件")]:
+            if not os.path.exists(path):
+                write_log(f"錯誤: {name} 找不到: {path}")
+                raise FileNotFoundError(f"{name} 找不到: {path}")
+        write_log("所有 KataGo 分析引擎相關檔案路徑檢查通過。")
+
+    def start_katago(self, timeout=STARTUP_TIMEOUT):
+        command = [self.katago_path, "analysis", "-model", self.model_path, "-config", self.config_path]
+        write_log(f"啟動 KataGo 分析引擎命令: {' '.join(command)}")
+        spawn_start = time.perf_counter()
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            encoding='utf-8'
+        )
+        process = self.process
+        self.io_threads = [
+            threading.Thread(target=self._read_stdout_thread, args=(process,), daemon=True),
+            threading.Thread(target=self._read_stderr_thread, args=(process,), daemon=True),
+        ]
+        for thread in self.io_threads:
+            thread.start()
+
+        # 與 GTP 後端相同的主動探測：載入模型後才會回覆 query_version
+        probe = self._send_query({"action": "query_version"})
+        result = probe.wait(timeout) if probe else None
+        ready_time = time.perf_counter()
+        if not result or "version" not in result:
+            write_log(f"警告: KataGo 分析引擎在 {timeout} 秒內未回應就緒探測。")
+            return False
+        total_ms = (ready_time - spawn_start) * 1000
+        if self._ready_banner_time is not None:
+            load_ms = (self._ready_banner_time - spawn_start) * 1000
+            write_log(f"✅ KataGo 分析引擎已就緒 (版本 {result['version']})。啟動耗時 {total_ms:.1f} ms：模型載入 {load_ms:.1f} ms，"
+                      f"第一個回應 {total_ms - load_ms:.1f} ms。")
+        else:
+            write_log(f"✅ KataGo 分析引擎已就緒 (版本 {result['version']})，啟動耗時 {total_ms:.1f} ms。")
+        return True
+
+    def _read_stdout_thread(self, process):
+        write_log("[Analysis IO] STDOUT 讀取線程啟動。")
+        for line in iter(process.stdout.readline, ''):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                write_log(f"[Analysis IO] 無法解析的輸出: '{line}'")
+                continue
+            if "warning" in data:
+                write_log(f"[Analysis IO] KataGo 警告: {data['warning']}")
+                continue
+            with self._pending_lock:
+                pending = self._pending_queries.pop(str(data.get("id")), None)
+            if pending is None:
+                write_log(f"[Analysis IO] 收到未知 id 的回應: {line[:200]}")
+                continue
+            pending.set_result(data)
+        write_log("[Analysis IO] STDOUT 管道已關閉。")
+        with self._pending_lock:
+            pending_list = list(self._pending_queries.values())
+            self._pending_queries.clear()
+        for pending in pending_list:
+            pending.set_result(None)
+
+    def _read_stderr_thread(self, process):
+        for line in iter(process.stderr.readline, ''):
+            stripped = line.strip()
+            write_log(f"[Analysis IO] <- STDERR: '{stripped}'", DEBUG)
+            if self._ready_banner_time is None and ANALYSIS_READY_BANNER in stripped:
+                self._ready_banner_time = time.perf_counter()
+
+    def _send_query(self, payload):
+        """送出一個 JSON 查詢並返回等待物件；進程未運行時返回 None"""
+        if not self.process or self.process.poll() is not None:
+            write_log("錯誤：KataGo 分析引擎未啟動或已終止。")
+            return None
+        with self._stdin_lock:
+            query_id = str(self._next_query_id)
+            self._next_query_id += 1
+            payload = dict(payload, id=query_id)
+            pending = _PendingQuery(query_id, payload)
+            with self._pending_lock:
+                self._pending_queries[query_id] = pending
+            try:
+                self.process.stdin.write(json.dumps(payload) + "\n")
+                self.process.stdin.flush()
+            except Exception as e:
+                write_log(f"錯誤寫入 stdin: {e}")
+                with self._pending_lock:
+                    self._pending_queries.pop(query_id, None)
+                return None
+        return pending
+
+    def stop_katago(self):
+        if self.process and self.process.poll() is None:
+            write_log("嘗試停止 KataGo 分析引擎。")
+            try:
+                # 分析引擎在 stdin 關閉後處理完剩餘查詢即結束
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+                write_log("KataGo 分析引擎正常結束。")
+            except Exception as e:
+                write_log(f"停止 KataGo 分析引擎時發生錯誤，強制終止: {e}")
+                self.process.kill()
+                self.process.wait()
+        for thread in self.io_threads:
+            thread.join(timeout=2)
@@ -2,10 +2,182 @@
 import subprocess
 import os
 import time
-import select
 import threading
 import queue
-from _shared_utils import write_log, LOG_FILE_PATH # 從共用工具導入日誌功能
+import re
+from collections import OrderedDict
+from _shared_utils import write_log, LOG_FILE_PATH, DEBUG # 從共用工具導入日誌功能
+
+# GTP 回應行: '=12 D4'、'?12 illegal move'、'= D4' (指令 ID 為選用)
+GTP_RESPONSE_PATTERN = re.compile(r'^([=?])(\d+)?\s*(.*)$')
+STARTUP_TIMEOUT = 30 # 等待 KataGo 載入模型並回應就緒探測的上限 (秒)
+READINESS_PROBE_COMMAND = "protocol_version"
+GTP_READY_BANNER = "GTP ready" # KataGo 載入完成時輸出到 stderr 的訊息
+STDERR_QUEUE_MAX_LINES = 1000 # stderr/stdout 佇列上限，超過時丟棄最舊的行
+MAX_DISCARDED_REPLY_IDS = 64 # 最多記住多少個已放棄指令的 ID，用來丟棄它們遲到的回應
+
+# kata-analyze 中值為多個 token 的欄位，遇到下一個 'info' 或其他列表欄位時結束
+ANALYSIS_LIST_FIELDS = ("pv", "pvVisits", "pvEdgeVisits", "movesOwnership")
+ANALYSIS_INT_FIELDS = ("visits", "edgeVisits", "order", "isSymmetryOf")
+# lz-analyze 以 0-10000 表示的欄位，解析時轉換為 0-1
+LZ_ANALYZE_SCALED_FIELDS = ("winrate", "prior", "lcb")
+
+
+def parse_analysis_line(line, lz_format=False):
+    """
+    解析一行 kata-analyze / lz-analyze 輸出，例如:
+      'info move D4 visits 120 winrate 0.54 ... order 0 pv D4 Q16 info move Q16 ...'
+    返回 {"moves": [每個候選手的 dict，依 order 排序], "ownership": list 或 None}。
+    """
+    moves = []
+    ownership = None
+    current = None
+    tokens = line.split()
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == "info":
+            current = {}
+            moves.append(current)
+            i += 1
+        elif token == "ownership":
+            ownership = [float(v) for v in tokens[i + 1:]]
+            break
+        elif current is None:
+            i += 1
+        elif token in ANALYSIS_LIST_FIELDS:
+            j = i + 1
+            while j < len(tokens) and tokens[j] not in ("info", "ownership") + ANALYSIS_LIST_FIELDS:
+                j += 1
+            current[token] = tokens[i + 1:j]
+            i = j
+        elif i + 1 < len(tokens):
+            value = tokens[i + 1]
+            if token == "move":
+                current[token] = value
+            elif token in ANALYSIS_INT_FIELDS:
+                current[token] = int(value)
+            else:
+                try:
+                    current[token] = float(value)
+                except ValueError:
+                    current[token] = value
+            i += 2
+        else:
+            break
+
+    if lz_format:
+        for info in moves:
+            for field in LZ_ANALYZE_SCALED_FIELDS:
+                if field in info:
+                    info[field] = info[field] / 10000
+    moves.sort(key=lambda info: info.get("order", 0))
+    return {"moves": moves, "ownership": ownership}
+
+
+def parse_gtp_response(response):
+    """將原始 GTP 回應解析為 {"status": "success" | "error" | "info", "content": ...}"""
+    if response is None:
+        write_log("解析回應時，輸入為 None。")
+        return {"status": "error", "content": "無回應"}
+    
+    write_log(f"開始解析回應:\n'{response.strip()}'", DEBUG)
+    lines = response.strip().split('\n')
+    if lines and lines[-1] == "":
+        lines.pop()
+
+    for i, line in enumerate(lines):
+        if line.startswith('='):
+            content = "\n".join([line[1:].strip()] + lines[i+1:]).strip()
+            write_log(f"解析結果: 成功，內容: '{content}'", DEBUG)
+            return {"status": "success", "content": content}
+        elif line.startswith('?'):
+            content = "\n".join([line[1:].strip()] + lines[i+1:]).strip()
+            write_log(f"解析結果: 錯誤，內容: '{content}'", DEBUG)
+            return {"status": "error", "content": content}
+    write_log(f"解析結果: 資訊，內容: '{response.strip()}'", DEBUG)
+    return {"status": "info", "content": response.strip()}
+
+
+def build_replay_commands(moves, board_size=19, komi=None):
+    """重建棋局所需的指令：boardsize、clear_board、(komi) 和所有 play"""
+    commands = [f"boardsize {board_size}", "clear_board"]
+    if komi is not None:
+        commands.append(f"komi {komi}")
+    commands.extend(f"play {color} {vertex}" for color, vertex in moves)
+    return commands
+
+
+class GameRecord:
+    """
+    記錄會改變棋局狀態的成功 GTP 指令 (boardsize、clear_board、komi、play、genmove、undo)，
+    用於在另一個 KataGo 進程中重建同一盤棋。
+    """
+    def __init__(self):
+        self.board_size = 19
+        self.komi = None
+        self.moves = []
+
+    def record(self, command, parsed):
+        if parsed['status'] != 'success':
+            return
+        parts = command.split()
+        if parts and parts[0].isdigit():
+            parts = parts[1:]
+        if not parts:
+            return
+        name, args = parts[0].lower(), parts[1:]
+        if name == "boardsize" and args:
+            self.board_size = int(args[0])
+            self.moves = []
+        elif name == "clear_board":
+            self.moves = []
+        elif name == "komi" and args:
+            self.komi = args[0]
+        elif name == "play" and len(args) >= 2:
+            self.moves.append((args[0], args[1]))
+        elif name == "genmove" and args:
+            move = parsed['content'].split()[0] if parsed['content'] else ""
+            if move and move.lower() != "resign":
+                self.moves.append((args[0], move))
+        elif name == "undo" and self.moves:
+            self.moves.pop()
+
+    def replay_commands(self):
+        return build_replay_commands(self.moves, self.board_size, self.komi)
+
+
+class _PendingCommand:
+    """
+    單一 GTP 指令的回應等待者。
+    由 stdout 讀取線程填入回應並透過 Event 喚醒呼叫端，取代 10 ms 的輪詢迴圈。
+    """
+    def __init__(self, command, command_id=None, on_abandon=None):
+        self.command = command
+        self.command_id = command_id
+        self.on_abandon = on_abandon # 超時放棄時呼叫，讓擁有者把指令移出等待表
+        self.is_genmove_like = command.lower().startswith("genmove")
+        self.response = None
+        self.abandoned = False # 呼叫端已超時放棄，遲到的回應直接丟棄
+        self.done = threading.Event()
+        self.sent_time = None
+        self.done_time = None
+
+    def set_response(self, response):
+        self.response = response
+        self.done_time = time.perf_counter()
+        self.done.set()
+
+    def wait(self, timeout):
+        """等待回應並返回；超時返回 None，之後遲到的回應會被丟棄"""
+        if not self.done.wait(timeout):
+            self.abandoned = True
+            write_log(f"錯誤：KataGo 回覆超時 ({timeout}秒)。指令: '{self.command}'")
+            if self.on_abandon is not None:
+                self.on_abandon(self)
+            return None
+        return self.response
+
 
 class KataGoGTP:
     def __init__(self, katago_path=None, model_path=None, config_path=None):
@@ -15,11 +187,33 @@ class KataGoGTP:
         self.model_path = model_path or os.getenv("KATAGO_MODEL_PATH", "/opt/homebrew/Cellar/katago/1.16.3/share/katago/kata1-b28c512nbt-s9584861952-d4960414494.bin.gz")
         self.config_path = config_path or os.getenv("KATAGO_CONFIG_PATH", "/opt/homebrew/Cellar/katago/1.16.3/share/katago/configs/gtp_example.cfg")
         self.process = None
-        self.stdout_queue = queue.Queue()
-        self.stderr_queue = queue.Queue()
+        self.stdout_queue = queue.Queue(maxsize=STDERR_QUEUE_MAX_LINES)
+        self.stderr_queue = queue.Queue(maxsize=STDERR_QUEUE_MAX_LINES)
         self.io_thread = None
+        self.io_threads = []
         self._stop_io_thread = threading.Event()
 
+        # 已送出但尚未收到回應的指令，以 GTP 指令 ID 為鍵並保持送出順序
+        self._pending_commands = OrderedDict()
+        self._next_command_id = 1
+        # 已由 stderr 取得結果或已超時放棄的指令 ID，之後 stdout 帶有這些 ID 的遲到回應直接丟棄
+        self._discarded_command_ids = set()
+        self._pending_lock = threading.Lock()
+        self._stdin_lock = threading.Lock()
+        self.last_latency_ms = None # 最近一次指令的往返延遲 (毫秒)
+
+        # 進行中的 kata-analyze / lz-analyze 的 info 行會轉送到這個佇列
+        self._analysis_queue = None
+
+        # 啟動時間量測
+        self._gtp_ready_time = None
+        self.startup_timing_ms = None
+
+        # 背景思考 (ponder) 狀態
+        self._ponder_thread = None
+        self._ponder_cancel = threading.Event()
+        self._ponder_stats = None
+
         write_log("KataGoGTP 實例化。")
 
         for path, name in [(self.katago_path, "KataGo 可執行檔"), (self.model_path, "模型檔案"), (self.config_path, "配置文件")]:
@@ -28,7 +222,8 @@ class KataGoGTP:
                 raise FileNotFoundError(f"{name} 找不到: {path}")
         write_log("所有 KataGo 相關檔案路徑檢查通過。")
 
-    def _find_katago_path(self):
+    @staticmethod
+    def _find_katago_path():
         try:
             result = subprocess.run(['which', 'katago'], capture_output=True, text=True)
             if result.returncode == 0:
@@ -41,40 +236,144 @@ class KataGoGTP:
         write_log(f"未能自動找到 KataGo 路徑，使用預設路徑: {default_path}")
         return default_path
 
-    def _read_io_thread(self):
-        """在獨立線程中持續讀取 stdout 和 stderr 並放入佇列"""
-        write_log("[IO Thread] I/O 讀取線程啟動。")
-        while not self._stop_io_thread.is_set():
-            if not self.process or self.process.poll() is not None:
-                write_log("[IO Thread] KataGo 進程已終止，停止 I/O 線程。")
+    def _start_io_threads(self):
+        """為目前的進程分別啟動 stdout 和 stderr 讀取線程"""
+        process = self.process
+        self.io_threads = [
+            threading.Thread(target=self._read_stdout_thread, args=(process,), daemon=True),
+            threading.Thread(target=self._read_stderr_thread, args=(process,), daemon=True),
+        ]
+        for thread in self.io_threads:
+            thread.start()
+        self.io_thread = self.io_threads[0]
+
+    def _read_stdout_thread(self, process):
+        """
+        阻塞式讀取 stdout。收到 '=' 或 '?' 開頭的行時，直接交給等待中的指令並喚醒呼叫端，
+        不再經過 select 逾時或主線程輪詢。
+        """
+        write_log("[IO Thread] STDOUT 讀取線程啟動。")
+        for line in iter(process.stdout.readline, ''):
+            stripped = line.strip()
+            write_log(f"[IO Thread] <- STDOUT: '{stripped}'", DEBUG)
+            self._dispatch_stdout_line(stripped)
+            if self._stop_io_thread.is_set():
                 break
+        write_log("[IO Thread] STDOUT 管道已關閉，I/O 讀取線程結束。")
+        self._fail_pending_commands()
+
+    def _read_stderr_thread(self, process):
+        """阻塞式讀取 stderr，並為 genmove 保留從 stderr 取得落子結果的備用邏輯"""
+        write_log("[IO Thread] STDERR 讀取線程啟動。")
+        for line in iter(process.stderr.readline, ''):
+            stripped = line.strip()
+            write_log(f"[IO Thread] <- STDERR: '{stripped}'", DEBUG)
+            self._put_bounded(self.stderr_queue, stripped)
+            if self._gtp_ready_time is None and GTP_READY_BANNER in stripped:
+                self._gtp_ready_time = time.perf_counter()
+            if "= " in stripped:
+                self._check_stderr_move(stripped)
+            if self._stop_io_thread.is_set():
+                break
+        write_log("[IO Thread] STDERR 管道已關閉。")
+
+    def _dispatch_stdout_line(self, line):
+        """依照回應中的指令 ID 將 stdout 輸出交給對應的等待指令"""
+        match = GTP_RESPONSE_PATTERN.match(line)
+        with self._pending_lock:
+            analysis_queue = self._analysis_queue
+            if analysis_queue is not None and line.startswith(("info ", "ownership ")):
+                analysis_queue.put(line)
+                return
+            command_id = int(match.group(2)) if match and match.group(2) else None
+            if command_id in self._discarded_command_ids:
+                self._discarded_command_ids.remove(command_id)
+                write_log(f"丟棄指令 ID {command_id} 的遲到回應: '{line}'", DEBUG)
+                return
+            if not self._pending_commands:
+                # 沒有指令在等待 (例如啟動訊息)，放入佇列供 start_katago 使用
+                self._put_bounded(self.stdout_queue, line)
+                return
+            if match is None:
+                # 回應開始前的雜訊行，忽略 (與 KataGo 不發送結束空行的處理方式一致)
+                return
+            if command_id in self._pending_commands:
+                pending = self._pending_commands.pop(command_id)
+            else:
+                # 沒有 ID 的回應按送出順序交給最早的指令
+                _, pending = self._pending_commands.popitem(last=False)
+
+        if pending.done.is_set() or pending.abandoned:
+            # 回應與超時放棄或 stderr 備用邏輯同時發生 (指令還來不及移出等待表)，丟棄遲到的回應
+            write_log(f"丟棄指令 '{pending.command}' 的遲到回應: '{line}'", DEBUG)
+            return
+        # 去掉指令 ID，讓呼叫端和 parse_response 看到的格式與之前相同 ('= D4')
+        status, content = match.group(1), match.group(3).strip()
+        pending.set_response(f"{status} {content}" if content else status)
+
+    def _check_stderr_move(self, err_line):
+        """如果最早送出的指令是 genmove，嘗試從 stderr 的日誌行中解析落子結果"""
+        with self._pending_lock:
+            pending = next(iter(self._pending_commands.values()), None)
+        if pending is None or not pending.is_genmove_like or pending.done.is_set():
+            return
+        try:
+            move = err_line.split("= ", 1)[1].split()[0]
+            if len(move) > 1 and 'A' <= move[0].upper() <= 'T' and move[1:].isdigit():
+                write_log(f"STDOUT 無回應，使用 STDERR 落子結果: {move}")
+                # 移出等待表，之後 stdout 帶有相同 ID 的回應會被丟棄，也不會被當成下一個指令的回應
+                if self._discard_pending(pending):
+                    pending.set_response(f"= {move}\n\n")
+        except Exception as e:
+            write_log(f"解析 STDERR 中的潛在落子結果失敗: {e}")
+
+    def _discard_pending(self, pending):
+        """
+        把已放棄或已由 stderr 取得結果的指令移出等待表，並記住它的 ID 以丟棄遲到的回應。
+        返回 False 表示回應已先到達 (指令已不在等待表中)。
+        """
+        with self._pending_lock:
+            if self._pending_commands.pop(pending.command_id, None) is None:
+                return False
+            self._discarded_command_ids.add(pending.command_id)
+            if len(self._discarded_command_ids) > MAX_DISCARDED_REPLY_IDS:
+                # ID 遞增，最舊的放棄指令大概不會再有回應了
+                self._discarded_command_ids.discard(min(self._discarded_command_ids))
+        return True
+
+    @staticmethod
+    def _put_bounded(q, line):
+        """將輸出行放入有上限的佇列，滿了就丟棄最舊的行，不再於每次送出指令時清空"""
+        while True:
+            try:
+                q.put_nowait(line)
+                return
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
 
-            readable, _, _ = select.select([self.process.stdout, self.process.stderr], [], [], 0.05) 
-
-            if self.process.stdout in readable:
-                line = self.process.stdout.readline()
-                if line:
-                    stripped = line.strip()
-                    self.stdout_queue.put(stripped)
-                    write_log(f"[IO Thread] <- STDOUT: '{stripped}'")
-                elif self.process.poll() is not None: 
-                    write_log("[IO Thread] STDOUT 管道已關閉。")
-                    self._stop_io_thread.set()
-                    break
-
-            if self.process.stderr in readable:
-                line = self.process.stderr.readline()
-                if line:
-                    stripped = line.strip()
-                    self.stderr_queue.put(stripped)
-                    write_log(f"[IO Thread] <- STDERR: '{stripped}'")
-        write_log("[IO Thread] I/O 讀取線程結束。")
-
-
-    def start_katago(self):
+    def _fail_pending_commands(self):
+        """進程終止時喚醒所有仍在等待的指令，回應為 None"""
+        with self._pending_lock:
+            pending_list = list(self._pending_commands.values())
+            self._pending_commands.clear()
+            self._discarded_command_ids.clear()
+        for pending in pending_list:
+            if not pending.done.is_set():
+                write_log(f"KataGo 進程已終止，指令 '{pending.command}' 未收到回應。")
+                pending.set_response(None)
+        analysis_queue = self._analysis_queue
+        if analysis_queue is not None:
+            analysis_queue.put(None) # 喚醒進行中的分析
+
+    def start_katago(self, timeout=STARTUP_TIMEOUT):
         command = [self.katago_path, "gtp", "-model", self.model_path, "-config", self.config_path]
         write_log(f"啟動 KataGo 命令: {' '.join(command)}")
         try:
+            spawn_start = time.perf_counter()
+            self._gtp_ready_time = None
             self.process = subprocess.Popen(
                 command,
                 stdin=subprocess.PIPE,
@@ -84,239 +383,276 @@ class KataGoGTP:
                 bufsize=1,
                 encoding='utf-8'
             )
+            spawn_done = time.perf_counter()
             write_log("KataGo 進程啟動成功。")
 
             self._stop_io_thread.clear()
-            self.io_thread = threading.Thread(target=self._read_io_thread, daemon=True)
-            self.io_thread.start()
+            self._start_io_threads()
             write_log("I/O 讀取線程已啟動。")
 
-            # 新的啟動等待邏輯 (靜默判斷)
-            start_time = time.time()
-            last_output_time = time.time()
-            initial_output_collected = []
-            write_log("等待 KataGo 初始化完成 (靜默判斷)...")
-            
-            while time.time() - start_time < 30: # 總共最多等待 30 秒
-                has_output_this_loop = False
-
-                # 檢查 stdout 佇列
-                while not self.stdout_queue.empty():
-                    try:
-                        line = self.stdout_queue.get_nowait()
-                        initial_output_collected.append(f"[STDOUT]: {line}")
-                        write_log(f"[啟動時 STDOUT]: {line}")
-                        last_output_time = time.time()
-                        has_output_this_loop = True
-                    except queue.Empty:
-                        pass
-                
-                # 檢查 stderr 佇列
+            # 主動探測：KataGo 載入模型後才開始處理 stdin，因此第一個回應即代表已就緒。
+            # 指令在載入期間先寫入管道緩衝區，不需要等待任何靜默期。
+            write_log(f"送出就緒探測指令 '{READINESS_PROBE_COMMAND}'，最多等待 {timeout} 秒...")
+            probe = self.send_command_async(READINESS_PROBE_COMMAND)
+            response = probe.wait(timeout) if probe else None
+            ready_time = time.perf_counter()
+
+            if self.parse_response(response)['status'] != 'success':
+                remaining_stderr = []
                 while not self.stderr_queue.empty():
-                    try:
-                        line = self.stderr_queue.get_nowait()
-                        initial_output_collected.append(f"[STDERR]: {line}")
-                        write_log(f"[啟動時 STDERR]: {line}")
-                        last_output_time = time.time()
-                        has_output_this_loop = True
-                    except queue.Empty:
-                        pass
-                
-                # 判斷是否進入「靜默期」
-                if time.time() - last_output_time > 5: # 如果超過 5 秒沒有新的輸出，則認為 KataGo 已啟動並準備就緒
-                    write_log(f"檢測到 KataGo 已靜默 {time.time() - last_output_time:.2f} 秒。認為已啟動完成。")
-                    return True
-
-                time.sleep(0.1) # 短暫延遲，避免忙等待
-
-            write_log(f"警告: KataGo 在 30 秒內未顯示啟動完成標誌。已收集的初始輸出:\n{os.linesep.join(initial_output_collected)}")
-            return False
+                    remaining_stderr.append(self.stderr_queue.get_nowait())
+                write_log(f"警告: KataGo 在 {timeout} 秒內未回應就緒探測。最近的 STDERR 輸出:\n{os.linesep.join(remaining_stderr)}")
+                return False
+
+            # 啟動時間分解：進程建立、模型載入 (至 'GTP ready' 訊息)、第一個回應
+            spawn_ms = (spawn_done - spawn_start) * 1000
+            total_ms = (ready_time - spawn_start) * 1000
+            if self._gtp_ready_time is not None:
+                load_ms = (self._gtp_ready_time - spawn_done) * 1000
+                first_response_ms = (ready_time - self._gtp_ready_time) * 1000
+                write_log(f"✅ KataGo 已就緒。啟動耗時 {total_ms:.1f} ms：進程建立 {spawn_ms:.1f} ms，"
+                          f"模型載入 {load_ms:.1f} ms，第一個回應 {first_response_ms:.1f} ms。")
+            else:
+                write_log(f"✅ KataGo 已就緒 (未偵測到 'GTP ready' 訊息)。啟動耗時 {total_ms:.1f} ms：進程建立 {spawn_ms:.1f} ms，"
+                          f"模型載入與第一個回應 {total_ms - spawn_ms:.1f} ms。")
+            self.startup_timing_ms = {"spawn": spawn_ms, "total": total_ms}
+            return True
 
         except Exception as e:
             write_log(f"啟動失敗: {e}")
             self.process = None
             raise
 
-    def send_command(self, command):
+    def send_command_async(self, command):
+        """
+        送出單一指令但不等待回應。
+        返回等待物件，呼叫其 wait(timeout) 取得回應；若送出失敗返回 None。
+        """
+        pending_list = self._send_pipelined([command])
+        return pending_list[0] if pending_list else None
+
+    def _send_pipelined(self, commands):
+        """為每個指令加上 GTP 指令 ID，並以單次寫入送出整批指令"""
         if not self.process or self.process.poll() is not None:
             write_log("錯誤：KataGo 未啟動或已終止。")
             return None
 
-        full_command = command.strip() + "\n"
-        write_log(f"-> 發送指令: '{full_command.strip()}'")
         try:
-            self.process.stdin.write(full_command)
-            self.process.stdin.flush()
-            write_log(f"指令 '{command.strip()}' 已成功發送到 KataGo stdin。")
+            # 分配 ID、加入等待表和寫入 stdin 必須是原子操作
+            with self._stdin_lock:
+                pending_list = []
+                lines = []
+                with self._pending_lock:
+                    for command in commands:
+                        command = command.strip()
+                        command_id = self._next_command_id
+                        self._next_command_id += 1
+                        pending = _PendingCommand(command, command_id, self._discard_pending)
+                        self._pending_commands[command_id] = pending
+                        pending_list.append(pending)
+                        lines.append(f"{command_id} {command}\n")
+                        write_log(f"-> 發送指令: '{command_id} {command}'", DEBUG)
+                sent_time = time.perf_counter()
+                for pending in pending_list:
+                    pending.sent_time = sent_time
+                self.process.stdin.write("".join(lines))
+                self.process.stdin.flush()
         except Exception as e:
             write_log(f"錯誤寫入 stdin: {e}")
+            with self._pending_lock:
+                for pending in pending_list:
+                    self._pending_commands.pop(pending.command_id, None)
             return None
+        return pending_list
 
-        # 清空佇列，準備接收新回應
-        while not self.stdout_queue.empty():
-            try:
-                self.stdout_queue.get_nowait()
-            except queue.Empty:
-                break
-        while not self.stderr_queue.empty():
-            try:
-                self.stderr_queue.get_nowait()
-            except queue.Empty:
-                break
-        write_log("已清空 stdout/stderr 佇列，準備接收新回應。")
+    def send_command(self, command):
+        pending = self.send_command_async(command)
+        if pending is None:
+            return None
 
-        response_lines = []
-        is_genmove_like = command.strip().lower().startswith("genmove")
-        timeout = 120 if is_genmove_like else 10
-        start_time = time.time()
-        move_from_stderr = None # 專門用於 genmove 的 stderr fallback
-        response_started = False
-        
-        write_log(f"開始等待指令 '{command.strip()}' 的回應，超時設定為 {timeout} 秒。")
+        timeout = 120 if pending.is_genmove_like else 10
+        write_log(f"開始等待指令 '{pending.command}' 的回應，超時設定為 {timeout} 秒。", DEBUG)
 
-        while True:
-            current_time = time.time()
-            # 優先檢查超時
-            if current_time - start_time > timeout:
-                write_log(f"錯誤：KataGo 回覆超時 ({timeout}秒)。目前從佇列收到回應內容：\n{os.linesep.join(response_lines)}")
-                # 超時時，如果已經開始接收回應，則返回已接收的內容，讓 parse_response 處理
-                if response_started:
-                    write_log("已開始接收回應，但在超時時未收到結束標誌，返回部分回應。")
-                    return "\n".join(response_lines)
-                
-                # 如果是 genmove 且沒有收到 stdout 回應，檢查 stderr 佇列是否有結果
-                if is_genmove_like and not response_lines:
-                    temp_stderr_lines = []
-                    while not self.stderr_queue.empty():
-                        temp_stderr_lines.append(self.stderr_queue.get_nowait())
-                    
-                    for line in temp_stderr_lines:
-                        if "= " in line:
-                            try:
-                                move = line.split("= ", 1)[1].split()[0]
-                                if len(move) > 1 and 'A' <= move[0].upper() <= 'T' and move[1:].isdigit():
-                                    write_log(f"在 STDERR 佇列中找到落子結果 (超時): {move}")
-                                    return f"= {move}\n\n"
-                            except Exception as e:
-                                write_log(f"解析 STDERR 中的落子結果失敗 (超時): {e}")
-                        write_log(f"[超時時 STDERR]: {line}")
-                    for line in temp_stderr_lines:
-                        self.stderr_queue.put(line)
-
-                return None
-
-            # 檢查 KataGo 進程是否已終止
-            if self.process.poll() is not None:
+        # 阻塞等待讀取線程喚醒，不佔用 CPU
+        response = pending.wait(timeout)
+        if response is None:
+            if pending.done.is_set():
                 write_log("KataGo 進程已終止，停止等待回應。")
-                if response_started:
-                    return "\n".join(response_lines)
-
-                if is_genmove_like and not response_lines:
-                    temp_stderr_lines = []
-                    while not self.stderr_queue.empty():
-                        temp_stderr_lines.append(self.stderr_queue.get_nowait())
-                    for line in temp_stderr_lines:
-                        if "= " in line:
-                            try:
-                                move = line.split("= ", 1)[1].split()[0]
-                                if len(move) > 1 and 'A' <= move[0].upper() <= 'T' and move[1:].isdigit():
-                                    write_log(f"在 STDERR 佇列中找到落子結果 (進程終止): {move}")
-                                    return f"= {move}\n\n"
-                            except Exception as e:
-                                write_log(f"解析 STDERR 中的落子結果失敗 (進程終止): {e}")
-                        write_log(f"[進程終止時 STDERR]: {line}")
-                    for line in temp_stderr_lines:
-                        self.stderr_queue.put(line)
-                return None
-
-
-            # 從 stdout 佇列讀取內容
-            try:
-                line = self.stdout_queue.get_nowait()
-                
-                # 新的 GTP 回應結束判斷邏輯
-                # 只要收到以 '=' 或 '?' 開頭的行，就認為這個命令的回應結束了
-                # 這是為了適應 KataGo 不發送空行結束標誌的情況
-                if line.strip().startswith(('=', '?')): 
-                    response_started = True # 確保標記為已開始回應
-                    response_lines.append(line)
-                    write_log(f"在 STDOUT 中找到 GTP 回應的主要部分: '{line.strip()}'，停止等待。")
-                    return "\n".join(response_lines)
-                elif response_started and line == "": # 如果收到空行，則按標準 GTP 結束
-                    response_lines.append(line)
-                    write_log("✅ 偵測到 GTP 回應結束（空白行）")
-                    return "\n".join(response_lines)
-                elif response_started: # 如果已經開始回應，但不是結束標誌，則繼續收集
-                    response_lines.append(line)
-                # 如果還沒開始回應 (response_started = False)，且不是 '='/'?' 開頭，就忽略這些行，繼續等待
-
-            except queue.Empty:
-                pass
-
-            # 從 stderr 佇列讀取內容
-            try:
-                err_line = self.stderr_queue.get_nowait()
-                
-                # genmove 的 stderr fallback 邏輯
-                if is_genmove_like and "= " in err_line:
-                    try:
-                        move = err_line.split("= ", 1)[1].split()[0]
-                        if len(move) > 1 and 'A' <= move[0].upper() <= 'T' and move[1:].isdigit():
-                            move_from_stderr = move
-                            write_log(f"在 STDERR 佇列中找到潛在落子結果: {move}")
-                            if not response_lines: # 如果 stdout 沒有任何回應，使用 stderr 結果
-                                write_log(f"STDOUT 無回應，使用 STDERR 落子結果: {move}")
-                                return f"= {move}\n\n"
-                    except Exception as e:
-                        write_log(f"解析 STDERR 中的潛在落子結果失敗: {e}")
-                elif err_line.strip(): # 記錄所有非空行的 stderr 輸出
-                    # 為了偵錯，我們只記錄到日誌
-                    pass
+            return None
+
+        self.last_latency_ms = (pending.done_time - pending.sent_time) * 1000
+        write_log(f"指令 '{pending.command}' 回應耗時 {self.last_latency_ms:.3f} ms。", DEBUG)
+        return response
+
+    def send_commands(self, commands):
+        """
+        管線化送出一批指令 (例如恢復棋局時重播整盤的 play)，只需要一次往返。
+        返回與 commands 順序相同的原始回應列表，未收到回應的位置為 None。
+        """
+        commands = list(commands)
+        if not commands:
+            return []
+        pending_list = self._send_pipelined(commands)
+        if pending_list is None:
+            return [None] * len(commands)
+
+        # 整批共用一個截止時間，避免逐一等待時超時累加
+        timeout = 120 if any(p.is_genmove_like for p in pending_list) else 10
+        deadline = time.perf_counter() + timeout
+        responses = [pending.wait(max(0.0, deadline - time.perf_counter())) for pending in pending_list]
+
+        self.last_latency_ms = (max(p.done_time or deadline for p in pending_list) - pending_list[0].sent_time) * 1000
+        write_log(f"管線化送出 {len(commands)} 個指令，總耗時 {self.last_latency_ms:.3f} ms。")
+        return responses
+
+    def replay_moves(self, moves, board_size=19, komi=None):
+        """
+        在 KataGo 中重建棋局：boardsize、clear_board、(komi) 和所有 play 以單一批次送出。
+        moves 為 (color, vertex) 的序列，例如 [("B", "D4"), ("W", "Q16")]。
+        全部成功時返回 True。
+        """
+        commands = build_replay_commands(moves, board_size, komi)
+        responses = self.send_commands(commands)
+        for command, response in zip(commands, responses):
+            if self.parse_response(response)['status'] != 'success':
+                write_log(f"錯誤：重播棋局時指令 '{command}' 失敗，回應: {response}")
+                return False
+        write_log(f"✅ 已重播 {len(moves)} 手棋。")
+        return True
+
+
+    def analyze(self, interval_centiseconds=10, max_visits=None, max_time=None,
+                command="kata-analyze", color=None, ownership=False):
+        """
+        送出 kata-analyze (或 lz-analyze) 並以生成器逐次產生解析後的分析結果：
+          {"moves": [...], "ownership": ..., "elapsed": 秒, "visits": 最佳手的訪問數}
+        moves 中每個候選手為 dict，例如 {"move": "D4", "visits": 120, "winrate": 0.54, "pv": [...]}。
+
+        最佳手訪問數達到 max_visits、分析時間達到 max_time 秒、呼叫 stop_analysis()，
+        或呼叫端提前結束迭代 (break / close()) 時，會送出 stop 指令並等待分析結束。
+        """
+        lz_format = command == "lz-analyze"
+        analysis_queue = queue.Queue()
+        with self._pending_lock:
+            if self._analysis_queue is not None:
+                write_log("錯誤：已有分析正在進行，無法同時開始新的分析。")
+                return
+            self._analysis_queue = analysis_queue
+
+        args = [command]
+        if color:
+            args.append(color)
+        args.append(f"interval {interval_centiseconds}")
+        if ownership and not lz_format:
+            args.append("ownership true")
+
+        try:
+            response = self.send_command(" ".join(args))
+            parsed = self.parse_response(response)
+            if parsed['status'] != 'success':
+                write_log(f"錯誤：無法開始分析：{parsed['content']}")
+                return
+
+            write_log(f"開始串流分析 (每 {interval_centiseconds / 100:.2f} 秒更新，max_visits={max_visits}, max_time={max_time})。")
+            start_time = time.perf_counter()
+            poll_timeout = max(0.05, interval_centiseconds / 100)
+            while True:
+                elapsed = time.perf_counter() - start_time
+                if max_time is not None and elapsed >= max_time:
+                    write_log(f"分析達到時間上限 {max_time} 秒，停止分析。")
+                    break
+                wait_time = poll_timeout if max_time is None else min(poll_timeout, max_time - elapsed)
+                try:
+                    line = analysis_queue.get(timeout=wait_time)
+                except queue.Empty:
+                    continue
+                if line is None:
+                    write_log("分析已被取消或 KataGo 進程已終止。")
+                    break
 
-            except queue.Empty:
-                pass
+                snapshot = parse_analysis_line(line, lz_format)
+                if not snapshot["moves"]:
+                    continue
+                snapshot["elapsed"] = time.perf_counter() - start_time
+                snapshot["visits"] = snapshot["moves"][0].get("visits", 0)
+                yield snapshot
 
-            time.sleep(0.01)
+                if max_visits is not None and snapshot["visits"] >= max_visits:
+                    write_log(f"最佳手 {snapshot['moves'][0].get('move')} 訪問數達到 {max_visits}，停止分析。")
+                    break
+        finally:
+            self._finish_analysis()
 
-        write_log(f"指令 '{command.strip()}' 回應循環異常結束，返回內容:\n'{os.linesep.join(response_lines)}'")
-        return "\n".join(response_lines)
+    def stop_analysis(self):
+        """從其他線程要求結束進行中的 analyze() (生成器會送出 stop 並結束)"""
+        analysis_queue = self._analysis_queue
+        if analysis_queue is not None:
+            analysis_queue.put(None)
 
+    def _finish_analysis(self):
+        """送出 stop 指令；收到回應表示 KataGo 已結束分析，之後不再轉送 info 行"""
+        if self.process and self.process.poll() is None:
+            self.send_command("stop")
+        with self._pending_lock:
+            self._analysis_queue = None
+        write_log("串流分析已結束。")
+
+    def start_ponder(self, color=None, max_visits=None, max_time=None, interval_centiseconds=50):
+        """
+        在背景線程中分析目前局面 (例如人類思考時)，預算為 max_visits 次訪問或 max_time 秒。
+        KataGo 會保留搜尋樹，對手落子後的 genmove 可以重用對應的子樹。
+        """
+        if self._ponder_thread and self._ponder_thread.is_alive():
+            write_log("背景思考已在進行中。")
+            return
+        self._ponder_cancel.clear()
+        self._ponder_stats = {"visits": 0, "elapsed": 0.0, "best_move": None, "winrate": None}
+
+        def run():
+            for snapshot in self.analyze(interval_centiseconds=interval_centiseconds, max_visits=max_visits,
+                                         max_time=max_time, color=color):
+                best = snapshot["moves"][0]
+                self._ponder_stats.update(visits=snapshot["visits"], elapsed=snapshot["elapsed"],
+                                          best_move=best.get("move"), winrate=best.get("winrate"))
+                if self._ponder_cancel.is_set():
+                    break
+
+        write_log(f"開始背景思考 (預算: max_visits={max_visits}, max_time={max_time})。")
+        self._ponder_thread = threading.Thread(target=run, daemon=True)
+        self._ponder_thread.start()
+
+    def stop_ponder(self):
+        """結束背景思考並返回統計 (visits、elapsed、best_move、winrate)；沒有背景思考時返回 None"""
+        if self._ponder_thread is None:
+            return None
+        self._ponder_cancel.set()
+        while self._ponder_thread.is_alive():
+            # 分析可能尚未開始，重複發出取消直到線程結束
+            self.stop_analysis()
+            self._ponder_thread.join(timeout=0.05)
+        self._ponder_thread = None
+        stats = self._ponder_stats
+        write_log(f"背景思考結束：{stats['visits']} 次訪問，{stats['elapsed']:.2f} 秒，目前最佳手 {stats['best_move']}。")
+        return stats
 
     def parse_response(self, response):
-        if response is None:
-            write_log("解析回應時，輸入為 None。")
-            return {"status": "error", "content": "無回應"}
-        
-        write_log(f"開始解析回應:\n'{response.strip()}'")
-        lines = response.strip().split('\n')
-        if lines and lines[-1] == "":
-            lines.pop()
-
-        for i, line in enumerate(lines):
-            if line.startswith('='):
-                content = "\n".join([line[1:].strip()] + lines[i+1:]).strip()
-                write_log(f"解析結果: 成功，內容: '{content}'")
-                return {"status": "success", "content": content}
-            elif line.startswith('?'):
-                content = "\n".join([line[1:].strip()] + lines[i+1:]).strip()
-                write_log(f"解析結果: 錯誤，內容: '{content}'")
-                return {"status": "error", "content": content}
-        write_log(f"解析結果: 資訊，內容: '{response.strip()}'")
-        return {"status": "info", "content": response.strip()}
+        return parse_gtp_response(response)
 
     def stop_katago(self):
         if self.process and self.process.poll() is None:
             write_log("嘗試停止 KataGo 進程。")
             try:
+                with self._stdin_lock:
+                    self.process.stdin.write("quit\n")
+                    self.process.stdin.flush()
+                self.process.wait(timeout=5)
+
+                # 讀取線程為阻塞式，進程結束後管道關閉才會退出，因此在 quit 之後再等待
                 self._stop_io_thread.set()
-                if self.io_thread and self.io_thread.is_alive():
-                    self.io_thread.join(timeout=2)
-                    if self.io_thread.is_alive():
+                for thread in self.io_threads:
+                    thread.join(timeout=2)
+                    if thread.is_alive():
                         write_log("警告: I/O 線程未能完全終止。")
-                
-                self.process.stdin.write("quit\n")
-                self.process.stdin.flush()
-                self.process.wait(timeout=5)
                 write_log("KataGo 正常結束。")
             except Exception as e:
                 write_log(f"停止 KataGo 時發生錯誤，嘗試強制終止: {e}")
@@ -0,0 +1,166 @@
+# katago_pool.py
+import threading
+import time
+from _shared_utils import write_log # 從共用工具導入日誌功能
+from katago_gtp import KataGoGTP, GameRecord, STARTUP_TIMEOUT
+
+class KataGoPool:
+    """
+    維持一個使用中的 KataGo 進程和一個已載入模型的備用進程。
+    使用中的進程崩潰或被重啟時，把目前棋局重播到備用進程並立即切換，
+    不需要等待模型重新載入；切換後在背景啟動新的備用進程。
+    對外介面與 KataGoGTP 相同，main_game_loop.py 可以直接替換使用。
+    """
+    def __init__(self, katago_path=None, model_path=None, config_path=None):
+        self._client_args = (katago_path, model_path, config_path)
+        self.active = KataGoGTP(*self._client_args) # 在這裡檢查檔案路徑，與 KataGoGTP 相同
+        self.standby = None
+        self._standby_thread = None
+        self._standby_lock = threading.Lock()
+        self._swap_lock = threading.RLock()
+        self._stopped = False
+
+        # 目前棋局狀態，切換進程時用來重播
+        self.game = GameRecord()
+        self.failover_count = 0
+        self.last_failover_ms = None
+        write_log("KataGoPool 實例化 (熱備援模式)。")
+
+    def start_katago(self):
+        self._stopped = False
+        if not self.active.start_katago():
+            return False
+        self._start_standby_async()
+        return True
+
+    def _start_standby_async(self):
+        """在背景啟動並預熱備用進程"""
+        def run():
+            client = KataGoGTP(*self._client_args)
+            try:
+                ready = client.start_katago()
+            except Exception as e:
+                write_log(f"備用 KataGo 啟動失敗: {e}")
+                return
+            with self._standby_lock:
+                if ready and not self._stopped:
+                    self.standby = client
+                    write_log("✅ 備用 KataGo 進程已預熱完成。")
+                    return
+            client.stop_katago()
+
+        with self._standby_lock:
+            if self._standby_thread and self._standby_thread.is_alive():
+                return
+            self._standby_thread = threading.Thread(target=run, daemon=True)
+            self._standby_thread.start()
+
+    def _take_standby(self, timeout):
+        """取出備用進程；若仍在預熱則最多等待 timeout 秒"""
+        thread = self._standby_thread
+        if thread and thread.is_alive():
+            write_log("備用 KataGo 仍在載入模型，等待中...")
+            thread.join(timeout)
+        with self._standby_lock:
+            standby, self.standby = self.standby, None
+        if standby is not None and (not standby.process or standby.process.poll() is not None):
+            write_log("警告: 備用 KataGo 進程已終止，無法使用。")
+            standby = None
+        return standby
+
+    def _is_active_alive(self):
+        process = self.active.process
+        return process is not None and process.poll() is None
+
+    def failover(self):
+        """把棋局重播到備用進程並切換為使用中；沒有可用的備用進程時冷啟動一個新的"""
+        with self._swap_lock:
+            swap_start = time.perf_counter()
+            standby = self._take_standby(STARTUP_TIMEOUT)
+            if standby is None:
+                write_log("沒有可用的備用進程，冷啟動新的 KataGo。")
+                standby = KataGoGTP(*self._client_args)
+                if not standby.start_katago():
+                    write_log("錯誤：冷啟動 KataGo 失敗。")
+                    standby.stop_katago()
+                    return False
+
+            if not standby.replay_moves(self.game.moves, self.game.board_size, self.game.komi):
+                write_log("錯誤：無法在備用進程中重播棋局。")
+                standby.stop_katago()
+                return False
+
+            old_client, self.active = self.active, standby
+            old_client.stop_katago()
+            self.failover_count += 1
+            self.last_failover_ms = (time.perf_counter() - swap_start) * 1000
+            write_log(f"✅ 已切換到備用 KataGo 進程 (第 {self.failover_count} 次)，重播 {len(self.game.moves)} 手，"
+                      f"耗時 {self.last_failover_ms:.1f} ms。")
+            self._start_standby_async()
+            return True
+
+    def restart_katago(self):
+        """停止使用中的進程並切換到備用進程 (例如定期重啟以釋放記憶體)"""
+        write_log("重啟 KataGo：停止使用中的進程並切換到備用進程。")
+        self.active.stop_katago()
+        return self.failover()
+
+    def _record_command(self, command, response):
+        """記錄會改變棋局狀態的成功指令，供切換進程時重播"""
+        self.game.record(command, self.active.parse_response(response))
+
+    def send_command(self, command):
+        response = self.active.send_command(command)
+        if response is None and not self._is_active_alive():
+            write_log("偵測到 KataGo 進程已終止，切換到備用進程後重送指令。")
+            if self.failover():
+                response = self.active.send_command(command)
+        if response is not None:
+            self._record_command(command.strip(), response)
+        return response
+
+    def send_commands(self, commands):
+        commands = list(commands)
+        responses = self.active.send_commands(commands)
+        if None in responses and not self._is_active_alive():
+            write_log("偵測到 KataGo 進程已終止，切換到備用進程後重送未完成的指令。")
+            # 先記錄已成功的指令，重播時才會包含
+            for command, response in zip(commands, responses):
+                if response is None:
+                    break
+                self._record_command(command.strip(), response)
+            done = next(i for i, response in enumerate(responses) if response is None)
+            if self.failover():
+                responses = responses[:done] + self.active.send_commands(commands[done:])
+                for command, response in zip(commands[done:], responses[done:]):
+                    if response is not None:
+                        self._record_command(command.strip(), response)
+            return responses
+        for command, response in zip(commands, responses):
+            if response is not None:
+                self._record_command(command.strip(), response)
+        return responses
+
+    def replay_moves(self, moves, board_size=19, komi=None):
+        ok = self.active.replay_moves(moves, board_size, komi)
+        if ok:
+            self.game.board_size, self.game.komi, self.game.moves = board_size, komi, list(moves)
+        return ok
+
+    def parse_response(self, response):
+        return self.active.parse_response(response)
+
+    def __getattr__(self, name):
+        # 其他功能 (analyze、start_ponder、stop_ponder 等) 直接交給使用中的進程
+        if name == "active":
+            raise AttributeError(name)
+        return getattr(self.active, name)
+
+    def stop_katago(self):
+        # 仍在預熱的備用進程不需要等待，載入完成後背景線程看到 _stopped 會自行停止
+        with self._standby_lock:
+            self._stopped = True
+            standby, self.standby = self.standby, None
+        if standby:
+            standby.stop_katago()
+        self.active.stop_katago()
@@ -0,0 +1,269 @@
+# katago_server.py
+# 多棋盤引擎服務：一個 KataGo 分析引擎進程 (只載入一次模型) 服務多台機械人棋桌。
+# 每台棋桌以 TCP 連線到服務並使用一般的 GTP 指令，每條連線就是一盤獨立的棋局 (katago_analysis.AnalysisSession)。
+# 各棋桌的 genmove 是以 id 區分的並行分析查詢，同時在引擎中搜尋，KataGo 會把不同棋桌的神經網路評估
+# 合併成同一批次；分析引擎配置的 numAnalysisThreads 應不小於棋桌數，否則多出的查詢會排隊。
+# 啟動服務 (在 src 目錄下執行):
+#   python katago_server.py --port 5055
+# 棋桌端設定 KATAGO_SERVER=127.0.0.1:5055 後執行 main_game_loop.py 即可改用 KataGoRemoteGTP。
+import argparse
+import socket
+import socketserver
+import threading
+import time
+from _shared_utils import write_log # 從共用工具導入日誌功能
+from katago_gtp import GTP_RESPONSE_PATTERN, build_replay_commands, parse_gtp_response
+from katago_analysis import KataGoAnalysis, AnalysisSession
+
+DEFAULT_SERVER_PORT = 5055
+# 共用引擎無法支援的指令 (GTP 的長時間分析輸出)
+UNSUPPORTED_COMMANDS = ("kata-analyze", "lz-analyze", "analyze", "stop")
+
+
+class _GameSession:
+    """一條棋桌連線：自己的棋局 (共用引擎的 AnalysisSession) 和回寫 socket"""
+    def __init__(self, session_id, engine, wfile):
+        self.session_id = session_id
+        self.analysis = AnalysisSession(engine)
+        self.wfile = wfile
+        self._write_lock = threading.Lock()
+        self.closed = False
+
+    def reply(self, client_id, parsed):
+        prefix = "=" if parsed['status'] == 'success' else "?"
+        content = parsed['content']
+        text = f"{prefix}{client_id or ''} {content}".rstrip() + "\n\n"
+        with self._write_lock:
+            if self.closed:
+                return
+            try:
+                self.wfile.write(text.encode("utf-8"))
+                self.wfile.flush()
+            except OSError as e:
+                write_log(f"[Server] 棋局 {self.session_id} 回寫失敗: {e}")
+                self.closed = True
+
+
+class KataGoEngineServer:
+    """
+    以單一 KataGoAnalysis 進程服務多盤棋。
+    每條連線的線程依序執行自己這盤棋的指令：play 等只更新該盤棋的記錄，genmove 送出一個分析查詢。
+    不同棋桌的查詢同時在引擎中進行，互不等待，也不需要在引擎中切換或重建棋局。
+    """
+    def __init__(self, host="127.0.0.1", port=DEFAULT_SERVER_PORT, katago_path=None, model_path=None, config_path=None):
+        self.address = (host, port)
+        self.engine = KataGoAnalysis(katago_path, model_path, config_path)
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+        self._next_session_id = 1
+        self._tcp_server = None
+        self._genmoves_in_flight = 0
+        self.peak_genmoves_in_flight = 0 # 同時在引擎中搜尋的 genmove 最大數量
+        write_log("KataGoEngineServer 實例化。")
+
+    def start(self):
+        if not self.engine.start_katago():
+            write_log("[Server] KataGo 啟動失敗，服務無法啟動。")
+            return False
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                server._handle_connection(self.rfile, self.wfile)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._tcp_server = socketserver.ThreadingTCPServer(self.address, Handler)
+        self._tcp_server.daemon_threads = True
+        self.address = self._tcp_server.server_address
+        threading.Thread(target=self._tcp_server.serve_forever, daemon=True).start()
+        write_log(f"[Server] 引擎服務已在 {self.address[0]}:{self.address[1]} 上啟動。")
+        return True
+
+    def stop(self):
+        if self._tcp_server:
+            self._tcp_server.shutdown()
+            self._tcp_server.server_close()
+        self.engine.stop_katago()
+        write_log(f"[Server] 引擎服務已停止，最多同時進行 {self.peak_genmoves_in_flight} 個 genmove 查詢。")
+
+    def _handle_connection(self, rfile, wfile):
+        with self._sessions_lock:
+            session = _GameSession(self._next_session_id, self.engine, wfile)
+            self._next_session_id += 1
+            self._sessions.append(session)
+            count = len(self._sessions)
+        write_log(f"[Server] 棋局 {session.session_id} 已連線，目前共 {count} 盤棋。")
+        try:
+            for raw_line in rfile:
+                line = raw_line.decode("utf-8").strip()
+                if not line:
+                    continue
+                parts = line.split(None, 1)
+                client_id = None
+                if parts[0].isdigit():
+                    client_id = parts[0]
+                    line = parts[1] if len(parts) > 1 else ""
+                if not line:
+                    # 只有 ID 沒有指令
+                    session.reply(client_id, {"status": "error", "content": "empty command"})
+                    continue
+                name = line.split()[0].lower()
+
+                if name == "quit":
+                    session.reply(client_id, {"status": "success", "content": ""})
+                    break
+                if name in UNSUPPORTED_COMMANDS:
+                    session.reply(client_id, {"status": "error", "content": "not supported by shared engine server"})
+                    continue
+                session.reply(client_id, self._execute(session, line))
+        finally:
+            with self._sessions_lock:
+                session.closed = True
+                self._sessions.remove(session)
+                count = len(self._sessions)
+            write_log(f"[Server] 棋局 {session.session_id} 已斷線，剩餘 {count} 盤棋。")
+
+    def _execute(self, session, command):
+        """在這條連線的線程中執行一個指令，genmove 會阻塞到分析結果返回 (其他棋桌不受影響)"""
+        is_genmove = command.split()[0].lower() == "genmove"
+        if is_genmove:
+            with self._sessions_lock:
+                self._genmoves_in_flight += 1
+                self.peak_genmoves_in_flight = max(self.peak_genmoves_in_flight, self._genmoves_in_flight)
+        try:
+            response = session.analysis.send_command(command)
+        except Exception as e:
+            # 單一指令的錯誤不能結束連線線程，否則這台棋桌會停止回應
+            write_log(f"[Server] 錯誤：執行棋局 {session.session_id} 的指令 '{command}' 時發生例外: {e}")
+            return {"status": "error", "content": "internal server error"}
+        finally:
+            if is_genmove:
+                with self._sessions_lock:
+                    self._genmoves_in_flight -= 1
+        if response is None:
+            write_log(f"[Server] 錯誤：棋局 {session.session_id} 的指令 '{command}' 未收到分析引擎的回應。")
+            return {"status": "error", "content": "engine unavailable"}
+        return parse_gtp_response(response)
+
+
+class KataGoRemoteGTP:
+    """
+    KataGoEngineServer 的棋桌端用戶端，對外介面與 KataGoGTP 相同。
+    共用引擎不支援背景思考，start_ponder / stop_ponder 為空操作。
+    """
+    def __init__(self, address):
+        host, _, port = address.rpartition(":")
+        self.address = (host or "127.0.0.1", int(port))
+        self.sock = None
+        self._buffer = b""
+        self._lock = threading.Lock()
+        self._next_command_id = 1
+        self.last_latency_ms = None
+        write_log(f"KataGoRemoteGTP 實例化，引擎服務位址 {self.address[0]}:{self.address[1]}。")
+
+    def start_katago(self):
+        try:
+            self.sock = socket.create_connection(self.address, timeout=10)
+        except OSError as e:
+            write_log(f"錯誤：無法連線到引擎服務 {self.address}: {e}")
+            return False
+        self._buffer = b""
+        ok = self.parse_response(self.send_command("protocol_version"))['status'] == 'success'
+        write_log("✅ 已連線到引擎服務。" if ok else "錯誤：引擎服務未回應。")
+        return ok
+
+    def send_command(self, command):
+        return self.send_commands([command])[0]
+
+    def send_commands(self, commands):
+        commands = [command.strip() for command in commands]
+        if not commands:
+            return []
+        if self.sock is None:
+            write_log("錯誤：尚未連線到引擎服務。")
+            return [None] * len(commands)
+
+        # 與 KataGoGTP 相同的超時：一般指令 10 秒、genmove 120 秒 (包含引擎分析執行緒都在忙時的排隊時間)
+        timeout = 120 if any(command.lower().startswith("genmove") for command in commands) else 10
+        with self._lock:
+            ids = list(range(self._next_command_id, self._next_command_id + len(commands)))
+            self._next_command_id += len(commands)
+            start = time.perf_counter()
+            deadline = start + timeout
+            responses = {}
+            try:
+                self.sock.sendall("".join(f"{i} {command}\n" for i, command in zip(ids, commands)).encode("utf-8"))
+                while len(responses) < len(ids):
+                    line = self._readline(deadline)
+                    if not line:
+                        write_log("錯誤：引擎服務已關閉連線。")
+                        break
+                    match = GTP_RESPONSE_PATTERN.match(line.strip())
+                    if match is None or not match.group(2) or int(match.group(2)) not in ids:
+                        continue # 空行或先前超時指令遲到的回應
+                    content = match.group(3).strip()
+                    responses[int(match.group(2))] = f"{match.group(1)} {content}" if content else match.group(1)
+            except TimeoutError:
+                write_log(f"錯誤：引擎服務回覆超時 ({timeout}秒)，{len(ids) - len(responses)} 個指令未收到回應: {commands}")
+                return [responses.get(i, "? timeout") for i in ids]
+            except OSError as e:
+                write_log(f"錯誤：與引擎服務通訊失敗: {e}")
+                return [None] * len(commands)
+            self.last_latency_ms = (time.perf_counter() - start) * 1000
+        return [responses.get(i) for i in ids]
+
+    def _readline(self, deadline):
+        """讀取一行回應 (需持有 _lock)；超過 deadline 時拋出 TimeoutError，連線關閉時返回空字串"""
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError
+            self.sock.settimeout(remaining)
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                return ""
+            self._buffer += chunk
+        line, _, self._buffer = self._buffer.partition(b"\n")
+        return line.decode("utf-8") + "\n"
+
+    def replay_moves(self, moves, board_size=19, komi=None):
+        responses = self.send_commands(build_replay_commands(moves, board_size, komi))
+        return all(self.parse_response(response)['status'] == 'success' for response in responses)
+
+    def parse_response(self, response):
+        return parse_gtp_response(response)
+
+    def start_ponder(self, *args, **kwargs):
+        pass
+
+    def stop_ponder(self):
+        return None
+
+    def stop_katago(self):
+        if self.sock is None:
+            return
+        try:
+            self.send_command("quit")
+            self.sock.close()
+        except OSError:
+            pass
+        self.sock = None
+        write_log("已中斷與引擎服務的連線。")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多棋盤 KataGo 引擎服務")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_SERVER_PORT)
+    args = parser.parse_args()
+
+    engine_server = KataGoEngineServer(args.host, args.port)
+    if not engine_server.start():
+        exit(1)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        write_log("用戶手動停止引擎服務。")
+    finally:
+        engine_server.stop()
@@ -1,12 +1,40 @@
 # main_game_loop.py
+import json
+import os
 import sys
 import time
 import cv2 # 為了 cv2.waitKey 和 cv2.destroyAllWindows
 from _shared_utils import write_log # 從共用工具導入日誌功能
 from katago_gtp import KataGoGTP # 導入 KataGoGTP 類別
+from katago_pool import KataGoPool # 導入熱備援進程池
+from katago_server import KataGoRemoteGTP # 導入多棋盤引擎服務的用戶端
+from katago_analysis import KataGoAnalysis # 導入 JSON 分析引擎後端
 from robot_controller import RobotArmController, gtp_to_robot_coords # 導入機械臂控制器和座標轉換函數
 from vision_system import VisionSystem # 導入視覺系統
 
+# --- 背景思考 (ponder) 設定 ---
+# 人類思考時讓 KataGo 分析目前局面，落子後 genmove 可重用搜尋樹。設定 KATAGO_PONDER=0 可關閉以量測基準。
+PONDER_ENABLED = os.getenv("KATAGO_PONDER", "1") != "0"
+PONDER_MAX_VISITS = int(os.getenv("KATAGO_PONDER_MAX_VISITS", "20000")) # 背景思考的訪問數預算
+PONDER_MAX_TIME = float(os.getenv("KATAGO_PONDER_MAX_TIME", "120")) # 背景思考的時間預算 (秒)
+
+# 預先取子：人類落子確認後、KataGo 思考期間，機械臂先吸取白子並停在棋盤中心上方。設定 ROBOT_PREFETCH=0 可關閉以量測基準。
+PREFETCH_ENABLED = os.getenv("ROBOT_PREFETCH", "1") != "0"
+
+# 熱備援：額外維持一個已載入模型的 KataGo 進程，崩潰時亞秒級恢復 (需要兩倍的模型記憶體)
+HOT_STANDBY_ENABLED = os.getenv("KATAGO_HOT_STANDBY", "0") == "1"
+
+# 多棋盤共用引擎：設定為 "host:port" 時連線到 katago_server.py，而不是自己啟動 KataGo
+KATAGO_SERVER_ADDRESS = os.getenv("KATAGO_SERVER")
+
+# KataGo 後端："gtp" (預設，KataGoGTP) 或 "analysis" (KataGoAnalysis，JSON 分析引擎)
+KATAGO_BACKEND = os.getenv("KATAGO_BACKEND", "gtp").lower()
+
+# 無顯示器的生產環境：設定 VISION_HEADLESS=1 時不建立任何 OpenCV 視窗，改以定期的視覺指標日誌取代預覽畫面。
+# 參數來自校準檔，可用 VISION_PARAMS 覆寫，例如 VISION_PARAMS='{"camera_index": 1, "black_stone_diff": -40}'
+VISION_HEADLESS = os.getenv("VISION_HEADLESS", "0") == "1"
+VISION_PARAMETER_OVERRIDES = json.loads(os.getenv("VISION_PARAMS", "{}"))
+
 # --- 遊戲主循環 ---
 if __name__ == "__main__":
     katago_client = None
@@ -21,20 +49,31 @@ if __name__ == "__main__":
     turn_count = 0
     consecutive_passes = 0 # 追蹤連續 pass 的次數，兩個 pass 則遊戲結束
 
+    # 背景思考統計：每手 genmove 的耗時，依是否有背景思考分開記錄
+    last_ponder_stats = None
+    genmove_times = {"ponder": [], "no_ponder": []}
+    prefetch_savings = [] # 每手預先取子節省的時間 (秒)
+
     # 模擬棋盤的內部狀態，將來會由視覺系統更新
     board_state = {} 
 
     try:
-        katago_client = KataGoGTP(
-            # 如果需要，在這裡設定您的 KataGo 路徑，例如:
-            # katago_path="/Users/suying-chu/Downloads/katago/KataGo-mac-arm64/katago",
-            # model_path="/Users/suying-chu/Downloads/katago/KataGo-mac-arm64/models/kata100.bin.gz",
-            # config_path="/Users/suying-chu/Downloads/katago/KataGo-mac-arm64/gtp_config.cfg"
-        )
+        if KATAGO_SERVER_ADDRESS:
+            katago_client = KataGoRemoteGTP(KATAGO_SERVER_ADDRESS)
+        elif KATAGO_BACKEND == "analysis":
+            katago_client = KataGoAnalysis()
+        else:
+            katago_class = KataGoPool if HOT_STANDBY_ENABLED else KataGoGTP
+            katago_client = katago_class(
+                # 如果需要，在這裡設定您的 KataGo 路徑，例如:
+                # katago_path="/Users/suying-chu/Downloads/katago/KataGo-mac-arm64/katago",
+                # model_path="/Users/suying-chu/Downloads/katago/KataGo-mac-arm64/models/kata100.bin.gz",
+                # config_path="/Users/suying-chu/Downloads/katago/KataGo-mac-arm64/gtp_config.cfg"
+            )
         
         # 初始化機械臂和視覺系統
         robot_controller = RobotArmController() # 實例化機械臂控制器
-        vision_system = VisionSystem() # 實例化視覺系統
+        vision_system = VisionSystem(headless=VISION_HEADLESS, parameter_overrides=VISION_PARAMETER_OVERRIDES) # 實例化視覺系統
         
         # --- 啟動所有系統 ---
         if not katago_client.start_katago():
@@ -50,9 +89,13 @@ if __name__ == "__main__":
         write_log("遊戲開始！")
         
         # 初始化 KataGo 的棋盤狀態
-        katago_client.send_command("boardsize 19")
-        katago_client.send_command("clear_board")
-        robot_controller.reset_board() # 物理清空棋盤 (模擬)
+        katago_client.send_commands(["boardsize 19", "clear_board"]) # 管線化送出，只需一次往返
+        # 清空棋盤前先讓視覺系統累積 stability_frames 幀，取得棋盤上殘留的棋子
+        for _ in range(vision_system.stability_frames + 1):
+            vision_system.wait_for_new_frame(0.5)
+            board_state = vision_system.get_board_state()
+        robot_controller.reset_board(board_state) # 物理清空棋盤，依移動距離分批移回棋子盒
+        vision_system.reset_game() # 視覺系統確認的棋盤從空棋盤開始
         
         # 初始獲取一次棋盤狀態，確保視覺系統就緒 (即使是空的)
         board_state = vision_system.get_board_state()
@@ -62,22 +105,28 @@ if __name__ == "__main__":
             write_log(f"\n--- 第 {turn_count} 回合：輪到 {current_player} 下子 ---")
 
             if current_player == "B": # 人類玩家（黑棋）回合
-                # 視覺系統偵測人類落子 (目前依賴 input() 模擬)
+                # 人類思考期間讓 KataGo 在背景分析目前局面
+                if PONDER_ENABLED:
+                    katago_client.start_ponder(color=current_player, max_visits=PONDER_MAX_VISITS, max_time=PONDER_MAX_TIME)
+
+                # 視覺系統偵測人類落子：穩定的偵測棋盤與確認的棋盤只差一顆黑子 (及其提子) 時才返回
                 human_move_action = None
                 # 持續從視覺系統獲取輸入，直到有效或退出
                 while human_move_action is None:
-                    # 傳入當前的棋盤狀態給視覺系統，未來用於比較辨識新落子
-                    human_move_action = vision_system.detect_human_move(board_state, None) # None 應為實際的 current_board_state
+                    human_move_action = vision_system.detect_human_move(color=current_player)
                     
-                    # 確保 OpenCV 視窗在等待人類輸入時也能響應
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                    # 確保 OpenCV 視窗在等待人類輸入時也能響應 (headless 模式沒有視窗，以 Ctrl+C 結束)
+                    if not VISION_HEADLESS and cv2.waitKey(1) & 0xFF == ord('q'):
                         write_log("用戶手動退出遊戲。")
                         game_over = True
                         break # 跳出內層循環
 
                     if human_move_action is None:
-                        write_log("無效的人類輸入，請重新輸入。")
-                        time.sleep(0.5) # 避免過快循環打印錯誤
+                        # 等到擷取線程送出新的一幀就立即偵測，不固定睡眠輪詢
+                        vision_system.wait_for_new_frame(0.1)
+
+                # 人類已落子 (或退出)，結束背景思考後才能送出下一個指令
+                last_ponder_stats = katago_client.stop_ponder() if PONDER_ENABLED else None
 
                 if game_over: # 如果用戶在等待輸入時退出了
                     break
@@ -103,7 +152,8 @@ if __name__ == "__main__":
                     human_color = human_move_action.split(' ')[0]
                     human_coord = human_move_action.split(' ')[1]
 
-                    write_log(f"偵測到人類落子：{human_color} {human_coord}")
+                    write_log(f"偵測到人類落子：{human_color} {human_coord}"
+                              f"{f'，預期提子 {vision_system.last_move_captures}' if vision_system.last_move_captures else ''}")
                     
                     # 通知 KataGo 人類已落子
                     play_cmd = f"play {human_color} {human_coord}"
@@ -112,6 +162,7 @@ if __name__ == "__main__":
 
                     if parsed_response['status'] == 'success':
                         write_log(f"✅ KataGo 內部棋盤已更新。人類落子回應：{parsed_response['content']}")
+                        vision_system.apply_move(human_color, human_coord)
                         consecutive_passes = 0 # 落子後，連續 pass 計數歸零
                         current_player = "W" if current_player == "B" else "B" # 切換到白棋
                         write_log(f"✅ 回合切換：下一個輪到 {current_player} 下子。")
@@ -127,10 +178,33 @@ if __name__ == "__main__":
 
 
             elif current_player == "W": # 機械臂 (KataGo) 回合
+                # 人類落子已確認：KataGo 思考期間機械臂先吸取白子，在棋盤中心上方等待
+                robot_color = current_player
+                prefetch = robot_controller.prefetch_stone_async(robot_color) if PREFETCH_ENABLED else None
+                stone_placed = False
+
                 write_log("請求 KataGo 思考白棋落子...")
+                genmove_start = time.perf_counter()
                 raw_response = katago_client.send_command(f"genmove {current_player}") 
+                genmove_elapsed = time.perf_counter() - genmove_start
                 parsed_response = katago_client.parse_response(raw_response)
 
+                # 記錄 genmove 耗時，比較有無背景思考的差異
+                mode = "ponder" if last_ponder_stats and last_ponder_stats["visits"] > 0 else "no_ponder"
+                genmove_times[mode].append(genmove_elapsed)
+                if mode == "ponder":
+                    write_log(f"genmove 耗時 {genmove_elapsed:.2f} 秒 (人類思考期間已預先分析 "
+                              f"{last_ponder_stats['visits']} 次訪問，{last_ponder_stats['elapsed']:.2f} 秒，"
+                              f"預算 {PONDER_MAX_VISITS} 次訪問 / {PONDER_MAX_TIME} 秒)。")
+                else:
+                    write_log(f"genmove 耗時 {genmove_elapsed:.2f} 秒 (無背景思考)。")
+                if genmove_times["ponder"] and genmove_times["no_ponder"]:
+                    avg_ponder = sum(genmove_times["ponder"]) / len(genmove_times["ponder"])
+                    avg_no_ponder = sum(genmove_times["no_ponder"]) / len(genmove_times["no_ponder"])
+                    write_log(f"背景思考效果：平均 genmove {avg_ponder:.2f} 秒 vs 無背景思考 {avg_no_ponder:.2f} 秒 "
+                              f"(節省 {avg_no_ponder - avg_ponder:.2f} 秒)。")
+                last_ponder_stats = None
+
                 if parsed_response['status'] == 'success':
                     katago_move = parsed_response['content'].strip()
                     write_log(f"✅ KataGo 建議落子：{katago_move}")
@@ -154,15 +228,42 @@ if __name__ == "__main__":
                             robot_x, robot_y = robot_target_xy
                             write_log(f"機械臂將移動到: X={robot_x:.2f}mm, Y={robot_y:.2f}mm。")
                             
-                            # --- 呼叫實際的機械臂控制程式碼 ---
-                            robot_controller.pick_stone(current_player) # 吸取當前回合顏色的棋子
-                            robot_controller.place_stone(robot_x, robot_y) # 放置棋子
-                            # robot_controller.retract() # 回到安全位置，如果 place_stone 裡面沒有包含的話
+                            # --- 呼叫實際的機械臂控制程式碼 (非阻塞，動作依序在背景執行) ---
+                            if prefetch is None or (prefetch.done() and not prefetch.ok):
+                                # 吸取當前回合顏色的棋子並放置，規劃成同一條軌跡
+                                placement = robot_controller.pick_and_place_async(current_player, robot_x, robot_y)
+                            else:
+                                placement = robot_controller.place_stone_async(robot_x, robot_y) # 從棋盤中心上方放置棋子
+                            stone_placed = True
 
-                            # 重要：通知 KataGo 機械臂已落子 (更新 KataGo 的內部棋局狀態)
+                            # 重要：通知 KataGo 機械臂已落子 (更新 KataGo 的內部棋局狀態)，與機械臂的移動同時進行
                             play_command_for_katago = f"play {current_player} {katago_move}" 
                             katago_client.send_command(play_command_for_katago)
                             write_log(f"已通知 KataGo 執行落子: {play_command_for_katago}")
+                            captured = vision_system.apply_move(current_player, katago_move)
+                            last_motion = placement
+                            if captured:
+                                write_log(f"機械臂落子提掉 {len(captured)} 顆黑子: {captured}")
+                                # 放置後接著把提掉的棋子分批移回棋子盒
+                                last_motion = robot_controller.remove_stones_async(captured, "B") or placement
+
+                            # 機械臂移動期間繼續處理攝影機畫面 (穩定性歷史、遮擋偵測與預覽視窗保持更新)
+                            while not last_motion.wait(0.03):
+                                vision_system.get_board_state()
+                                if not VISION_HEADLESS:
+                                    cv2.waitKey(1)
+                            if not placement.ok or not last_motion.ok:
+                                write_log(f"❌ 機械臂{'落子' if not placement.ok else '提子'}失敗：{placement.error or last_motion.error}")
+                                game_over = True
+                                break
+                            if prefetch is not None and prefetch.ok:
+                                # 不預先取子時為 思考 -> 吸取 -> 放置 依序進行
+                                actual = placement.finished_at - genmove_start
+                                sequential = genmove_elapsed + (prefetch.run_ms + placement.run_ms) / 1000
+                                prefetch_savings.append(sequential - actual)
+                                write_log(f"預先取子：本手從思考到落子完成 {actual:.2f} 秒，依序進行需 {sequential:.2f} 秒 "
+                                          f"(思考 {genmove_elapsed:.2f} 秒，取子 {prefetch.run_ms / 1000:.2f} 秒)，"
+                                          f"節省 {sequential - actual:.2f} 秒。")
                             
                             consecutive_passes = 0 # 落子後，連續 pass 計數歸零
                             current_player = "B" if current_player == "W" else "W" # 切換到黑棋
@@ -178,6 +279,9 @@ if __name__ == "__main__":
                     write_log(f"ℹ️ KataGo 訊息：{parsed_response['content']}")
                     consecutive_passes = 0 # 收到回應（非錯誤）則歸零
                     current_player = "B" if current_player == "W" else "W" # 切換到黑棋
+
+                if prefetch is not None and not stone_placed:
+                    robot_controller.return_stone_async(robot_color) # 沒有落子 (pass 或錯誤)，把預先取的棋子放回去
             
             # 判斷遊戲結束條件 (簡化範例)
             # 例如：達到最大回合數
@@ -189,9 +293,18 @@ if __name__ == "__main__":
         write_log(f"\n🚨 發生未預期的錯誤：{e}")
     finally:
         write_log("\n--- 遊戲結束，清理資源 ---")
+        for mode, times in genmove_times.items():
+            if times:
+                write_log(f"genmove 統計 ({mode}): {len(times)} 手，平均 {sum(times) / len(times):.2f} 秒。")
+        if prefetch_savings:
+            write_log(f"預先取子統計: {len(prefetch_savings)} 手，平均每手節省 {sum(prefetch_savings) / len(prefetch_savings):.2f} 秒，"
+                      f"共節省 {sum(prefetch_savings):.1f} 秒。")
         if katago_client:
+            katago_client.stop_ponder()
             katago_client.stop_katago()
         if robot_controller:
+            for kind, stats in robot_controller.motion_stats().items():
+                write_log(f"機械臂動作統計 ({kind}): {stats['count']} 次，平均 {stats['avg_ms']:.0f} ms。")
             robot_controller.disconnect()
         if vision_system:
             vision_system.stop_camera()
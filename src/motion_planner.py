@@ -0,0 +1,197 @@
+# motion_planner.py
+# 機械臂軌跡規劃：把一連串吸取 / 放置工作點串成一條連續軌跡。
+# 工作點 (夾取、釋放) 必須停下，其餘的抬升與接近點以圓弧混合 (blend) 通過而不完全停止；
+# 相鄰工作點很近時只抬升到低空跨越高度，不回到安全高度。
+# 以梯形速度曲線 (速度、加速度上限) 模擬運動時間，可以在沒有機械臂的環境下比較每手耗時。
+import math
+from collections import namedtuple
+import numpy as np
+
+# --- 運動學限制 (請依實際機械臂的規格設定) ---
+DEFAULT_MAX_VELOCITY = 250.0 # 末端最高速度 (mm/s)
+DEFAULT_MAX_ACCELERATION = 1000.0 # 末端最大加速度 (mm/s²)
+DEFAULT_BLEND_RADIUS = 25.0 # 通過中間點時的混合半徑 (mm)，0 表示每個路徑點都完全停止
+DEFAULT_HOP_HEIGHT = 15.0 # 近距離跨越時高於兩端工作高度的抬升量 (mm)
+DEFAULT_SKIP_RETRACT_DISTANCE = 60.0 # 下一個工作點的水平距離小於此值時不回到安全高度 (mm)，0 表示總是回到安全高度
+WAYPOINT_SETTLE_TIME = 0.05 # 每次完全停止後等待到位的時間 (秒)
+GRIPPER_TIMES = {"grip": 0.3, "release": 0.2} # 夾具動作時間 (秒)
+
+# 軌跡上的一個路徑點；blend 為通過此點的混合半徑 (0 表示停止)，action 為到達後的夾具動作 ("grip" / "release" / None)
+Waypoint = namedtuple("Waypoint", "x y z blend action")
+# 一個工作點：移動到 (x, y) 上方，下降到 z 後執行 action
+Task = namedtuple("Task", "x y z action")
+
+
+def plan_tasks(start, tasks, z_safe, end=None, blend_radius=DEFAULT_BLEND_RADIUS, hop_height=DEFAULT_HOP_HEIGHT,
+               skip_retract_distance=DEFAULT_SKIP_RETRACT_DISTANCE):
+    """
+    把 tasks 串成一條軌跡並返回 Waypoint 列表。
+    start 為目前的 (x, y, z) (None 表示未知，從第一個路徑點開始)；end 為最後停留的 (x, y, z)，
+    None 時在最後一個工作點上方的安全高度停止。
+    """
+    waypoints = []
+    current = None if start is None else tuple(start)
+    for task in tasks:
+        travel_z = z_safe
+        if current is not None and math.hypot(task.x - current[0], task.y - current[1]) < skip_retract_distance:
+            travel_z = min(z_safe, max(current[2], task.z) + hop_height)
+        if current is not None and current[2] < travel_z and (current[0], current[1]) != (task.x, task.y):
+            waypoints.append(Waypoint(current[0], current[1], travel_z, blend_radius, None)) # 抬升
+        waypoints.append(Waypoint(task.x, task.y, travel_z, blend_radius, None)) # 接近
+        waypoints.append(Waypoint(task.x, task.y, task.z, 0.0, task.action)) # 工作點必須停止
+        current = (task.x, task.y, task.z)
+    if current is not None:
+        waypoints.append(Waypoint(current[0], current[1], z_safe, blend_radius, None)) # 提起
+    if end is not None:
+        waypoints.append(Waypoint(end[0], end[1], end[2], 0.0, None))
+    if waypoints:
+        last = waypoints[-1]
+        waypoints[-1] = last._replace(blend=0.0) # 軌跡終點停止
+    return _drop_duplicates(start, waypoints)
+
+
+def _drop_duplicates(start, waypoints):
+    """去掉與前一點重合的路徑點 (例如工作高度等於安全高度)，保留較嚴格的停止與夾具動作"""
+    result = []
+    previous = None if start is None else tuple(start)
+    for waypoint in waypoints:
+        if previous is not None and np.allclose((waypoint.x, waypoint.y, waypoint.z), previous[:3]):
+            if result:
+                merged = result[-1]
+                result[-1] = merged._replace(blend=min(merged.blend, waypoint.blend), action=merged.action or waypoint.action)
+            elif waypoint.action:
+                result.append(waypoint)
+            continue
+        result.append(waypoint)
+        previous = (waypoint.x, waypoint.y, waypoint.z)
+    return result
+
+
+def _segment_time(distance, v0, v1, max_velocity, max_acceleration):
+    """以梯形速度曲線走完 distance，起訖速度為 v0、v1 (已保證可達) 所需的時間"""
+    if distance <= 0:
+        return 0.0
+    peak = min(max_velocity, math.sqrt(max(0.0, max_acceleration * distance + (v0 * v0 + v1 * v1) / 2)))
+    accel_distance = (peak * peak - v0 * v0) / (2 * max_acceleration)
+    decel_distance = (peak * peak - v1 * v1) / (2 * max_acceleration)
+    cruise = max(0.0, distance - accel_distance - decel_distance)
+    return (peak - v0) / max_acceleration + (peak - v1) / max_acceleration + cruise / peak
+
+
+def trajectory_time(start, waypoints, max_velocity=DEFAULT_MAX_VELOCITY, max_acceleration=DEFAULT_MAX_ACCELERATION):
+    """
+    模擬執行軌跡所需的時間 (秒)，包含停止點的到位時間與夾具動作時間。
+    混合點的通過速度受轉角處圓弧的向心加速度限制，再以前後兩次掃描確保每段都能在加速度限制內達到。
+    """
+    if not waypoints:
+        return 0.0
+    points = np.array(([start[:3]] if start is not None else []) + [(w.x, w.y, w.z) for w in waypoints], dtype=np.float64)
+    if start is None:
+        waypoints = waypoints[1:]
+    vectors = np.diff(points, axis=0)
+    lengths = np.linalg.norm(vectors, axis=1)
+    count = len(lengths)
+
+    # 每段終點的速度上限
+    limits = np.zeros(count)
+    for i, waypoint in enumerate(waypoints):
+        if waypoint.blend <= 0 or i == count - 1 or lengths[i] == 0 or lengths[i + 1] == 0:
+            continue
+        cos_turn = np.dot(vectors[i], vectors[i + 1]) / (lengths[i] * lengths[i + 1])
+        turn = math.acos(max(-1.0, min(1.0, cos_turn)))
+        if turn < 1e-6:
+            limits[i] = max_velocity
+            continue
+        blend = min(waypoint.blend, lengths[i] / 2, lengths[i + 1] / 2)
+        radius = blend / math.tan(turn / 2) if turn < math.pi - 1e-6 else 0.0
+        limits[i] = min(max_velocity, math.sqrt(max_acceleration * radius))
+
+    # 向後掃描：每段終點必須能在下一段內減速到下一個上限
+    for i in range(count - 2, -1, -1):
+        limits[i] = min(limits[i], math.sqrt(limits[i + 1] ** 2 + 2 * max_acceleration * lengths[i + 1]))
+    # 向前掃描：從靜止開始，每段終點不能超過本段內可加速到的速度
+    speeds = np.zeros(count + 1)
+    for i in range(count):
+        speeds[i + 1] = min(limits[i], math.sqrt(speeds[i] ** 2 + 2 * max_acceleration * lengths[i]))
+
+    total = sum(_segment_time(lengths[i], speeds[i], speeds[i + 1], max_velocity, max_acceleration) for i in range(count))
+    total += sum(WAYPOINT_SETTLE_TIME for w in waypoints if w.blend <= 0)
+    total += sum(GRIPPER_TIMES.get(w.action, 0.0) for w in waypoints)
+    return total
+
+
+def _distance_matrix(points):
+    points = np.asarray(points, dtype=np.float64)
+    return np.linalg.norm(points[:, np.newaxis, :] - points[np.newaxis, :, :], axis=2)
+
+
+def _nearest_neighbour_order(dist, start):
+    """從 start 出發，每次走到最近的尚未拜訪的點"""
+    count = len(dist)
+    visited = np.zeros(count, dtype=bool)
+    visited[start] = True
+    order = [start]
+    for _ in range(count - 1):
+        candidates = np.where(visited, np.inf, dist[order[-1]])
+        nearest = int(np.argmin(candidates))
+        visited[nearest] = True
+        order.append(nearest)
+    return order
+
+
+def _two_opt(order, dist):
+    """2-opt 改善：反轉能縮短總長度的區段，直到沒有改善。order 的首尾 (棋子盒) 固定"""
+    order = list(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(order) - 2):
+            for j in range(i + 1, len(order) - 1):
+                a, b, c, d = order[i - 1], order[i], order[j], order[j + 1]
+                if dist[a, c] + dist[b, d] < dist[a, b] + dist[c, d] - 1e-9:
+                    order[i:j + 1] = reversed(order[i:j + 1])
+                    improved = True
+    return order
+
+
+def _split_batches(order, dist, depot, capacity):
+    """
+    把繞行順序切成每趟最多 capacity 顆的批次 (每趟從棋子盒出發再回到棋子盒)，
+    以動態規劃找出總距離最短的切法。返回批次列表。
+    """
+    count = len(order)
+    best = np.full(count + 1, np.inf)
+    best[0] = 0.0
+    cut = np.zeros(count + 1, dtype=np.int64)
+    for end in range(1, count + 1):
+        inner = 0.0
+        for start in range(end - 1, max(-1, end - 1 - capacity), -1):
+            if start < end - 1:
+                inner += dist[order[start], order[start + 1]]
+            cost = best[start] + dist[depot, order[start]] + inner + dist[order[end - 1], depot]
+            if cost < best[end]:
+                best[end], cut[end] = cost, start
+    batches = []
+    end = count
+    while end > 0:
+        batches.append(order[cut[end]:end])
+        end = cut[end]
+    return batches[::-1]
+
+
+def plan_removal(points, depot, capacity):
+    """
+    規劃移除棋子的順序：以最近鄰法加 2-opt 求出從棋子盒出發並回到棋子盒的繞行路線，
+    再依夾具容量切成批次，每批夾起後一次放回棋子盒。
+    points 為各棋子的 (X, Y)，depot 為棋子盒的 (X, Y)。返回 (批次列表 [[棋子索引, ...], ...], 總水平距離 mm)。
+    """
+    if not points:
+        return [], 0.0
+    nodes = [tuple(depot)] + [tuple(p) for p in points] # 0 為棋子盒
+    dist = _distance_matrix(nodes)
+    tour = _nearest_neighbour_order(dist, 0) + [0]
+    tour = _two_opt(tour, dist)
+    batches = _split_batches(tour[1:-1], dist, 0, max(1, capacity))
+    total = sum(dist[0, batch[0]] + sum(dist[a, b] for a, b in zip(batch, batch[1:])) + dist[batch[-1], 0]
+                for batch in batches)
+    return [[index - 1 for index in batch] for batch in batches], float(total)
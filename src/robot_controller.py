@@ -1,7 +1,15 @@
 # robot_controller.py
+import argparse
+import itertools
+import os
+import queue
+import threading
 import time
-from _shared_utils import write_log # 從共用工具導入日誌功能
+from collections import deque
+from _shared_utils import write_log, DEBUG # 從共用工具導入日誌功能
 import numpy as np # 用於數學運算，如 pi
+from motion_planner import (Task, plan_tasks, plan_removal, trajectory_time, DEFAULT_MAX_VELOCITY, DEFAULT_MAX_ACCELERATION,
+                            DEFAULT_BLEND_RADIUS, DEFAULT_HOP_HEIGHT, DEFAULT_SKIP_RETRACT_DISTANCE)
 
 # --- 圍棋盤和機械臂的物理參數 (請根據您的實際測量值來設定) ---
 # 這些值是機械臂校準後確定的，請您精確測量！
@@ -14,17 +22,135 @@ CELL_SIZE_MM = 20.0 # 範例值，請替換為您實際測量的棋盤格點間
 ROBOT_BOARD_ORIGIN_X_MM = 150.0 # 'A1' 點的機械臂 X 座標
 ROBOT_BOARD_ORIGIN_Y_MM = 100.0 # 'A1' 點的機械臂 Y 座標
 
+# --- 模擬：以運動學模型 (motion_planner.trajectory_time) 估計的軌跡時間等待，對接實際機械臂 SDK 後設為 0 ---
+SIMULATION_TIME_SCALE = 1.0 # 模擬等待時間 = 估計時間 x 此倍數
+GRIPPER_CAPACITY = 1 # 夾具一次最多能持有幾顆棋子 (單一吸盤為 1)；大於 1 時提子與清空棋盤會分批夾起後一次放回棋子盒
+MOTION_HISTORY_SIZE = 100 # 保留最近多少個動作的計時
+
+# --- 每個交叉點的機械臂座標表：由幾個實測點擬合 (可修正棋盤歪斜)，保存在機械臂校準檔中 ---
+ROBOT_CALIBRATION_FILE_NAME = 'robot_calibration.npz'
+ROBOT_CALIBRATION_FORMAT_VERSION = 1 # 修改時一併更新根目錄 katago_interface.py 中的同名常數
+BOARD_SIZE = 19
+
 # GTP 列字母到索引的映射 (跳過 'I')
 GTP_COL_MAP = {
     'A': 0, 'B': 1, 'C': 2, 'D': 3, 'E': 4, 'F': 5, 'G': 6, 'H': 7,
     'J': 8, 'K': 9, 'L': 10, 'M': 11, 'N': 12, 'O': 13, 'P': 14,
     'Q': 15, 'R': 16, 'S': 17, 'T': 18
 }
+# GTP 座標到 (行索引, 列索引) 的映射，GTP 1 對應行索引 0
+GTP_VERTEX_INDEX = {f"{col_char}{row + 1}": (row, col) for col_char, col in GTP_COL_MAP.items() for row in range(BOARD_SIZE)}
+
+_board_table = None # (19, 19, 2) 的機械臂 (X, Y) 座標表，以 [行索引, 列索引] 存取
+_vertex_coords = None # GTP 座標 -> (X, Y)，由 _board_table 建立，查詢時不需再轉換
+
+
+def uniform_board_table():
+    """以 A1 原點和 CELL_SIZE_MM 的均勻格點建立座標表 (沒有機械臂校準檔時使用)"""
+    rows, cols = np.mgrid[0:BOARD_SIZE, 0:BOARD_SIZE]
+    return np.stack([ROBOT_BOARD_ORIGIN_X_MM + cols * CELL_SIZE_MM, ROBOT_BOARD_ORIGIN_Y_MM + rows * CELL_SIZE_MM], axis=-1)
+
+
+def _design_matrix(rows, cols, model):
+    terms = [np.ones_like(rows, dtype=np.float64), cols, rows]
+    if model == "bilinear":
+        terms.append(cols * rows)
+    return np.stack(terms, axis=-1).astype(np.float64)
+
+
+def fit_board_table(measurements, model=None):
+    """
+    由實測點擬合每個交叉點的機械臂座標表。
+    measurements 為 {GTP 座標: (X, Y)}；model 為 "affine" (至少 3 點，修正平移、旋轉、縮放與歪斜)
+    或 "bilinear" (至少 4 點，另外修正四邊形變形)，預設點數足夠時使用 bilinear。
+    返回 (座標表, 實測點的均方根殘差 mm)，量測點不足或共線時返回 (None, None)。
+    """
+    indices = [GTP_VERTEX_INDEX.get(vertex.strip().upper()) for vertex in measurements]
+    if None in indices:
+        write_log(f"錯誤: 實測點中有無效的 GTP 座標: {list(measurements)}")
+        return None, None
+    model = model or ("bilinear" if len(indices) >= 4 else "affine")
+    terms = 4 if model == "bilinear" else 3
+    rows = np.array([row for row, _ in indices], dtype=np.float64)
+    cols = np.array([col for _, col in indices], dtype=np.float64)
+    targets = np.array(list(measurements.values()), dtype=np.float64)
+    design = _design_matrix(rows, cols, model)
+    coefficients, _, rank, _ = np.linalg.lstsq(design, targets, rcond=None)
+    if rank < terms:
+        write_log(f"錯誤: {model} 擬合至少需要 {terms} 個不共線的實測點 (目前 {len(indices)} 個)。")
+        return None, None
+    grid_rows, grid_cols = np.mgrid[0:BOARD_SIZE, 0:BOARD_SIZE]
+    table = (_design_matrix(grid_rows, grid_cols, model) @ coefficients).reshape(BOARD_SIZE, BOARD_SIZE, 2)
+    rms = float(np.sqrt(np.mean(np.sum((design @ coefficients - targets) ** 2, axis=1))))
+    write_log(f"機械臂座標表擬合完成 ({model}，{len(indices)} 個實測點，殘差 RMS {rms:.2f} mm)。")
+    return table, rms
+
+
+def set_board_table(table):
+    """使用新的座標表 (例如剛擬合的結果)，之後的 gtp_to_robot_coords 直接查表"""
+    global _board_table, _vertex_coords
+    table = np.asarray(table, dtype=np.float64)
+    _vertex_coords = {vertex: (float(table[row, col, 0]), float(table[row, col, 1]))
+                      for vertex, (row, col) in GTP_VERTEX_INDEX.items()}
+    _board_table = table
+
+
+def save_board_table(table, measurements=None, model=""):
+    """把座標表與擬合用的實測點寫入版本化的機械臂校準檔"""
+    measurements = measurements or {}
+    try:
+        with open(ROBOT_CALIBRATION_FILE_NAME, 'wb') as f:
+            np.savez(
+                f,
+                version=np.int32(ROBOT_CALIBRATION_FORMAT_VERSION),
+                table=np.asarray(table, dtype=np.float64),
+                model=np.array(model),
+                vertices=np.array(list(measurements), dtype=str),
+                measured=np.array(list(measurements.values()), dtype=np.float64).reshape(-1, 2),
+            )
+        write_log(f"機械臂座標表成功保存到 '{ROBOT_CALIBRATION_FILE_NAME}'。")
+        return True
+    except Exception as e:
+        write_log(f"保存機械臂座標表到 '{ROBOT_CALIBRATION_FILE_NAME}' 時發生錯誤: {e}")
+        return False
+
+
+def load_board_table():
+    """從機械臂校準檔載入座標表；檔案不存在、版本不符或格式錯誤時返回 None"""
+    if not os.path.exists(ROBOT_CALIBRATION_FILE_NAME):
+        return None
+    try:
+        with np.load(ROBOT_CALIBRATION_FILE_NAME) as bundle:
+            version = int(bundle['version'])
+            if version != ROBOT_CALIBRATION_FORMAT_VERSION:
+                write_log(f"機械臂校準檔 '{ROBOT_CALIBRATION_FILE_NAME}' 的版本 {version} 不相容 "
+                          f"(目前為 {ROBOT_CALIBRATION_FORMAT_VERSION})，改用均勻格點。")
+                return None
+            table = bundle['table']
+            model = str(bundle['model'])
+            count = len(bundle['vertices'])
+    except Exception as e:
+        write_log(f"讀取機械臂校準檔 '{ROBOT_CALIBRATION_FILE_NAME}' 時發生錯誤: {e}，改用均勻格點。")
+        return None
+    if table.shape != (BOARD_SIZE, BOARD_SIZE, 2):
+        write_log(f"機械臂校準檔 '{ROBOT_CALIBRATION_FILE_NAME}' 的座標表大小 {table.shape} 不正確，改用均勻格點。")
+        return None
+    write_log(f"已載入機械臂校準檔 '{ROBOT_CALIBRATION_FILE_NAME}' ({model or '手動'}，{count} 個實測點)。")
+    return table
+
+
+def board_table():
+    """目前的座標表；第一次使用時載入機械臂校準檔，沒有時使用均勻格點"""
+    if _board_table is None:
+        table = load_board_table()
+        set_board_table(table if table is not None else uniform_board_table())
+    return _board_table
+
 
 def gtp_to_robot_coords(gtp_move):
     """
     將 GTP 座標 (例如 "D4", "Q16") 轉換為機械臂的物理 (X, Y) 座標。
-    假設棋盤 A1 點是機械臂的參考原點，X軸向右，Y軸向上。
+    直接查詢預先計算的座標表 (見 board_table)，不在每次呼叫時解析字串或寫日誌。
 
     Args:
         gtp_move (str): GTP 格式的落子座標，例如 "D4" 或 "Q16"。
@@ -33,44 +159,54 @@ def gtp_to_robot_coords(gtp_move):
         tuple: (robot_x_mm, robot_y_mm) 該位置在機械臂工作空間中的物理座標。
                如果輸入無效，返回 None。
     """
-    gtp_move = gtp_move.strip().upper()
+    if _vertex_coords is None:
+        board_table()
+    coords = _vertex_coords.get(gtp_move)
+    if coords is None:
+        coords = _vertex_coords.get(gtp_move.strip().upper())
+        if coords is None:
+            write_log(f"錯誤: 無效的 GTP 座標: {gtp_move} (列字母須為 A-T 且不含 I，行號須為 1-19)")
+    return coords
 
-    if len(gtp_move) < 2 or len(gtp_move) > 3:
-        write_log(f"錯誤: 無效的 GTP 座標格式: {gtp_move} (長度不符)")
-        return None
 
-    col_char = gtp_move[0]
-    row_num_str = gtp_move[1:]
+class MotionHandle:
+    """
+    排入佇列的一個機械臂動作 (例如吸取或放置一顆棋子)。
+    呼叫端可用 done() 輪詢或 wait() 等待完成；完成後 ok 表示是否成功，並記錄排隊與執行時間。
+    """
+    def __init__(self, motion_id, name, steps):
+        self.motion_id = motion_id
+        self.name = name
+        self.steps = steps # [(函式, 參數), ...]，由動作執行線程依序呼叫
+        self.queued_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self._done = threading.Event()
 
-    if col_char not in GTP_COL_MAP:
-        write_log(f"錯誤: 無效的 GTP 列字母: {col_char} (不在 A-T 範圍或為 I)")
-        return None
+    def done(self):
+        return self._done.is_set()
 
-    try:
-        row_num = int(row_num_str)
-        if not (1 <= row_num <= 19):
-            write_log(f"錯誤: 無效的 GTP 行號: {row_num_str} (必須在 1-19 之間)")
-            return None
-    except ValueError:
-        write_log(f"錯誤: GTP 行號格式錯誤: {row_num_str} (非數字)")
-        return None
+    def wait(self, timeout=None):
+        """等待動作完成，返回是否已完成 (逾時返回 False)"""
+        return self._done.wait(timeout)
 
-    # 將 GTP 字母轉換為 0-18 的列索引
-    col_index = GTP_COL_MAP[col_char]
-    
-    # 將 GTP 行號轉換為 0-18 的行索引 (GTP 1 對應索引 0，GTP 19 對應索引 18)
-    row_index = row_num - 1 
+    @property
+    def ok(self):
+        return self.done() and self.error is None
 
-    # 計算機械臂的 X 座標
-    # 從 A1 原點開始，向右移動 col_index * CELL_SIZE_MM
-    robot_x_mm = ROBOT_BOARD_ORIGIN_X_MM + (col_index * CELL_SIZE_MM)
+    @property
+    def queue_ms(self):
+        return None if self.started_at is None else (self.started_at - self.queued_at) * 1000
 
-    # 計算機械臂的 Y 座標
-    # 從 A1 原點開始，向上移動 row_index * CELL_SIZE_MM
-    robot_y_mm = ROBOT_BOARD_ORIGIN_Y_MM + (row_index * CELL_SIZE_MM)
+    @property
+    def run_ms(self):
+        return None if self.finished_at is None or self.started_at is None else (self.finished_at - self.started_at) * 1000
 
-    write_log(f"GTP 座標 {gtp_move} (列索引: {col_index}, 行索引: {row_index}) 轉換為機械臂座標: (X={robot_x_mm:.2f}mm, Y={robot_y_mm:.2f}mm)")
-    return (robot_x_mm, robot_y_mm)
+    def _finish(self, error=None):
+        self.error = error
+        self.finished_at = time.perf_counter()
+        self._done.set()
 
 
 class RobotArmController:
@@ -88,45 +224,232 @@ class RobotArmController:
         self.X_WHITE_CONTAINER = 20.0 # 白色棋子盒的 X 座標
         self.Y_WHITE_CONTAINER = 40.0 # 白色棋子盒的 Y 座標
 
+        # --- 非阻塞動作佇列：移動、夾取、釋放等指令由動作執行線程依序執行，呼叫端拿到 MotionHandle ---
+        self._motion_queue = queue.Queue()
+        self._motion_thread = None
+        self._motion_ids = itertools.count(1)
+        self._motion_lock = threading.Lock()
+        self.motion_history = deque(maxlen=MOTION_HISTORY_SIZE) # 最近完成的 MotionHandle
+        self.holding = None # 夾具上目前的棋子顏色 (由動作執行線程更新)
+
+        # --- 軌跡規劃：吸取 / 放置串成一條混合軌跡，只在工作點停止 ---
+        self.position = None # 末端目前的 (X, Y, Z)，未知時為 None
+        self.max_velocity = DEFAULT_MAX_VELOCITY
+        self.max_acceleration = DEFAULT_MAX_ACCELERATION
+        self.blend_radius = DEFAULT_BLEND_RADIUS # 0 表示每個路徑點都完全停止
+        self.hop_height = DEFAULT_HOP_HEIGHT
+        self.skip_retract_distance = DEFAULT_SKIP_RETRACT_DISTANCE # 0 表示每次都回到安全高度
+        self.planned_motion_time = 0.0 # 累計的估計軌跡時間 (秒)
+        self.gripper_capacity = GRIPPER_CAPACITY
+
     def connect(self):
         write_log("機械臂連接成功 (模擬)。")
         time.sleep(1) # 模擬連接時間
 
     def disconnect(self):
+        self.stop_motion_worker()
         write_log("機械臂斷開連接 (模擬)。")
         time.sleep(0.5) # 模擬斷開時間
 
+    # --- 非阻塞動作佇列 ---
+    def submit_motion(self, name, steps):
+        """
+        把一個動作 (依序執行的 [(函式, 參數), ...]) 排入佇列並立即返回 MotionHandle。
+        動作依提交順序執行；任一動作失敗時，佇列中尚未開始的動作全部取消。
+        """
+        self._ensure_motion_worker()
+        handle = MotionHandle(next(self._motion_ids), name, steps)
+        self._motion_queue.put(handle)
+        write_log(f"機械臂動作 #{handle.motion_id} ({name}) 已排入佇列。", DEBUG)
+        return handle
+
+    def _ensure_motion_worker(self):
+        with self._motion_lock:
+            if self._motion_thread is None:
+                self._motion_thread = threading.Thread(target=self._motion_loop, name="MotionWorker", daemon=True)
+                self._motion_thread.start()
+
+    def _motion_loop(self):
+        while True:
+            handle = self._motion_queue.get()
+            if handle is None:
+                break
+            handle.started_at = time.perf_counter()
+            try:
+                for function, args in handle.steps:
+                    function(*args)
+            except Exception as e:
+                handle._finish(e)
+                self.motion_history.append(handle)
+                write_log(f"錯誤：機械臂動作 #{handle.motion_id} ({handle.name}) 失敗: {e}")
+                self._cancel_pending_motions(f"前一個動作 #{handle.motion_id} 失敗")
+                continue
+            handle._finish()
+            self.motion_history.append(handle)
+            write_log(f"機械臂動作 #{handle.motion_id} ({handle.name}) 完成：排隊 {handle.queue_ms:.0f} ms，"
+                      f"執行 {handle.run_ms:.0f} ms。")
+
+    def _cancel_pending_motions(self, reason):
+        while True:
+            try:
+                handle = self._motion_queue.get_nowait()
+            except queue.Empty:
+                return
+            if handle is None: # 停止訊號放回去，讓執行線程結束
+                self._motion_queue.put(None)
+                return
+            handle._finish(RuntimeError(f"已取消：{reason}"))
+            write_log(f"機械臂動作 #{handle.motion_id} ({handle.name}) 已取消：{reason}。")
+
+    def stop_motion_worker(self, timeout=None):
+        """等待佇列中的動作全部執行完畢後停止動作執行線程"""
+        with self._motion_lock:
+            thread, self._motion_thread = self._motion_thread, None
+        if thread is None:
+            return
+        self._motion_queue.put(None)
+        thread.join(timeout)
+
+    def motion_stats(self):
+        """最近完成的動作依名稱分組的次數與平均執行時間 (ms)"""
+        stats = {}
+        for handle in self.motion_history:
+            if handle.ok:
+                kind = handle.name.split()[0]
+                count, total = stats.get(kind, (0, 0.0))
+                stats[kind] = (count + 1, total + handle.run_ms)
+        return {kind: {"count": count, "avg_ms": total / count} for kind, (count, total) in stats.items()}
+
+    # --- 動作 ---
     def pick_stone(self, color):
-        write_log(f"機械臂模擬：吸取 {color} 棋子。")
-        if color.lower() == "black":
-            container_x, container_y = self.X_BLACK_CONTAINER, self.Y_BLACK_CONTAINER
-        else: # white
-            container_x, container_y = self.X_WHITE_CONTAINER, self.Y_WHITE_CONTAINER
-
-        # 這裡應該有機械臂移動到棋子盒，啟動夾具/吸盤，然後提起回到安全高度的實際指令
-        self.move_to_position(container_x, container_y, self.Z_SAFE_RETRACT) # 先到安全高度
-        self.move_to_position(container_x, container_y, self.Z_PICKUP_STONE) # 下降到吸取高度
-        self.activate_gripper() # 激活夾具
-        self.move_to_position(container_x, container_y, self.Z_SAFE_RETRACT) # 提起回到安全高度
-        time.sleep(2) # 模擬吸取時間
-        write_log(f"機械臂模擬：吸取 {color} 棋子完成。")
+        """吸取一顆棋子並等待完成 (阻塞)；不需要等待時使用 pick_stone_async"""
+        handle = self.pick_stone_async(color)
+        handle.wait()
+        return handle
+
+    def pick_stone_async(self, color):
+        """排入吸取棋子的動作，color 可以是 "B" / "W" 或 "black" / "white"。返回 MotionHandle"""
+        return self.submit_motion(f"pick {color}", [(self._run_tasks, ([self._pick_task(color)], color))])
+
+    def pick_and_place_async(self, color, robot_x, robot_y):
+        """吸取一顆棋子並放到 (robot_x, robot_y)，兩者規劃成同一條混合軌跡。返回 MotionHandle"""
+        tasks = [self._pick_task(color), Task(robot_x, robot_y, self.Z_PLACEMENT, "release")]
+        return self.submit_motion(f"pick_place {color} {robot_x:.1f},{robot_y:.1f}", [(self._run_tasks, (tasks, color))])
+
+    def prefetch_stone_async(self, color):
+        """
+        預先吸取棋子並停在棋盤中心上方的安全高度等待 (對手或引擎思考期間使用)，
+        之後的 place_stone_async 只需從棋盤中心移動到目標。返回 MotionHandle。
+        """
+        center = (*self.board_center(), self.Z_SAFE_RETRACT)
+        return self.submit_motion(f"prefetch {color}", [(self._run_tasks, ([self._pick_task(color)], color, center))])
+
+    def return_stone_async(self, color):
+        """把夾具上的棋子放回棋子盒 (例如預先取子後引擎選擇 pass)"""
+        container_x, container_y = self._container(color)
+        return self.submit_motion(f"return {color}", [
+            (self._run_tasks, ([Task(container_x, container_y, self.Z_SAFE_RETRACT, "release")], color)),
+        ])
 
     def place_stone(self, robot_x, robot_y):
-        write_log(f"機械臂模擬：放置棋子到 X={robot_x:.2f}mm, Y={robot_y:.2f}mm。")
-        # 這裡應該有機械臂移動到棋盤上方安全高度，再下降到放置高度，釋放夾具/吸盤，然後提起的實際指令
-        self.move_to_position(robot_x, robot_y, self.Z_SAFE_RETRACT) # 先到目標上方安全高度
-        self.move_to_position(robot_x, robot_y, self.Z_PLACEMENT) # 下降到放置高度
-        self.release_gripper() # 釋放夾具
-        self.move_to_position(robot_x, robot_y, self.Z_SAFE_RETRACT) # 提起回到安全高度
-        time.sleep(3) # 模擬放置時間
-        write_log(f"機械臂模擬：放置棋子完成。")
-
-    def move_to_position(self, x, y, z):
+        """放置棋子並等待完成 (阻塞)；不需要等待時使用 place_stone_async"""
+        handle = self.place_stone_async(robot_x, robot_y)
+        handle.wait()
+        return handle
+
+    def place_stone_async(self, robot_x, robot_y):
+        """排入放置棋子的動作，返回 MotionHandle"""
+        return self.submit_motion(f"place {robot_x:.1f},{robot_y:.1f}", [
+            (self._run_tasks, ([Task(robot_x, robot_y, self.Z_PLACEMENT, "release")], None)),
+        ])
+
+    def remove_stones_async(self, vertices, color):
+        """
+        把棋盤上 color 色的棋子 (GTP 座標，例如被提掉的棋子) 移回棋子盒。
+        拜訪順序由最近鄰法加 2-opt 決定，並依夾具容量分批，每批一次放回棋子盒。返回 MotionHandle，沒有棋子時返回 None。
+        """
+        points = [gtp_to_robot_coords(vertex) for vertex in vertices]
+        points = [point for point in points if point is not None]
+        if not points:
+            return None
+        container_x, container_y = self._container(color)
+        tasks, batches, distance = self.removal_tasks(points, color)
+        round_trip = sum(2 * np.hypot(x - container_x, y - container_y) for x, y in points)
+        write_log(f"機械臂移除 {len(points)} 顆 {color} 棋子：分 {len(batches)} 趟，水平移動 {distance:.0f} mm "
+                  f"(逐顆往返需 {round_trip:.0f} mm)。")
+        return self.submit_motion(f"remove {color} x{len(points)}", [(self._run_tasks, (tasks, color))])
+
+    def removal_tasks(self, points, color, capacity=None):
+        """
+        把棋盤上 points (機械臂 X, Y) 的棋子移回 color 的棋子盒的工作點列表。
+        返回 (工作點, 批次, 總水平距離 mm)；capacity 預設為夾具容量。
+        """
+        container_x, container_y = self._container(color)
+        capacity = self.gripper_capacity if capacity is None else capacity
+        batches, distance = plan_removal(points, (container_x, container_y), capacity)
+        tasks = []
+        for batch in batches:
+            tasks += [Task(points[i][0], points[i][1], self.Z_PLACEMENT, "grip") for i in batch]
+            tasks.append(Task(container_x, container_y, self.Z_SAFE_RETRACT, "release"))
+        return tasks, batches, distance
+
+    def move_to_position_async(self, x, y, z):
+        return self.submit_motion(f"move {x:.1f},{y:.1f},{z:.1f}", [(self.move_to_position, (x, y, z))])
+
+    def activate_gripper_async(self):
+        return self.submit_motion("grip", [(self.activate_gripper, ())])
+
+    def release_gripper_async(self):
+        return self.submit_motion("release", [(self.release_gripper, ())])
+
+    def board_center(self):
+        """棋盤中心 (天元 K10) 的機械臂 X, Y 座標"""
+        return gtp_to_robot_coords("K10")
+
+    def _container(self, color):
+        if color.lower() in ("b", "black"):
+            return self.X_BLACK_CONTAINER, self.Y_BLACK_CONTAINER
+        return self.X_WHITE_CONTAINER, self.Y_WHITE_CONTAINER
+
+    def _pick_task(self, color):
+        container_x, container_y = self._container(color)
+        return Task(container_x, container_y, self.Z_PICKUP_STONE, "grip")
+
+    def plan(self, tasks, end=None, start=None):
+        """
+        從 start (預設為目前位置) 規劃經過 tasks 的軌跡，返回 (路徑點, 估計時間 秒)。
+        只在工作點 (夾取、釋放) 停止；抬升與接近點以 blend_radius 混合通過，相鄰工作點很近時以低空跨越。
+        """
+        start = self.position if start is None else start
+        waypoints = plan_tasks(start, tasks, self.Z_SAFE_RETRACT, end=end, blend_radius=self.blend_radius,
+                               hop_height=self.hop_height, skip_retract_distance=self.skip_retract_distance)
+        return waypoints, trajectory_time(start, waypoints, self.max_velocity, self.max_acceleration)
+
+    def _run_tasks(self, tasks, color, end=None):
+        """(動作執行線程) 規劃並執行一條軌跡；grip 後夾具持有 color，release 後清空"""
+        waypoints, duration = self.plan(tasks, end)
+        self.planned_motion_time += duration
+        write_log(f"機械臂軌跡：{len(tasks)} 個工作點，{len(waypoints)} 個路徑點，"
+                  f"停止 {sum(w.blend <= 0 for w in waypoints)} 次，估計 {duration:.2f} 秒。", DEBUG)
+        for waypoint in waypoints:
+            self.move_to_position(waypoint.x, waypoint.y, waypoint.z, blend_radius=waypoint.blend)
+            if waypoint.action == "grip":
+                self.activate_gripper()
+                self.holding = color
+            elif waypoint.action == "release":
+                self.release_gripper()
+                self.holding = None
+        if SIMULATION_TIME_SCALE > 0:
+            time.sleep(duration * SIMULATION_TIME_SCALE) # 模擬軌跡執行時間
+
+    def move_to_position(self, x, y, z, blend_radius=0.0):
         # 這是底層的移動指令，您需要對接到您的機械臂 SDK
+        # blend_radius > 0 時不等待到位，以此半徑混合到下一個路徑點 (大多數 SDK 的 blend / radius 參數)
         # 例如：
-        # your_robot_sdk_instance.move_to_cartesian(x, y, z)
-        write_log(f"機械臂模擬：移動到 X:{x:.2f}, Y:{y:.2f}, Z:{z:.2f}")
-        pass 
+        # your_robot_sdk_instance.move_to_cartesian(x, y, z, radius=blend_radius, wait=blend_radius <= 0)
+        write_log(f"機械臂模擬：移動到 X:{x:.2f}, Y:{y:.2f}, Z:{z:.2f}"
+                  f"{f' (混合半徑 {blend_radius:.0f}mm)' if blend_radius > 0 else ''}", DEBUG)
+        self.position = (x, y, z)
 
     def activate_gripper(self):
         write_log("機械臂模擬：夾具/吸盤激活。")
@@ -138,8 +461,51 @@ class RobotArmController:
         # 實際控制夾具/吸盤的開合或真空泵
         pass
 
-    def reset_board(self):
-        write_log("機械臂模擬：清空棋盤 (物理操作)。")
-        # 這裡可以加入機械臂掃過棋盤，將所有棋子移除的邏輯
-        time.sleep(5) # 模擬清空時間
-        write_log("機械臂模擬：清空棋盤完成。")
\ No newline at end of file
+    def reset_board(self, board_state=None):
+        """
+        清空棋盤 (阻塞)：把 board_state ({'D4': 'B', ...}) 中的棋子依顏色分別移回棋子盒，
+        耗時隨移動距離而定。沒有提供棋盤狀態時視為棋盤已經是空的。
+        """
+        if not board_state:
+            write_log("機械臂模擬：棋盤上沒有棋子，不需要清空。")
+            return True
+        write_log(f"機械臂模擬：清空棋盤 (物理操作)，共 {len(board_state)} 顆棋子。")
+        handles = []
+        for color in ("B", "W"):
+            vertices = [vertex for vertex, stone in board_state.items() if stone == color]
+            handle = self.remove_stones_async(vertices, color)
+            if handle is not None:
+                handles.append(handle)
+        for handle in handles:
+            handle.wait()
+        ok = all(handle.ok for handle in handles)
+        write_log("機械臂模擬：清空棋盤完成。" if ok else "錯誤：清空棋盤失敗。")
+        return ok
+
+
+if __name__ == "__main__":
+    # 以實測點建立機械臂座標表，例如把末端對準 A1、T1、A19、T19 後記錄的座標:
+    #   python robot_controller.py --measure A1=150.2,99.8 T1=510.9,104.1 A19=146.0,460.3 T19=507.2,463.5
+    parser = argparse.ArgumentParser(description="機械臂座標表校準")
+    parser.add_argument("--measure", nargs="+", metavar="VERTEX=X,Y", help="實測點 (GTP 座標=機械臂 X,Y mm)")
+    parser.add_argument("--model", choices=("affine", "bilinear"), help="擬合模型 (預設實測點 >= 4 時為 bilinear)")
+    args = parser.parse_args()
+
+    if args.measure:
+        try:
+            measurements = {}
+            for item in args.measure:
+                vertex, xy = item.split("=")
+                x, y = (float(v) for v in xy.split(","))
+                measurements[vertex.strip().upper()] = (x, y)
+        except ValueError:
+            write_log(f"錯誤: 實測點格式應為 VERTEX=X,Y，例如 D4=210.5,160.2: {args.measure}")
+            exit(1)
+        model = args.model or ("bilinear" if len(measurements) >= 4 else "affine")
+        table, rms = fit_board_table(measurements, model)
+        if table is None or not save_board_table(table, measurements, model):
+            exit(1)
+        set_board_table(table)
+    for vertex in ("A1", "T1", "K10", "A19", "T19"):
+        x, y = gtp_to_robot_coords(vertex)
+        write_log(f"{vertex}: X={x:.2f}mm, Y={y:.2f}mm")
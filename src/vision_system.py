@@ -1,29 +1,176 @@
 # src/vision_system.py
+import argparse
 import cv2
+import threading
 import time
+from collections import deque
 import numpy as np 
 import json 
 import os   
-from _shared_utils import write_log
+from _shared_utils import write_log, DEBUG
+from go_rules import (GTP_COLUMNS, EMPTY, BLACK, WHITE, STONE_NAMES, STONE_VALUES, # 棋盤表示與提子規則
+                      gtp_to_index, board_state_to_array, board_array_to_state, find_captures)
+from grid_calibration import (find_board_corners, DEFAULT_CANNY_THRESHOLD1, DEFAULT_CANNY_THRESHOLD2,
+                              DEFAULT_HOUGH_THRESHOLD, DEFAULT_HOUGH_MIN_LINE_LENGTH, DEFAULT_HOUGH_MAX_LINE_GAP,
+                              DEFAULT_RANSAC_ITERATIONS, DEFAULT_RANSAC_LINE_TOLERANCE, DEFAULT_RANSAC_MIN_INLIERS_RATIO)
 # 注意: 在手動模式下，此檔案不再需要 KMeans 庫
 # from sklearn.cluster import KMeans 
 
 # --- 定義參數儲存檔案的路徑 ---
 PARAM_FILE_NAME = 'vision_parameters.json' 
 EMPTY_BOARD_TEMPLATE_FILE = 'empty_board_template.npy' # 新增：空棋盤模板檔案
+# 校準檔：網格、角點、homography、閾值，以及偵測需要的模板 ROI 灰度平均和縮小模板 (幾十 KB)
+# 啟動時只讀這個檔案；完整的模板影像以 mmap 開啟，只在需要重新計算時才實際讀取
+CALIBRATION_FILE_NAME = 'vision_calibration.npz'
+CALIBRATION_FORMAT_VERSION = 1
+
+UNSTABLE = -1 # 穩定性過濾後尚未連續穩定的交叉點 (其他狀態見 go_rules 的 EMPTY / BLACK / WHITE)
+
+STABILITY_MAX_FRAMES = 30 # 與 'Stability Frames' 滑桿上限相同，環形緩衝區一次配置到此大小
+# --- 畫面變化閘門：棋盤區域沒有變化時跳過棋子分類 ---
+GATE_DOWNSAMPLE = 4 # 比較變化時每隔幾個像素取樣一次棋盤區域
+GATE_NEIGHBORHOOD = 1.5 # 比較範圍為 ROI 半徑的倍數，涵蓋交叉點周圍
+GATE_THRESHOLD = 4.0 # 鄰域平均灰度變化超過此值才重新分類該交叉點
+# --- 遮擋偵測：手或機械臂在棋盤上方時整幀不分類、不投票 ---
+OCCLUSION_DIFF_THRESHOLD = 30 # 與空棋盤模板的差異 (任一色彩通道) 超過此值的像素視為前景
+OCCLUSION_MIN_STONES = 3 # 前景區塊大於幾顆棋子的面積才算遮擋 (單獨一顆新落子不算)
+GATE_STATS_INTERVAL = 300 # 每隔多少幀記錄一次跳過比例
+# 校正影像的取樣方式：偵測只使用 ROI 平均，最近鄰取樣的結果幾乎相同但 remap 快約 2.5 倍
+RECTIFY_INTERPOLATION = cv2.INTER_NEAREST
+FIRST_FRAME_TIMEOUT = 5.0 # 啟動攝影機後等待第一幀的最長時間 (秒)
+# --- 自動校準 (Hough 直線 + RANSAC)，遊戲中在背景重新校準以追蹤攝影機漂移 ---
+DEFAULT_AUTO_CALIBRATION_PARAMS = {
+    'canny_threshold1': DEFAULT_CANNY_THRESHOLD1,
+    'canny_threshold2': DEFAULT_CANNY_THRESHOLD2,
+    'hough_threshold': DEFAULT_HOUGH_THRESHOLD,
+    'hough_min_line_length': DEFAULT_HOUGH_MIN_LINE_LENGTH,
+    'hough_max_line_gap': DEFAULT_HOUGH_MAX_LINE_GAP,
+    'ransac_iterations': DEFAULT_RANSAC_ITERATIONS,
+    'ransac_line_tolerance': DEFAULT_RANSAC_LINE_TOLERANCE,
+    'ransac_min_inliers_ratio': DEFAULT_RANSAC_MIN_INLIERS_RATIO,
+}
+AUTO_RECALIBRATION_INTERVAL = 60.0 # 遊戲中每隔多少秒在背景重新校準一次 (0 表示停用)
+AUTO_RECALIBRATION_MIN_SHIFT = 0.5 # 角點移動小於此值 (像素) 時不更新，保留 ROI 快取與穩定性歷史
+AUTO_RECALIBRATION_MAX_SHIFT_CELLS = 0.5 # 角點移動超過此倍數的格距 (單位為格，不是像素) 視為誤判，不更新
+# --- 無顯示器 (headless) 模式：不建立任何視窗，以定期的指標日誌取代預覽畫面 ---
+METRICS_LOG_INTERVAL = 10.0 # 每隔多少秒記錄一次視覺指標 (秒)
+METRICS_WINDOW = 300 # 延遲統計使用最近多少次偵測
+# 可由命令列或呼叫端覆寫的參數 (覆寫參數檔和校準檔中的值)
+PARAMETER_OVERRIDE_KEYS = ('camera_index', 'black_stone_diff', 'white_stone_diff', 'stability_frames',
+                           'stone_detection_roi_radius', 'auto_recalibration_interval')
+
+
+def build_roi_bounds(grid_map, radius, frame_shape):
+    """
+    依網格地圖計算每個交叉點 ROI 在積分影像中的邊界 (只需在校準後計算一次)。
+    返回 (y0, y1, x0, x1, area)，每個都是 (19, 19) 陣列；超出畫面的部分會被裁切。
+    """
+    height, width = frame_shape[:2]
+    x = grid_map[..., 0].astype(np.intp)
+    y = grid_map[..., 1].astype(np.intp)
+    x0 = np.clip(x - radius, 0, width)
+    x1 = np.clip(x + radius, 0, width)
+    y0 = np.clip(y - radius, 0, height)
+    y1 = np.clip(y + radius, 0, height)
+    area = np.maximum(x1 - x0, 0) * np.maximum(y1 - y0, 0)
+    return y0, y1, x0, x1, area
+
+
+def roi_means(gray, bounds):
+    """用積分影像一次算出所有交叉點 ROI 的平均灰度，ROI 為空的交叉點返回 NaN"""
+    y0, y1, x0, x1, area = bounds
+    integral = cv2.integral(gray)
+    sums = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(area > 0, sums / area, np.nan)
+
+
+def sort_board_corners(corners):
+    """把四個角點排成 [左上, 右上, 右下, 左下] (與 vision_work 的 _sort_manual_corners 相同)"""
+    corners = np.array(corners, dtype="float32")
+    s = corners.sum(axis=1)
+    diff = np.diff(corners, axis=1).ravel()
+    return np.array([corners[np.argmin(s)], corners[np.argmin(diff)], corners[np.argmax(s)], corners[np.argmax(diff)]],
+                    dtype="float32")
+
+
+def rectified_grid(board_dim, size):
+    """
+    校正後 size x size 棋盤影像中的交叉點座標 (19, 19, 2)，四周留半格邊界。
+    與 grid_map 相同，row 0 (第 1 線) 在影像下方。
+    """
+    margin = size / (2 * board_dim)
+    step = (size - 2 * margin) / (board_dim - 1)
+    grid = np.zeros((board_dim, board_dim, 2), dtype=np.float32)
+    grid[..., 0] = margin + np.arange(board_dim)[np.newaxis, :] * step
+    grid[..., 1] = margin + (board_dim - 1 - np.arange(board_dim))[:, np.newaxis] * step
+    return grid
+
+
+def build_rectify_maps(homography, size):
+    """
+    預先計算 cv2.remap 的查找表：校正影像每個像素對應到原始畫面的位置。
+    轉成定點格式 (CV_16SC2) 讓每幀的 remap 更快；最近鄰取樣只需要第一個查找表。
+    """
+    u, v = np.meshgrid(np.arange(size, dtype=np.float32), np.arange(size, dtype=np.float32))
+    points = np.stack([u, v], axis=-1).reshape(-1, 1, 2)
+    source = cv2.perspectiveTransform(points, np.linalg.inv(homography)).reshape(size, size, 2)
+    return cv2.convertMaps(source[..., 0], source[..., 1], cv2.CV_16SC2)
+
 
 class VisionSystem:
-    def __init__(self):
+    def __init__(self, headless=False, show_preview=None, parameter_overrides=None):
         write_log("VisionSystem 初始化。")
+        # True 時不建立任何 HighGUI 視窗與參數滑桿 (生產環境或離線基準測試等沒有顯示器的環境)，
+        # 參數只來自參數檔、校準檔和 parameter_overrides
+        self.headless = headless
+        self.show_preview = not headless if show_preview is None else show_preview # False 時不繪製、不顯示預覽畫面
         self.cap = None 
         self.camera_index = 0 
 
+        # --- 背景擷取線程：持續讀取攝影機，只保留最新一幀 ---
+        self._capture_thread = None
+        self._capture_stop = threading.Event()
+        self._frame_lock = threading.Lock()
+        self._first_frame = threading.Event()
+        self._latest_frame = None # 最新一幀 (前緩衝)，擷取線程寫入後備緩衝再與之交換
+        self._back_frame = None
+        self.frame_seq = 0 # 已擷取的幀序號
+        self.frame_timestamp = None # 最新一幀的擷取時間 (time.perf_counter)
+        self._last_consumed_seq = 0
+        self.dropped_frames = 0 # 擷取後從未被取用就被新幀覆蓋的幀數
+        self.capture_failures = 0
+        self._work_frame = None # get_board_state 重複使用的影像緩衝
+        self._work_frame_seq = 0 # 工作緩衝中影像的幀序號
+        self._new_frame = threading.Condition(self._frame_lock) # 擷取到新的一幀時通知等待中的遊戲迴圈
+        # --- 視覺指標 (headless 模式下取代預覽畫面) ---
+        self._detection_latencies_ms = deque(maxlen=METRICS_WINDOW) # 擷取到偵測完成的延遲
+        self._detection_times_ms = deque(maxlen=METRICS_WINDOW) # 偵測本身的耗時
+        self._last_metrics_time = time.perf_counter()
+
         self.TRANSFORMED_BOARD_SIZE = 600
         self.BOARD_DIM = 19
         
-        self.manual_mode = "manual_grid"
+        self.manual_mode = "manual_grid" # "manual_grid" (38 點) 或 "manual_corners" (4 個角點)
         self.manual_points = []
         self.grid_map = None
+
+        # --- 透視校正：四個角點算出 homography 後，每幀只把棋盤區域 remap 成固定大小的正視影像 ---
+        self.board_corners = None # [左上, 右上, 右下, 左下] 的畫面座標
+        self.homography = None # 原始畫面 -> 校正影像
+        self._rectified_grid = None # 校正影像中的交叉點座標
+        self._rectify_key = None # (homography, 畫面大小)，改變時重新建立查找表
+        self._rectify_maps = None
+        self._rectified_frame = None # remap 的輸出緩衝
+        self._rectified_template = None
+        self._rectified_template_source = None
+        # --- 自動校準 ---
+        self.auto_calibration_params = dict(DEFAULT_AUTO_CALIBRATION_PARAMS)
+        self.auto_recalibration_interval = AUTO_RECALIBRATION_INTERVAL
+        self.last_calibration = None # 最近一次成功的自動校準結果 (角點、殘差、耗時)
+        self._calibration_thread = None
+        self._pending_calibration = None # 背景校準的結果，由 get_board_state 在主線程套用
+        self._last_calibration_time = time.perf_counter()
         self.manual_point_colors = [(0, 255, 255), (0, 255, 0)]
         self.control_window_name = 'Vision Parameters'
         
@@ -38,16 +185,73 @@ class VisionSystem:
         # --- 穩定性偵測參數 (新增) ---
         self._hardcoded_default_stability_frames = 5 # 偵測結果需要連續穩定5幀才確認
         self.stability_frames = 0
-        self.history_buffer = {} # 儲存每個格點的偵測歷史
+        # 每個格點的偵測歷史：固定大小的環形緩衝區，加上最近 stability_frames 幀中各狀態的票數
+        self._history = np.zeros((STABILITY_MAX_FRAMES, self.BOARD_DIM, self.BOARD_DIM), dtype=np.int8)
+        self._history_index = 0 # 下一幀寫入的位置
+        self._history_count = 0 # 緩衝區中的有效幀數 (最多 STABILITY_MAX_FRAMES)
+        self._votes = np.zeros((3, self.BOARD_DIM, self.BOARD_DIM), dtype=np.int16) # [EMPTY/BLACK/WHITE, row, col]
+        self.stable_board = np.full((self.BOARD_DIM, self.BOARD_DIM), UNSTABLE, dtype=np.int8)
+        self._next_stable_board = self.stable_board.copy()
+        self.stable_board_version = 0 # stable_board 內容每改變一次加一
+
+        # --- 落子偵測：與最後確認的棋盤比較 ---
+        self.confirmed_board = np.zeros((self.BOARD_DIM, self.BOARD_DIM), dtype=np.int8) # 遊戲確認過的棋盤 (含雙方落子與提子)
+        self._pending_removal = np.zeros((self.BOARD_DIM, self.BOARD_DIM), dtype=np.int8) # 已被提掉但仍在實體棋盤上的棋子顏色
+        self._diffed_version = None # 上次比較時的 stable_board_version，沒有變化就不重新比較
+        self.last_move_captures = [] # 最近一次偵測到的落子預期會提掉的棋子 (GTP 座標)
         
         self.empty_board_template = None 
+        self._template_version = 0 # 偵測使用的模板 (原始或校正後) 每改變一次加一
+        self._roi_cache_key = None # (網格, 模板版本, 半徑, 畫面大小)，任一改變就重新計算 ROI 邊界與模板平均
+        self._calibration_cache = None # 校準檔中預先計算的 (模板版本, 半徑, 畫面大小, 模板平均, 縮小模板)
+        self._roi_bounds = None
+        self._template_means = None
+        self._board_crop = None # (y0, y1, x0, x1)：包含所有 ROI 的棋盤區域，只對這一塊做灰度轉換
+        self._gate_bounds = None # 縮小後棋盤區域中每個交叉點鄰域的邊界
+        self._gate_size = None
+        self._gate_reference = None # 每個交叉點上次分類時的鄰域平均灰度
+        self._last_raw_board = None # 上一次 (未經穩定性過濾的) 分類結果
+        self._last_detected_seq = None # 上一次進行偵測的幀序號，同一幀不重複偵測
+        self.detection_frames = 0
+        self.detection_skipped_frames = 0 # 棋盤區域沒有變化而跳過分類的幀數
+        self.reclassified_points = 0 # 累計重新分類的交叉點數
+        self._template_small = None # 縮小後的空棋盤模板 (彩色)，用於遮擋偵測
+        self._stone_label = None # 縮小影像中每個像素所屬交叉點的棋子範圍 (-1 表示不在任何棋子範圍內)
+        self._occlusion_min_area = 0
+        self._not_stone_mask = None # 255 表示不在任何已知棋子範圍內，依 _stone_mask_board 快取
+        self._stone_mask_board = None
+        self.occluded = False # 最新一幀是否被遮擋
+        self.occlusion_mask = np.zeros((self.BOARD_DIM, self.BOARD_DIM), dtype=bool) # 被遮擋的交叉點
+        self.occluded_frames = 0
+
+        # --- 預覽畫面：網格每次校準只繪製一次，棋子標記只重繪有變化的交叉點，每幀以遮罩複製到畫面上 ---
+        self._overlay_key = None # (grid_map, 畫面大小, ROI 半徑)
+        self._grid_layer = None # 只有網格的圖層與遮罩，用來擦除棋子標記
+        self._grid_layer_mask = None
+        self._overlay = None # 網格 + 棋子標記
+        self._overlay_mask = None
+        self._overlay_board = None # 圖層上目前畫出的棋子
 
         self._load_parameters()
         self.black_stone_diff = self._default_black_stone_diff
         self.white_stone_diff = self._default_white_stone_diff
         self.stability_frames = self._default_stability_frames
+        if parameter_overrides:
+            self._apply_parameter_overrides(parameter_overrides)
         
-        self._create_parameter_trackbars()
+        if not self.headless:
+            self._create_parameter_trackbars()
+
+    def _apply_parameter_overrides(self, overrides):
+        """以命令列或呼叫端提供的值覆寫載入的參數 (不寫回參數檔)"""
+        for key, value in overrides.items():
+            if key not in PARAMETER_OVERRIDE_KEYS:
+                write_log(f"警告: 忽略未知的視覺參數 '{key}'。")
+                continue
+            setattr(self, key, value)
+            write_log(f"視覺參數 {key} 覆寫為 {value}。")
+        self.stability_frames = max(1, min(self.stability_frames, STABILITY_MAX_FRAMES))
+        self._recount_votes()
 
 
     def _load_parameters(self):
@@ -64,6 +268,8 @@ class VisionSystem:
                 self._default_black_stone_diff = params.get('black_stone_diff', self._hardcoded_default_black_stone_diff)
                 self._default_white_stone_diff = params.get('white_stone_diff', self._hardcoded_default_white_stone_diff)
                 self._default_stability_frames = params.get('stability_frames', self._hardcoded_default_stability_frames)
+                self.auto_calibration_params.update(params.get('auto_calibration', {}))
+                self.auto_recalibration_interval = params.get('auto_recalibration_interval', AUTO_RECALIBRATION_INTERVAL)
                 write_log(f"參數從 '{PARAM_FILE_NAME}' 載入成功。")
         except FileNotFoundError:
             write_log(f"參數檔案 '{PARAM_FILE_NAME}' 未找到，使用硬編碼預設值。")
@@ -76,19 +282,66 @@ class VisionSystem:
             self._set_hardcoded_defaults()
         
         if os.path.exists(EMPTY_BOARD_TEMPLATE_FILE):
-            self.empty_board_template = np.load(EMPTY_BOARD_TEMPLATE_FILE)
+            # 以 mmap 開啟：有校準檔時偵測只用預先計算的模板平均，完整影像不會被讀入
+            self.empty_board_template = np.load(EMPTY_BOARD_TEMPLATE_FILE, mmap_mode='r')
+            self._template_version += 1
             write_log(f"已載入保存的空棋盤模板 '{EMPTY_BOARD_TEMPLATE_FILE}'。")
         else:
             self.empty_board_template = None
             write_log("未找到空棋盤模板，請在校準後創建。")
 
-        if '_saved_grid_map' in self._loaded_params and self._loaded_params['_saved_grid_map']:
+        if self._load_calibration():
+            return
+        if self._loaded_params.get('board_corners'):
+            self.set_board_corners(self._loaded_params['board_corners'])
+            self.manual_mode = "manual_corners"
+            write_log("已載入保存的棋盤角點，使用透視校正偵測。")
+        elif '_saved_grid_map' in self._loaded_params and self._loaded_params['_saved_grid_map']:
             self.grid_map = np.array(self._loaded_params['_saved_grid_map'])
             write_log("已載入保存的手動網格地圖。")
         else:
             self.manual_points = []
             self.grid_map = None
 
+    def _load_calibration(self):
+        """
+        從校準檔載入網格、透視校正、閾值和預先計算的模板資料。
+        檔案不存在或版本不符時返回 False，改用舊的 JSON 網格地圖。
+        """
+        if not os.path.exists(CALIBRATION_FILE_NAME):
+            return False
+        try:
+            with np.load(CALIBRATION_FILE_NAME) as bundle:
+                version = int(bundle['version'])
+                if version != CALIBRATION_FORMAT_VERSION:
+                    write_log(f"校準檔 '{CALIBRATION_FILE_NAME}' 的版本 {version} 不相容 (目前為 {CALIBRATION_FORMAT_VERSION})，改用參數檔。")
+                    return False
+                black_diff, white_diff, stability_frames, roi_radius = (int(v) for v in bundle['thresholds'])
+                grid_map = bundle['grid_map'].astype(np.int32)
+                board_corners = bundle['board_corners']
+                homography = bundle['homography']
+                detection_shape = tuple(int(v) for v in bundle['detection_shape'])
+                template_means = bundle['template_means'].astype(np.float64)
+                template_small = bundle['template_small']
+        except Exception as e:
+            write_log(f"讀取校準檔 '{CALIBRATION_FILE_NAME}' 時發生錯誤: {e}，改用參數檔。")
+            return False
+
+        self._default_black_stone_diff = black_diff
+        self._default_white_stone_diff = white_diff
+        self._default_stability_frames = stability_frames
+        self.stone_detection_roi_radius = roi_radius
+        self.grid_map = grid_map
+        if board_corners.size:
+            self.board_corners = board_corners.astype(np.float32)
+            self.homography = homography
+            self._rectified_grid = np.round(rectified_grid(self.BOARD_DIM, self.TRANSFORMED_BOARD_SIZE)).astype(np.int32)
+            self.manual_mode = "manual_corners"
+        self._calibration_cache = (self._template_version, roi_radius, detection_shape, template_means, template_small)
+        write_log(f"已載入校準檔 '{CALIBRATION_FILE_NAME}' (版本 {version}，"
+                  f"{'透視校正' if board_corners.size else '手動網格地圖'})。")
+        return True
+
     def _set_hardcoded_defaults(self):
         self._default_black_stone_diff = self._hardcoded_default_black_stone_diff
         self._default_white_stone_diff = self._hardcoded_default_white_stone_diff
@@ -96,13 +349,18 @@ class VisionSystem:
 
 
     def _save_parameters(self):
-        """將當前參數和網格地圖保存到檔案中。"""
+        """將校準 (網格、透視校正、閾值、模板平均) 保存到校準檔，其餘可調參數保存到參數檔。"""
         params_to_save = {
             'black_stone_diff': self.black_stone_diff,
             'white_stone_diff': self.white_stone_diff,
             'stability_frames': self.stability_frames,
-            '_saved_grid_map': self.grid_map.tolist() if self.manual_mode == "manual_grid" and self.grid_map is not None else None,
+            'auto_calibration': self.auto_calibration_params,
+            'auto_recalibration_interval': self.auto_recalibration_interval,
         }
+        if not self._save_calibration():
+            # 還沒有空棋盤模板時無法建立校準檔，網格仍以舊格式保存在參數檔中
+            params_to_save['_saved_grid_map'] = self.grid_map.tolist() if self.grid_map is not None else None
+            params_to_save['board_corners'] = self.board_corners.tolist() if self.board_corners is not None else None
         try:
             with open(PARAM_FILE_NAME, 'w') as f:
                 json.dump(params_to_save, f, indent=4)
@@ -115,6 +373,42 @@ class VisionSystem:
         except Exception as e:
             write_log(f"保存參數到 '{PARAM_FILE_NAME}' 時發生錯誤: {e}")
 
+    def _save_calibration(self):
+        """
+        把校準與偵測需要的模板資料寫入版本化的 .npz 校準檔。
+        模板平均和縮小模板在偵測空間 (有透視校正時為校正影像) 中計算，載入後不需讀取完整模板。
+        """
+        if self.grid_map is None or (self.empty_board_template is None and self._calibration_cache is None):
+            write_log("尚未完成網格校準或空棋盤模板，不保存校準檔。")
+            return False
+        if self.homography is not None:
+            detection_shape, grid = (self.TRANSFORMED_BOARD_SIZE, self.TRANSFORMED_BOARD_SIZE), self._rectified_grid
+        elif self.empty_board_template is not None:
+            detection_shape, grid = self.empty_board_template.shape[:2], self.grid_map
+        else:
+            detection_shape, grid = self._calibration_cache[2], self.grid_map # 只有校準檔時沿用其中的畫面大小
+        if not self._prepare_roi_cache(detection_shape, grid):
+            return False
+        try:
+            with open(CALIBRATION_FILE_NAME, 'wb') as f:
+                np.savez_compressed(
+                    f,
+                    version=np.int32(CALIBRATION_FORMAT_VERSION),
+                    thresholds=np.array([self.black_stone_diff, self.white_stone_diff, self.stability_frames,
+                                         self.stone_detection_roi_radius], dtype=np.int16),
+                    grid_map=self.grid_map.astype(np.int16),
+                    board_corners=(self.board_corners if self.board_corners is not None else np.empty((0, 2))).astype(np.float32),
+                    homography=self.homography if self.homography is not None else np.empty((0, 3)),
+                    detection_shape=np.array(detection_shape, dtype=np.int32),
+                    template_means=self._template_means.astype(np.float32),
+                    template_small=self._template_small,
+                )
+            write_log(f"校準成功保存到 '{CALIBRATION_FILE_NAME}' ({os.path.getsize(CALIBRATION_FILE_NAME) / 1024:.1f} KB)。")
+            return True
+        except Exception as e:
+            write_log(f"保存校準到 '{CALIBRATION_FILE_NAME}' 時發生錯誤: {e}")
+            return False
+
 
     def _create_parameter_trackbars(self):
         """創建用於調整影像處理參數的滑桿 UI。"""
@@ -134,6 +428,13 @@ class VisionSystem:
         # 清除手動選點按鈕
         cv2.createTrackbar('Clear Points', self.control_window_name, 0, 1, self._on_clear_manual_points)
 
+        # 校準模式：0 = 點選 38 個網格點，1 = 點選 4 個角點 (透視校正)
+        cv2.createTrackbar('Corner Mode', self.control_window_name, int(self.manual_mode == "manual_corners"), 1,
+                           self._on_corner_mode_change)
+
+        # 自動校準：由棋盤線自動找出四個角點 (取代手動點選)
+        cv2.createTrackbar('--- Auto Calibrate ---', self.control_window_name, 0, 1, self._on_auto_calibrate_press)
+
         # 重置和保存按鈕
         cv2.createTrackbar('--- Reset All ---', self.control_window_name, 0, 1, self._on_reset_button_press)
         cv2.createTrackbar('--- Save Grid Map ---', self.control_window_name, 0, 1, self._on_save_button_press)
@@ -143,41 +444,66 @@ class VisionSystem:
     # --- 滑桿回調函數 (Callback Functions) ---
     def _on_black_stone_diff_change(self, val):
         self.black_stone_diff = -val
+        # 閾值不在變化閘門的比較內容中，清除閘門讓靜止畫面也以新閾值重新分類
+        self._gate_reference = None
+        self._last_raw_board = None
     
     def _on_white_stone_diff_change(self, val):
         self.white_stone_diff = val
+        self._gate_reference = None
+        self._last_raw_board = None
 
     def _on_stability_frames_change(self, val):
         self.stability_frames = val if val > 0 else 1 # 穩定幀數至少為 1
+        self._recount_votes()
     
     def _on_save_empty_board_press(self, val):
         if val == 1:
-            write_log("正在保存空棋盤模板...")
-            ret, frame = self.cap.read()
-            if ret:
-                if self.grid_map is not None:
-                    # 我們將原始的彩色幀保存為模板，以便後續可以進行彩色或灰度處理
-                    np.save(EMPTY_BOARD_TEMPLATE_FILE, frame)
-                    self.empty_board_template = frame
-                    write_log(f"空棋盤模板 '{EMPTY_BOARD_TEMPLATE_FILE}' 已保存。")
-                else:
-                    write_log("錯誤: 請先完成網格校準，才能保存空棋盤模板！")
-            else:
-                write_log("錯誤: 無法從攝影機讀取影像來保存模板。")
+            self.save_empty_board()
             cv2.setTrackbarPos('--- Save Empty Board ---', self.control_window_name, 0)
+
+    def save_empty_board(self):
+        """以最新一幀作為空棋盤模板並保存，成功時返回 True"""
+        write_log("正在保存空棋盤模板...")
+        frame, _, _ = self.read_latest_frame()
+        if frame is None:
+            write_log("錯誤: 無法從攝影機讀取影像來保存模板。")
+            return False
+        if self.grid_map is None:
+            write_log("錯誤: 請先完成網格校準，才能保存空棋盤模板！")
+            return False
+        # 我們將原始的彩色幀保存為模板，以便後續可以進行彩色或灰度處理
+        np.save(EMPTY_BOARD_TEMPLATE_FILE, frame)
+        self.empty_board_template = frame
+        self._template_version += 1
+        write_log(f"空棋盤模板 '{EMPTY_BOARD_TEMPLATE_FILE}' 已保存。")
+        return True
     
     def _on_clear_manual_points(self, val):
         if val == 1:
             write_log("清除所有手動選擇的點。")
             self.manual_points = []
-            self.grid_map = None
+            self._clear_calibration()
             cv2.setTrackbarPos('Clear Points', self.control_window_name, 0)
 
+    def _on_corner_mode_change(self, val):
+        self.manual_mode = "manual_corners" if val == 1 else "manual_grid"
+        self.manual_points = []
+        write_log(f"校準模式切換為 {'4 個角點 (透視校正)' if val == 1 else '38 個網格點'}。")
+
+    def _on_auto_calibrate_press(self, val):
+        if val == 1:
+            write_log("正在自動校準棋盤網格...")
+            if self.auto_calibrate() is not None:
+                self.manual_points = []
+                self.manual_mode = "manual_corners"
+            cv2.setTrackbarPos('--- Auto Calibrate ---', self.control_window_name, 0)
+
     def _on_reset_button_press(self, val):
         if val == 1: 
             write_log("重置所有點和網格地圖。")
             self.manual_points = []
-            self.grid_map = None
+            self._clear_calibration()
             cv2.setTrackbarPos('Clear Points', self.control_window_name, 0)
             cv2.setTrackbarPos('--- Reset All ---', self.control_window_name, 0)
 
@@ -186,14 +512,49 @@ class VisionSystem:
             self._save_parameters()
             cv2.setTrackbarPos('--- Save Grid Map ---', self.control_window_name, 0) 
 
+    def _calibration_locked(self):
+        """
+        沒有完整的空棋盤模板而只有校準檔時，校準檔的模板資料只適用於目前的校準：
+        清除或更換校準會讓棋子偵測在本次執行中停止，因此拒絕並返回 True。
+        """
+        if self.empty_board_template is None and self._calibration_cache is not None:
+            write_log("錯誤: 沒有空棋盤模板，校準檔的模板資料只適用於目前的校準，拒絕更改校準 (否則將無法偵測棋子)。"
+                      f"請先在空棋盤上保存空棋盤模板 ('{EMPTY_BOARD_TEMPLATE_FILE}') 再重新校準。")
+            return True
+        return False
+
+    def _clear_calibration(self):
+        """清除網格與透視校正；只有校準檔時拒絕並保留原本的校準，返回 False"""
+        if self._calibration_locked():
+            return False
+        self.grid_map = None
+        self.board_corners = None
+        self.homography = None
+        self._template_version += 1
+        return True
+
+    def _required_points(self):
+        return 4 if self.manual_mode == "manual_corners" else self.BOARD_DIM * 2
+
     def _mouse_callback(self, event, x, y, flags, param):
         if event == cv2.EVENT_LBUTTONDOWN:
-            if self.manual_mode == "manual_grid":
+            if self.manual_mode == "manual_corners":
+                if len(self.manual_points) < 4:
+                    self.manual_points.append((x, y))
+                    write_log(f"角點模式：點擊角點 {len(self.manual_points)}/4: ({x}, {y})")
+                    if len(self.manual_points) == 4:
+                        write_log("已點選四個角點 (A1、T1、T19、A19 的交叉點)。正在計算透視校正...")
+                        if not self.set_board_corners(self.manual_points):
+                            self.manual_points = []
+            elif self.manual_mode == "manual_grid":
                 if len(self.manual_points) < self.BOARD_DIM * 2: 
                     self.manual_points.append((x, y))
                     write_log(f"手動網格模式：點擊點 {len(self.manual_points)}/{self.BOARD_DIM*2}: ({x}, {y})")
                     if len(self.manual_points) == self.BOARD_DIM * 2:
                         write_log("已點選所有網格校準點。正在建立網格地圖...")
+                        if not self._clear_calibration():
+                            self.manual_points = []
+                            return
                         self.grid_map = self._create_grid_map(self.manual_points)
                         if self.grid_map is not None:
                              write_log("網格地圖創建成功。")
@@ -224,6 +585,141 @@ class VisionSystem:
         write_log("已成功創建 19x19 網格地圖。")
         return grid
 
+    def set_board_corners(self, corners, keep_rectified_template=False):
+        """
+        以四個角落交叉點 (任意順序) 計算 homography，並由校正影像的規則網格反推畫面上的 grid_map。
+        查找表在下一幀時依畫面大小建立一次，之後每幀只需 remap 棋盤區域。
+        keep_rectified_template=True 用於追蹤攝影機漂移：空棋盤模板是在舊的位置拍攝的，
+        沿用以舊 homography 校正過的模板 (棋盤座標不變)，ROI 快取與穩定性歷史也因此得以保留；
+        只有校準檔時，校正空間中的模板平均同樣沿用。
+        沒有完整模板而只有校準檔時，新的校準會讓校準檔的模板資料失效，因此拒絕更新並返回 False。
+        """
+        if keep_rectified_template and self.homography is not None and (
+                self.empty_board_template is not None or self._calibration_cache is not None):
+            if self.empty_board_template is not None:
+                self._detection_template() # 以舊的 homography 校正模板 (已校正過則直接沿用)
+        elif self._calibration_locked():
+            return False
+        else:
+            self._template_version += 1
+        self.board_corners = sort_board_corners(corners)
+        grid = rectified_grid(self.BOARD_DIM, self.TRANSFORMED_BOARD_SIZE)
+        last = self.BOARD_DIM - 1
+        # 左上 = A19、右上 = T19、右下 = T1、左下 = A1
+        targets = np.array([grid[last, 0], grid[last, last], grid[0, last], grid[0, 0]], dtype="float32")
+        self.homography = cv2.getPerspectiveTransform(self.board_corners, targets)
+        if self._rectified_grid is None:
+            self._rectified_grid = np.round(grid).astype(np.int32) # 只與棋盤大小有關，重新校準時沿用同一個物件
+        if not keep_rectified_template:
+            self._rectified_template_source = None
+        projected = cv2.perspectiveTransform(grid.reshape(-1, 1, 2), np.linalg.inv(self.homography))
+        self.grid_map = np.round(projected.reshape(self.BOARD_DIM, self.BOARD_DIM, 2)).astype(np.int32)
+        write_log("已由四個角點建立透視校正與 19x19 網格地圖。")
+        return True
+
+    def auto_calibrate(self, frame=None):
+        """
+        以 Hough 直線和 RANSAC 自動找出四個角點並建立透視校正，取代 38 次手動點選。
+        返回校準結果 (角點、交叉點殘差、耗時)，失敗時返回 None 並保留原本的校準。
+        """
+        if frame is None:
+            frame, _, _ = self.read_latest_frame()
+            if frame is None:
+                write_log("錯誤: 無法從攝影機讀取影像來自動校準。")
+                return None
+        result = find_board_corners(frame, **self.auto_calibration_params)
+        self._last_calibration_time = time.perf_counter()
+        if result is None:
+            write_log("自動校準失敗，保留原本的校準。")
+            return None
+        if not self.set_board_corners(result['corners']):
+            return None
+        self.last_calibration = result
+        write_log(f"自動校準完成：交叉點殘差 {result['residual_px']:.2f} px，耗時 {result['elapsed_ms']:.1f} ms。")
+        return result
+
+    def start_background_calibration(self):
+        """
+        在背景線程以最新一幀重新校準，不中斷遊戲；結果由 get_board_state 在主線程套用。
+        已有背景校準在進行時返回 False。
+        """
+        if self._calibration_thread is not None and self._calibration_thread.is_alive():
+            return False
+        self._last_calibration_time = time.perf_counter()
+        self._calibration_thread = threading.Thread(target=self._background_calibration, name="GridCalibration", daemon=True)
+        self._calibration_thread.start()
+        return True
+
+    def _background_calibration(self):
+        frame, _, _ = self.read_latest_frame()
+        if frame is None:
+            return
+        result = find_board_corners(frame, **self.auto_calibration_params)
+        if result is not None:
+            self._pending_calibration = result
+
+    def _apply_pending_calibration(self):
+        """
+        套用背景校準的結果 (主線程)。角點幾乎沒有移動時不更新；
+        移動超過半格視為誤判 (例如棋盤上有手或大量棋子干擾) 而忽略。
+        """
+        result, self._pending_calibration = self._pending_calibration, None
+        if result is None:
+            return
+        new_corners = sort_board_corners(result['corners'])
+        if self.board_corners is None:
+            shift = np.inf
+        else:
+            shift = float(np.max(np.hypot(*(new_corners - self.board_corners).T)))
+            spacing = np.median(np.hypot(*np.diff(self.grid_map, axis=1).reshape(-1, 2).T))
+            if shift > AUTO_RECALIBRATION_MAX_SHIFT_CELLS * spacing:
+                write_log(f"背景校準：角點移動 {shift:.1f} px 超過半格，視為誤判而忽略。")
+                return
+        self.last_calibration = result
+        if shift < AUTO_RECALIBRATION_MIN_SHIFT:
+            write_log(f"背景校準：角點移動 {shift:.2f} px，不需更新 (殘差 {result['residual_px']:.2f} px，"
+                      f"耗時 {result['elapsed_ms']:.1f} ms)。", DEBUG)
+            return
+        self.set_board_corners(new_corners, keep_rectified_template=True)
+        write_log(f"背景校準：攝影機漂移 {shift:.1f} px，已更新透視校正 (殘差 {result['residual_px']:.2f} px，"
+                  f"耗時 {result['elapsed_ms']:.1f} ms)。")
+
+    def _detection_view(self, frame):
+        """
+        返回棋子偵測使用的 (影像, 網格)。
+        有 homography 時為 remap 後的固定大小正視棋盤影像，否則為原始畫面與 grid_map。
+        """
+        if self.homography is None:
+            return frame, self.grid_map
+        self._ensure_rectify_maps(frame)
+        self._remap(frame, self._rectified_frame)
+        return self._rectified_frame, self._rectified_grid
+
+    def _ensure_rectify_maps(self, frame):
+        cached = self._rectify_key
+        if cached is None or cached[0] is not self.homography or cached[1] != frame.shape:
+            self._rectify_maps = build_rectify_maps(self.homography, self.TRANSFORMED_BOARD_SIZE)
+            self._rectified_frame = np.empty((self.TRANSFORMED_BOARD_SIZE, self.TRANSFORMED_BOARD_SIZE) + frame.shape[2:],
+                                             dtype=frame.dtype)
+            self._rectify_key = (self.homography, frame.shape)
+            write_log("已建立透視校正查找表。", DEBUG)
+
+    def _detection_template(self):
+        """偵測空間中的空棋盤模板；有 homography 時在模板或校正改變後才重新 remap (讀取完整模板)"""
+        if self.homography is None or self.empty_board_template is None:
+            return self.empty_board_template
+        if self._rectified_template_source is not self.empty_board_template:
+            self._ensure_rectify_maps(self.empty_board_template)
+            self._rectified_template = self._remap(self.empty_board_template)
+            self._rectified_template_source = self.empty_board_template
+        return self._rectified_template
+
+    def _remap(self, image, dst=None):
+        map_xy, map_fraction = self._rectify_maps
+        if RECTIFY_INTERPOLATION == cv2.INTER_NEAREST:
+            map_fraction = None # 最近鄰取樣不需要小數部分的查找表
+        return cv2.remap(image, map_xy, map_fraction, RECTIFY_INTERPOLATION, dst=dst)
+
     def start_camera(self):
         self.cap = cv2.VideoCapture(self.camera_index)
         self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
@@ -234,113 +730,541 @@ class VisionSystem:
             return False
         write_log(f"視覺系統成功連接到攝影機索引 {self.camera_index}。")
         
-        cv2.namedWindow('Vision System - Live Feed')
-        cv2.setMouseCallback('Vision System - Live Feed', self._mouse_callback)
+        if self.show_preview:
+            cv2.namedWindow('Vision System - Live Feed')
+            cv2.setMouseCallback('Vision System - Live Feed', self._mouse_callback)
 
+        self._start_capture_thread()
+        if not self._first_frame.wait(FIRST_FRAME_TIMEOUT):
+            write_log(f"警告: 攝影機在 {FIRST_FRAME_TIMEOUT} 秒內沒有送出第一幀。")
+        elif self.headless and self.grid_map is None:
+            # 沒有顯示器就無法手動點選，直接由棋盤線自動校準
+            write_log("headless 模式沒有保存的網格校準，嘗試自動校準...")
+            self.auto_calibrate()
         return True
 
+    def _start_capture_thread(self):
+        self._capture_stop.clear()
+        self._first_frame.clear()
+        self._capture_thread = threading.Thread(target=self._capture_loop, name="FrameGrabber", daemon=True)
+        self._capture_thread.start()
+
+    def _capture_loop(self):
+        """持續讀取攝影機並把最新一幀放入前緩衝，避免偵測使用驅動程式緩衝中的舊影像"""
+        write_log("[Capture Thread] 影像擷取線程啟動。")
+        while not self._capture_stop.is_set():
+            # 讀入後備緩衝 (大小相符時 OpenCV 直接寫入，不重新配置記憶體)
+            ret, frame = self.cap.read(self._back_frame)
+            if not ret:
+                self.capture_failures += 1
+                if self.capture_failures % 30 == 1:
+                    write_log("視覺系統：無法從攝影機讀取影像。")
+                time.sleep(0.01)
+                continue
+            timestamp = time.perf_counter()
+            with self._frame_lock:
+                self._back_frame, self._latest_frame = self._latest_frame, frame
+                if self.frame_seq > self._last_consumed_seq:
+                    self.dropped_frames += 1 # 上一幀沒有被取用就被覆蓋
+                self.frame_seq += 1
+                self.frame_timestamp = timestamp
+                self._new_frame.notify_all()
+            self._first_frame.set()
+        write_log("[Capture Thread] 影像擷取線程結束。")
+
+    def read_latest_frame(self, out=None):
+        """
+        不等待攝影機，直接取得最新一幀的複本。
+        返回 (frame, 序號, 擷取時間)；尚未擷取到任何影像時返回 (None, 0, None)。
+        out 可傳入預先配置的緩衝區以避免每幀配置記憶體。
+        """
+        with self._frame_lock:
+            if self._latest_frame is None:
+                return None, 0, None
+            if out is None or out.shape != self._latest_frame.shape:
+                out = self._latest_frame.copy()
+            else:
+                np.copyto(out, self._latest_frame)
+            self._last_consumed_seq = self.frame_seq
+            return out, self.frame_seq, self.frame_timestamp
+
+    def wait_for_new_frame(self, timeout):
+        """
+        等待擷取線程送出比工作緩衝更新的一幀，讓遊戲迴圈一拿到新幀就偵測，而不是固定間隔輪詢。
+        返回是否有新幀 (逾時返回 False)。
+        """
+        with self._new_frame:
+            return self._new_frame.wait_for(lambda: self.frame_seq > self._work_frame_seq, timeout)
+
+    def capture_stats(self):
+        """擷取統計：已擷取幀數、未被取用而丟棄的幀數、讀取失敗次數與最新一幀的延遲 (ms)"""
+        with self._frame_lock:
+            age_ms = (time.perf_counter() - self.frame_timestamp) * 1000 if self.frame_timestamp else None
+            return {"frames": self.frame_seq, "dropped": self.dropped_frames,
+                    "failures": self.capture_failures, "latest_age_ms": age_ms}
+
     def get_board_state(self):
-        ret, frame = self.cap.read()
-        if not ret:
-            write_log("視覺系統：無法從攝影機讀取影像。")
+        frame, frame_seq, frame_timestamp = self.read_latest_frame(self._work_frame)
+        self._work_frame = frame
+        self._work_frame_seq = frame_seq
+        if frame is None:
+            write_log("視覺系統：尚未從攝影機取得影像。")
             return None
+        new_frame = frame_seq != self._last_detected_seq
+        self._apply_pending_calibration()
+        if (self.auto_recalibration_interval > 0 and self.board_corners is not None and not self.occluded
+                and time.perf_counter() - self._last_calibration_time >= self.auto_recalibration_interval):
+            self.start_background_calibration()
         
-        processed_display_frame = frame.copy() 
         board_state = {}
-
         if self.grid_map is not None:
-            self._draw_grid_map(processed_display_frame)
-            
-            if self.empty_board_template is not None:
-                write_log("網格地圖和模板已載入，正在進行棋子偵測...")
-                board_state = self._detect_stones(frame)
-                self._draw_stone_detections(processed_display_frame, board_state)
+            if self.empty_board_template is not None or self._calibration_cache is not None:
+                # 只回報連續 stability_frames 幀都偵測到同一顏色的棋子；同一幀不重複偵測與投票
+                if new_frame:
+                    self._last_detected_seq = frame_seq
+                    start = time.perf_counter()
+                    self._process_frame(frame)
+                    end = time.perf_counter()
+                    self._detection_times_ms.append((end - start) * 1000)
+                    self._detection_latencies_ms.append((end - frame_timestamp) * 1000)
+                stable_board = self.stable_board
+                board_state = board_array_to_state(np.where(stable_board == UNSTABLE, EMPTY, stable_board))
             else:
                 write_log("請先在空棋盤上按下 '--- Save Empty Board ---' 按鈕來創建模板。")
+        elif self.headless:
+            write_log("headless 模式沒有網格校準，請以 'vision_system.py --headless --auto-calibrate' 建立校準檔。")
+        elif len(self.manual_points) == self._required_points():
+            write_log("所有校準點已點選。請按 '--- Save Grid Map ---' 按鈕保存網格地圖。")
         else:
-            if len(self.manual_points) == self.BOARD_DIM * 2:
-                write_log("所有校準點已點選。請按 '--- Save Grid Map ---' 按鈕保存網格地圖。")
-                self._draw_manual_points(processed_display_frame)
-            else:
-                write_log(f"請依序點擊 {len(self.manual_points)}/{self.BOARD_DIM*2} 個網格點以進行校準。")
-                self._draw_manual_points(processed_display_frame)
+            write_log(f"請依序點擊 {len(self.manual_points)}/{self._required_points()} 個網格點以進行校準。")
 
-        cv2.imshow('Vision System - Live Feed', processed_display_frame)
+        if self.show_preview:
+            self._show_preview(frame)
+        elif time.perf_counter() - self._last_metrics_time >= METRICS_LOG_INTERVAL:
+            self._log_metrics()
         return board_state
 
-    def _detect_stones(self, frame):
+    def metrics(self):
         """
-        在已校準的網格上偵測黑子和白子，使用背景相減法。
+        視覺指標：擷取與偵測統計，加上最近 METRICS_WINDOW 次偵測的耗時與
+        擷取到偵測完成的延遲 (ms)，以及目前穩定的棋子數與遮擋狀態。
         """
-        board_state = {}
-        if self.empty_board_template is None:
-            write_log("錯誤: 未載入空棋盤模板，無法進行棋子偵測。")
-            return {}
-        
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gray_template = cv2.cvtColor(self.empty_board_template, cv2.COLOR_BGR2GRAY)
-        
-        for row in range(self.BOARD_DIM):
-            for col in range(self.BOARD_DIM):
-                x, y = tuple(self.grid_map[row, col])
-                
-                roi_x_min = max(0, x - self.stone_detection_roi_radius)
-                roi_x_max = min(gray_frame.shape[1], x + self.stone_detection_roi_radius)
-                roi_y_min = max(0, y - self.stone_detection_roi_radius)
-                roi_y_max = min(gray_frame.shape[0], y + self.stone_detection_roi_radius)
-                
-                roi_frame = gray_frame[roi_y_min:roi_y_max, roi_x_min:roi_x_max]
-                roi_template = gray_template[roi_y_min:roi_y_max, roi_x_min:roi_x_max]
-
-                if roi_frame.size == 0 or roi_template.size == 0:
-                    continue
-
-                difference = np.mean(roi_frame) - np.mean(roi_template)
-
-                if difference < self.black_stone_diff:
-                    col_char = "ABCDEFGHJKLMNOPQRST"[col]
-                    row_num = row + 1
-                    board_state[f"{col_char}{row_num}"] = "B"
-                elif difference > self.white_stone_diff:
-                    col_char = "ABCDEFGHJKLMNOPQRST"[col]
-                    row_num = row + 1
-                    board_state[f"{col_char}{row_num}"] = "W"
-        
-        return board_state
+        metrics = {"capture": self.capture_stats(), "detection": self.detection_stats(),
+                   "occluded": self.occluded, "stones": int(np.count_nonzero(self.stable_board > EMPTY))}
+        for name, samples in (("detect_ms", self._detection_times_ms), ("latency_ms", self._detection_latencies_ms)):
+            ordered = sorted(samples)
+            metrics[name] = {"p50": ordered[len(ordered) // 2], "p95": ordered[int(len(ordered) * 0.95)]} if ordered else None
+        return metrics
 
-    def _draw_stone_detections(self, frame_to_draw, board_state):
-        for gtp_coord, stone_color in board_state.items():
-            row_char = gtp_coord[0]
-            row_num_str = gtp_coord[1:]
+    def _log_metrics(self):
+        """headless 模式下以一行日誌取代預覽畫面"""
+        now = time.perf_counter()
+        elapsed, self._last_metrics_time = now - self._last_metrics_time, now
+        metrics = self.metrics()
+        capture, detection = metrics["capture"], metrics["detection"]
+        detect_ms, latency_ms = metrics["detect_ms"], metrics["latency_ms"]
+        write_log(f"[Vision] 擷取 {capture['frames']} 幀 (丟棄 {capture['dropped']}，失敗 {capture['failures']})，"
+                  f"偵測 {detection['frames']} 幀 (跳過 {detection['skip_ratio']:.1%}，遮擋 {detection['occluded']})，"
+                  f"偵測耗時 p50 {detect_ms['p50'] if detect_ms else 0:.2f} ms，"
+                  f"擷取到偵測延遲 p50 {latency_ms['p50'] if latency_ms else 0:.1f} / "
+                  f"p95 {latency_ms['p95'] if latency_ms else 0:.1f} ms，"
+                  f"穩定棋子 {metrics['stones']} 顆{'，棋盤被遮擋' if metrics['occluded'] else ''} "
+                  f"(最近 {elapsed:.0f} 秒)。")
 
-            if row_char not in "ABCDEFGHJKLMNOPQRST": continue
-            if not row_num_str.isdigit(): continue
+    def _show_preview(self, frame):
+        cv2.imshow('Vision System - Live Feed', self._render_preview(frame))
 
-            row = int(row_num_str) - 1
-            col = "ABCDEFGHJKLMNOPQRST".index(row_char)
+    def _render_preview(self, frame):
+        """
+        在工作緩衝上合成預覽畫面。偵測已經完成，工作緩衝下一幀會被覆蓋，不需要複製整幀。
+        網格與棋子標記來自快取的圖層，每幀只需一次遮罩複製。
+        """
+        if self.grid_map is not None:
+            self._prepare_overlay(frame.shape)
+            self._update_stone_overlay(np.where(self.stable_board == UNSTABLE, EMPTY, self.stable_board))
+            cv2.copyTo(self._overlay, self._overlay_mask, frame)
+            if self.occluded:
+                cv2.putText(frame, "OCCLUDED", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA)
+        else:
+            self._draw_manual_points(frame)
+        return frame
 
-            p = tuple(self.grid_map[row, col])
-            
-            color_to_draw = (0, 0, 0) if stone_color == "B" else (255, 255, 255)
-            cv2.circle(frame_to_draw, p, self.stone_detection_roi_radius, (0, 255, 255), 2)
-            cv2.circle(frame_to_draw, p, self.stone_detection_roi_radius - 2, color_to_draw, -1)
-            cv2.putText(frame_to_draw, stone_color, (p[0] - 5, p[1] + 5), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2, cv2.LINE_AA)
+    def _prepare_overlay(self, frame_shape):
+        """校準 (grid_map)、畫面大小或 ROI 半徑改變時重新繪製網格圖層，棋子標記全部重畫"""
+        key = (self.grid_map, frame_shape, self.stone_detection_roi_radius)
+        cached = self._overlay_key
+        if cached is not None and cached[0] is key[0] and cached[1:] == key[1:]:
+            return
+        self._grid_layer = np.zeros(frame_shape, dtype=np.uint8)
+        self._draw_grid_map(self._grid_layer)
+        self._grid_layer_mask = cv2.threshold(cv2.cvtColor(self._grid_layer, cv2.COLOR_BGR2GRAY), 0, 255, cv2.THRESH_BINARY)[1]
+        self._overlay = self._grid_layer.copy()
+        self._overlay_mask = self._grid_layer_mask.copy()
+        self._overlay_board = np.zeros((self.BOARD_DIM, self.BOARD_DIM), dtype=np.int8)
+        self._overlay_key = key
+        write_log("已重新繪製預覽網格圖層。", DEBUG)
+
+    def _update_stone_overlay(self, board):
+        """只重繪棋子有變化的交叉點：先以網格圖層擦除，再畫上該點和被擦到的相鄰點的標記"""
+        changed = board != self._overlay_board
+        if not changed.any():
+            return
+        radius = self.stone_detection_roi_radius
+        half = radius + 3 # 標記外框 (半徑 + 線寬) 的範圍
+        height, width = self._overlay.shape[:2]
+        redraw = set()
+        for row, col in zip(*np.nonzero(changed)):
+            x, y = self.grid_map[row, col]
+            y0, y1, x0, x1 = max(0, y - half), min(height, y + half + 1), max(0, x - half), min(width, x + half + 1)
+            if y0 >= y1 or x0 >= x1:
+                continue
+            self._overlay[y0:y1, x0:x1] = self._grid_layer[y0:y1, x0:x1]
+            self._overlay_mask[y0:y1, x0:x1] = self._grid_layer_mask[y0:y1, x0:x1]
+            # 相鄰交叉點的標記可能被擦到一部分，一併重畫
+            redraw.update((r, c) for r in range(max(0, row - 1), min(self.BOARD_DIM, row + 2))
+                          for c in range(max(0, col - 1), min(self.BOARD_DIM, col + 2)))
+        for row, col in sorted(redraw):
+            if board[row, col] != EMPTY:
+                self._draw_stone_marker(self._overlay, tuple(int(v) for v in self.grid_map[row, col]),
+                                        STONE_NAMES[board[row, col]], self._overlay_mask)
+        self._overlay_board = board.copy()
+
+    def _prepare_roi_cache(self, frame_shape, grid):
+        """
+        網格地圖、模板或 ROI 半徑改變時，重新計算 ROI 邊界和模板的灰度平均 (grid 來自 _detection_view)。
+        校準檔中的模板資料仍然有效時直接使用，不讀取完整模板。返回 False 表示沒有可用的模板。
+        """
+        key = (grid, self._template_version, self.stone_detection_roi_radius, tuple(frame_shape[:2]))
+        cached = self._roi_cache_key
+        if cached is not None and cached[0] is grid and key[1:] == cached[1:]:
+            return True
+        stored = self._calibration_cache
+        template = None
+        if stored is None or stored[:3] != key[1:]:
+            template = self._detection_template()
+            if template is None:
+                write_log("錯誤: 沒有空棋盤模板，且校準檔的模板資料與目前的校準不符，請重新保存空棋盤模板。")
+                return False
+        # 只處理包含所有 ROI 的棋盤區域，ROI 邊界換算成區域內的座標
+        full_bounds = build_roi_bounds(grid, self.stone_detection_roi_radius, frame_shape)
+        y0, y1, x0, x1, area = full_bounds
+        valid = area > 0
+        if not valid.any():
+            valid = np.ones_like(valid) # 網格完全在畫面外：退回處理整個畫面
+            y0, y1, x0, x1 = np.zeros_like(y0), np.full_like(y1, frame_shape[0]), np.zeros_like(x0), np.full_like(x1, frame_shape[1])
+        crop_y0, crop_y1 = int(y0[valid].min()), int(y1[valid].max())
+        crop_x0, crop_x1 = int(x0[valid].min()), int(x1[valid].max())
+        self._board_crop = (crop_y0, crop_y1, crop_x0, crop_x1)
+        offset = np.array([crop_x0, crop_y0])
+        crop_shape = (crop_y1 - crop_y0, crop_x1 - crop_x0)
+        self._roi_bounds = build_roi_bounds(grid - offset, self.stone_detection_roi_radius, crop_shape)
+        small_shape = (-(-crop_shape[0] // GATE_DOWNSAMPLE), -(-crop_shape[1] // GATE_DOWNSAMPLE))
+        self._gate_bounds = build_roi_bounds((grid - offset) // GATE_DOWNSAMPLE,
+                                             max(1, int(self.stone_detection_roi_radius * GATE_NEIGHBORHOOD / GATE_DOWNSAMPLE)),
+                                             small_shape)
+        self._gate_size = (small_shape[1], small_shape[0]) # cv2.resize 的 (寬, 高)
+        self._gate_reference = None
+        self._last_raw_board = None
+        self._prepare_occlusion_cache(grid, template, offset, small_shape)
+
+        if template is None:
+            self._template_means = stored[3]
+            write_log("已使用校準檔中的模板灰度平均。", DEBUG)
+        else:
+            gray_template = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+            self._template_means = roi_means(gray_template, full_bounds)
+            write_log("已重新計算交叉點 ROI 邊界和模板灰度平均。", DEBUG)
+        self._roi_cache_key = key
+        self.reset_stability() # 舊的偵測歷史來自不同的校準，不能再用來投票
+        return True
+
+    def _prepare_occlusion_cache(self, grid, template, offset, small_shape):
+        """
+        預先計算遮擋偵測需要的資料：縮小的空棋盤模板，以及每個交叉點的棋子圓形範圍。
+        已知有棋子的範圍會從前景中排除，剩下的大區塊才是手或機械臂。
+        template 為 None 時使用校準檔中的縮小模板。
+        """
+        crop_y0, crop_y1, crop_x0, crop_x1 = self._board_crop
+        if template is None:
+            self._template_small = self._calibration_cache[4]
+        else:
+            self._template_small = cv2.resize(template[crop_y0:crop_y1, crop_x0:crop_x1], self._gate_size,
+                                              interpolation=cv2.INTER_NEAREST)
+        centers = (grid - offset) / GATE_DOWNSAMPLE
+        spacing = np.median(np.hypot(*np.diff(centers, axis=1).reshape(-1, 2).T)) # 相鄰交叉點的間距 (縮小後)
+        stone_radius = max(1, int(round(spacing * 0.55)))
+        self._stone_label = np.full(small_shape, -1, dtype=np.int32)
+        for index, (x, y) in enumerate(centers.reshape(-1, 2)):
+            cv2.circle(self._stone_label, (int(round(x)), int(round(y))), stone_radius, index, -1)
+        self._occlusion_min_area = OCCLUSION_MIN_STONES * np.pi * stone_radius ** 2
+        self._stone_mask_board = None
+        self.occlusion_mask.fill(False)
+        self.occluded = False
+
+    def _detect_occlusion(self, small):
+        """
+        以縮小影像與空棋盤模板比較，排除已知棋子的範圍後，尋找大於數顆棋子面積的前景區塊。
+        返回是否遮擋，並在 occlusion_mask 標記被前景覆蓋的交叉點。
+        """
+        if self._stone_mask_board is not self._last_raw_board:
+            # 分類結果改變時才重建「非棋子範圍」遮罩；索引 -1 (不在棋子範圍內) 對應最後的 True
+            not_stone = np.append(self._last_raw_board.ravel() == EMPTY, True)
+            self._not_stone_mask = not_stone[self._stone_label].astype(np.uint8) * 255
+            self._stone_mask_board = self._last_raw_board
+        difference = cv2.absdiff(small, self._template_small)
+        _, difference = cv2.threshold(difference, OCCLUSION_DIFF_THRESHOLD, 255, cv2.THRESH_BINARY)
+        foreground = cv2.max(cv2.max(difference[..., 0], difference[..., 1]), difference[..., 2]) # 任一色彩通道超過閾值
+        foreground = cv2.bitwise_and(foreground, self._not_stone_mask)
+        if cv2.countNonZero(foreground) < self._occlusion_min_area:
+            self.occlusion_mask.fill(False)
+            return False
+
+        foreground = cv2.morphologyEx(foreground, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(foreground, connectivity=8)
+        blobs = np.flatnonzero(stats[1:, cv2.CC_STAT_AREA] >= self._occlusion_min_area) + 1
+        if blobs.size == 0:
+            self.occlusion_mask.fill(False)
+            return False
+        is_blob = np.zeros(count, dtype=np.uint8)
+        is_blob[blobs] = 1
+        blob_pixels = is_blob[labels]
+        self.occlusion_mask[:] = np.nan_to_num(roi_means(blob_pixels, self._gate_bounds)) > 0
+        return True
+
+    def _classify_stones(self, frame, gated=False):
+        """
+        以積分影像一次計算 361 個 ROI 的平均灰度並與模板比較。
+        返回 (19, 19) 的 np.int8 陣列 (EMPTY / BLACK / WHITE)，[row, col] 對應 GTP 的 (col, row + 1)。
+        gated=True 時先比較縮小影像中每個交叉點鄰域與上次分類時的差異：
+        沒有任何變化就直接沿用上一次的結果，否則只更新有變化的交叉點。
+        畫面被手或機械臂遮擋時 (gated=True) 返回 None，這一幀不應參與穩定性投票。
+        """
+        image, grid = self._detection_view(frame)
+        if not self._prepare_roi_cache(image.shape, grid):
+            return None
+        crop_y0, crop_y1, crop_x0, crop_x1 = self._board_crop
+
+        changed = None
+        if gated:
+            self.detection_frames += 1
+            # 間隔取樣 (最近鄰縮小) 的小影像只有約 1/16 的像素，比完整分類便宜得多
+            small_color = cv2.resize(image[crop_y0:crop_y1, crop_x0:crop_x1], self._gate_size, interpolation=cv2.INTER_NEAREST)
+            if self._last_raw_board is not None:
+                was_occluded = self.occluded
+                self.occluded = self._detect_occlusion(small_color)
+                if self.occluded != was_occluded:
+                    write_log(f"偵測到棋盤被遮擋 ({np.count_nonzero(self.occlusion_mask)} 個交叉點)，暫停棋子分類。"
+                              if self.occluded else "遮擋已離開棋盤，恢復棋子分類。", DEBUG)
+                if self.occluded:
+                    self.occluded_frames += 1
+                    self._log_gate_stats()
+                    return None
+            small = cv2.cvtColor(small_color, cv2.COLOR_BGR2GRAY)
+            signature = roi_means(small, self._gate_bounds)
+            if self._gate_reference is not None and self._last_raw_board is not None:
+                changed = np.abs(signature - self._gate_reference) > GATE_THRESHOLD
+                if not changed.any():
+                    self.detection_skipped_frames += 1
+                    self._log_gate_stats()
+                    return self._last_raw_board
+                self._gate_reference[changed] = signature[changed]
+            else:
+                self._gate_reference = signature
+            self._log_gate_stats()
+
+        gray_board = cv2.cvtColor(image[crop_y0:crop_y1, crop_x0:crop_x1], cv2.COLOR_BGR2GRAY)
+        difference = roi_means(gray_board, self._roi_bounds) - self._template_means
+        board = np.zeros((self.BOARD_DIM, self.BOARD_DIM), dtype=np.int8)
+        board[difference > self.white_stone_diff] = WHITE
+        board[difference < self.black_stone_diff] = BLACK # 與舊版相同，黑子判斷優先
+        if gated:
+            if changed is not None:
+                # 沒有變化的交叉點沿用上一次的分類，避免閾值附近的雜訊造成跳動
+                board = np.where(changed, board, self._last_raw_board).astype(np.int8)
+                self.reclassified_points += int(np.count_nonzero(changed))
+            else:
+                self.reclassified_points += board.size
+            self._last_raw_board = board
+        return board
+
+    def _process_frame(self, frame):
+        """分類一幀並放入穩定性過濾；被遮擋的幀整幀略過，遮擋離開後需要的穩定幀數固定為 stability_frames"""
+        board = self._classify_stones(frame, gated=True)
+        if board is not None:
+            self._update_stability(board)
+        return board
+
+    def detection_stats(self):
+        """畫面變化閘門統計：偵測幀數、跳過分類的比例、被遮擋的幀數和平均每幀重新分類的交叉點數"""
+        frames = self.detection_frames
+        return {"frames": frames, "skipped": self.detection_skipped_frames, "occluded": self.occluded_frames,
+                "skip_ratio": self.detection_skipped_frames / frames if frames else 0.0,
+                "points_per_frame": self.reclassified_points / frames if frames else 0.0}
+
+    def _log_gate_stats(self):
+        if self.detection_frames % GATE_STATS_INTERVAL == 0:
+            stats = self.detection_stats()
+            write_log(f"畫面變化閘門：最近共 {stats['frames']} 幀，跳過分類 {stats['skip_ratio']:.1%}，"
+                      f"平均每幀重新分類 {stats['points_per_frame']:.1f} 個交叉點。", DEBUG)
+
+    def reset_stability(self):
+        self._history_index = 0
+        self._history_count = 0
+        self._votes.fill(0)
+        self.stable_board.fill(UNSTABLE)
+        self.stable_board_version += 1
+
+    def _window_size(self):
+        return min(max(int(self.stability_frames), 1), STABILITY_MAX_FRAMES)
+
+    def _recount_votes(self):
+        """穩定幀數改變時，從環形緩衝區中最近的幀重新計票 (不重新配置緩衝區)"""
+        window = min(self._window_size(), self._history_count)
+        recent = (self._history_index - 1 - np.arange(window)) % STABILITY_MAX_FRAMES
+        frames = self._history[recent]
+        for state in (EMPTY, BLACK, WHITE):
+            np.sum(frames == state, axis=0, out=self._votes[state])
+        self._update_stable_board()
+
+    def _update_stable_board(self):
+        window = self._window_size()
+        board = self._next_stable_board
+        board.fill(UNSTABLE)
+        if self._history_count >= window:
+            for state in (EMPTY, BLACK, WHITE):
+                board[self._votes[state] == window] = state
+        if not np.array_equal(board, self.stable_board):
+            self._next_stable_board, self.stable_board = self.stable_board, board
+            self.stable_board_version += 1
 
-    def detect_human_move(self, prev_board_state, current_board_state):
-        pass
+    def _update_stability(self, board):
+        """
+        把新的一幀偵測結果放入環形緩衝區並更新票數：
+        移出 stability_frames 幀之前的那一幀、加入新的一幀，每個交叉點只需常數次運算。
+        某狀態在最近 stability_frames 幀全部得票時，該交叉點才算穩定。
+        """
+        window = self._window_size()
+        if self._history_count >= window:
+            outgoing = self._history[(self._history_index - window) % STABILITY_MAX_FRAMES]
+            for state in (EMPTY, BLACK, WHITE):
+                self._votes[state] -= outgoing == state
+        for state in (EMPTY, BLACK, WHITE):
+            self._votes[state] += board == state
+        self._history[self._history_index] = board
+        self._history_index = (self._history_index + 1) % STABILITY_MAX_FRAMES
+        self._history_count = min(self._history_count + 1, STABILITY_MAX_FRAMES)
+        self._update_stable_board()
+        return self.stable_board
+
+    def _draw_stone_marker(self, frame_to_draw, p, stone_color, mask=None):
+        """畫出一顆棋子的標記；給定 mask 時在遮罩上畫出相同的圖形 (黑子的填色是 0，不能從圖層本身判斷)"""
+        color_to_draw = (0, 0, 0) if stone_color == "B" else (255, 255, 255)
+        for image, ring, fill, text in ((frame_to_draw, (0, 255, 255), color_to_draw, (0, 0, 255)),
+                                        (mask, 255, 255, 255)):
+            if image is None:
+                continue
+            cv2.circle(image, p, self.stone_detection_roi_radius, ring, 2)
+            cv2.circle(image, p, self.stone_detection_roi_radius - 2, fill, -1)
+            cv2.putText(image, stone_color, (p[0] - 5, p[1] + 5), 
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, text, 2, cv2.LINE_AA)
+
+    def detect_human_move(self, prev_board_state=None, current_board_state=None, color="B"):
+        """
+        比較穩定的偵測棋盤與最後確認的棋盤，找出人類新下的一顆棋子。
+        prev_board_state / current_board_state 可傳入 {'D4': 'B'} 字典取代 confirmed_board 和攝影機偵測結果。
+        返回 GTP 落子 (例如 "B D4")，預期被提掉的棋子放在 last_move_captures；
+        沒有變化、棋子尚未穩定或同時出現多處不合理變化時返回 None。
+        """
+        if current_board_state is None:
+            self.get_board_state()
+            if self.stable_board_version == self._diffed_version and prev_board_state is None:
+                return None # 穩定的棋盤沒有變化，不需要重新比較
+            self._diffed_version = self.stable_board_version
+            current = self.stable_board
+        else:
+            current = board_state_to_array(current_board_state, self.BOARD_DIM)
+        baseline = self.confirmed_board if prev_board_state is None else board_state_to_array(prev_board_state, self.BOARD_DIM)
+
+        # 已被提掉的棋子在實體棋盤上消失後就不再追蹤；仍在棋盤上的不算變化
+        pending = self._pending_removal != EMPTY
+        self._pending_removal[pending & (current == EMPTY)] = EMPTY
+        waiting_removal = pending & (current == self._pending_removal)
+        changed = (current != UNSTABLE) & ~waiting_removal & (current != baseline)
+        if not changed.any():
+            return None
+
+        added = changed & (baseline == EMPTY) & (current != EMPTY)
+        if np.count_nonzero(added) != 1:
+            write_log(f"忽略不穩定的棋盤變化：新增 {np.count_nonzero(added)} 顆棋子，"
+                      f"其他變化 {np.count_nonzero(changed & ~added)} 處。", DEBUG)
+            return None
+        row, col = np.argwhere(added)[0]
+        color_value = STONE_VALUES[color.upper()]
+        if current[row, col] != color_value:
+            write_log(f"忽略棋盤變化：{GTP_COLUMNS[col]}{row + 1} 出現的是 {STONE_NAMES[current[row, col]]} 子，"
+                      f"不是輪到的 {color.upper()}。", DEBUG)
+            return None
+
+        captures = find_captures(baseline, row, col, color_value)
+        allowed_removal = np.zeros_like(changed)
+        for r, c in captures:
+            allowed_removal[r, c] = current[r, c] == EMPTY
+        if (changed & ~added & ~allowed_removal).any():
+            write_log(f"忽略棋盤變化：除了 {GTP_COLUMNS[col]}{row + 1} 之外還有 "
+                      f"{np.count_nonzero(changed & ~added & ~allowed_removal)} 處不是提子造成的變化。", DEBUG)
+            return None
+
+        self.last_move_captures = [f"{GTP_COLUMNS[c]}{r + 1}" for r, c in captures]
+        return f"{color.upper()} {GTP_COLUMNS[col]}{row + 1}"
+
+    def apply_move(self, color, vertex):
+        """
+        落子被 KataGo 接受後更新 confirmed_board (包含提子)。
+        被提掉的棋子在實體棋盤上移除之前不會被視為變化。返回被提掉的棋子 (GTP 座標)。
+        """
+        self._diffed_version = None # 確認的棋盤已改變，下一次偵測需要重新比較
+        if vertex.lower() == "pass":
+            return []
+        row, col = gtp_to_index(vertex)
+        color_value = STONE_VALUES[color.upper()]
+        captures = find_captures(self.confirmed_board, row, col, color_value)
+        self.confirmed_board[row, col] = color_value
+        for r, c in captures:
+            self._pending_removal[r, c] = self.confirmed_board[r, c]
+            self.confirmed_board[r, c] = EMPTY
+        return [f"{GTP_COLUMNS[c]}{r + 1}" for r, c in captures]
+
+    def reset_game(self):
+        """新棋局：確認的棋盤清空"""
+        self.confirmed_board.fill(EMPTY)
+        self._pending_removal.fill(EMPTY)
+        self._diffed_version = None
+        self.last_move_captures = []
 
     def stop_camera(self):
+        if self._capture_thread:
+            self._capture_stop.set()
+            self._capture_thread.join(timeout=2)
+            self._capture_thread = None
+            stats = self.capture_stats()
+            write_log(f"影像擷取統計：共擷取 {stats['frames']} 幀，未被取用而丟棄 {stats['dropped']} 幀，"
+                      f"讀取失敗 {stats['failures']} 次。")
+            stats = self.detection_stats()
+            write_log(f"棋子偵測統計：共 {stats['frames']} 幀，畫面無變化跳過分類 {stats['skipped']} 幀 "
+                      f"({stats['skip_ratio']:.1%})，被遮擋略過 {stats['occluded']} 幀，平均每幀重新分類 {stats['points_per_frame']:.1f} 個交叉點。")
         if self.cap and self.cap.isOpened():
             self.cap.release()
-        cv2.destroyAllWindows() 
+        if not self.headless or self.show_preview:
+            cv2.destroyAllWindows() # 沒有 GUI 支援的 OpenCV (例如 opencv-python-headless) 呼叫會拋出例外
         write_log("視覺系統攝影機已停止。")
         
     def _draw_manual_points(self, frame_to_draw):
         for i, p in enumerate(self.manual_points):
             color = self.manual_point_colors[i % 2]
             cv2.circle(frame_to_draw, p, 10, color, -1)
-            if i < self.BOARD_DIM:
+            if self.manual_mode == "manual_corners":
+                text = f"C:{i+1}"
+            elif i < self.BOARD_DIM:
                 text = f"X:{i+1}"
             else:
                 text = f"Y:{i-self.BOARD_DIM+1}"
@@ -383,15 +1307,35 @@ class VisionSystem:
         return grid
         
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VisionSystem 單獨測試")
+    parser.add_argument("--headless", action="store_true", help="不建立任何視窗，以指標日誌取代預覽畫面 (按 Ctrl+C 結束)")
+    parser.add_argument("--camera", type=int, dest="camera_index")
+    parser.add_argument("--black-diff", type=int, dest="black_stone_diff")
+    parser.add_argument("--white-diff", type=int, dest="white_stone_diff")
+    parser.add_argument("--stability-frames", type=int, dest="stability_frames")
+    parser.add_argument("--roi-radius", type=int, dest="stone_detection_roi_radius")
+    parser.add_argument("--recalibration-interval", type=float, dest="auto_recalibration_interval")
+    parser.add_argument("--auto-calibrate", action="store_true", help="啟動後自動校準網格並保存校準檔")
+    parser.add_argument("--save-empty-board", action="store_true", help="啟動後以目前畫面保存空棋盤模板 (棋盤上不能有棋子)")
+    args = parser.parse_args()
+    overrides = {key: getattr(args, key) for key in PARAMETER_OVERRIDE_KEYS if getattr(args, key) is not None}
+
     vision_system = None
     try:
-        vision_system = VisionSystem()
+        vision_system = VisionSystem(headless=args.headless, parameter_overrides=overrides)
         if not vision_system.start_camera():
             write_log("視覺系統啟動失敗，無法進行單獨測試。")
             exit(1)
         write_log("\n✅ VisionSystem 單獨測試模式已啟動。")
+
+        if args.auto_calibrate or args.save_empty_board:
+            if args.auto_calibrate and vision_system.auto_calibrate() is None:
+                exit(1)
+            if args.save_empty_board and not vision_system.save_empty_board():
+                exit(1)
+            vision_system._save_parameters()
         
-        if vision_system.grid_map is None:
+        if vision_system.grid_map is None and not args.headless:
             write_log("---")
             write_log("未找到已保存的網格地圖。請點擊 'Live Feed' 視窗開始手動校準。")
             write_log("點擊順序：從左下角開始，沿著最底層水平線點擊19個點，然後再沿著最左側垂直線點擊19個點。")
@@ -399,14 +1343,19 @@ if __name__ == "__main__":
 
         while True:
             board_state = vision_system.get_board_state()
+            if args.headless:
+                vision_system.wait_for_new_frame(1.0)
+                continue
             key = cv2.waitKey(1) & 0xFF
             if key == ord('q'):
                 write_log("用戶手動退出 VisionSystem 單獨測試。")
                 break
             
+    except KeyboardInterrupt:
+        write_log("用戶手動退出 VisionSystem 單獨測試。")
     except Exception as e:
         write_log(f"\n🚨 VisionSystem 單獨測試發生錯誤：{e}")
     finally:
         if vision_system:
             vision_system.stop_camera()
-        write_log("VisionSystem 單獨測試程式結束。")
\ No newline at end of file
+        write_log("VisionSystem 單獨測試程式結束。")